@@ -47,7 +47,8 @@ class GreedyHungarianMatching(EmitterMatcher):
 
     """
 
-    def __init__(self, *, match_dims: int, dist_ax: float = None, dist_lat: float = None, dist_vol: float = None):
+    def __init__(self, *, match_dims: int, dist_ax: float = None, dist_lat: float = None, dist_vol: float = None,
+                 frames_per_chunk: int = 10000):
         """
 
         Args:
@@ -55,6 +56,8 @@ class GreedyHungarianMatching(EmitterMatcher):
             dist_lat: lateral tolerance radius
             dist_ax: axial tolerance threshold
             dist_vol: volumetric tolerance radius
+            frames_per_chunk: number of frames that are read at once from out-of-core EmitterSets
+                (e.g. decode.utils.emitter_io.LazyH5EmitterSet)
         """
         super().__init__()
 
@@ -62,6 +65,7 @@ class GreedyHungarianMatching(EmitterMatcher):
         self.dist_ax = dist_ax
         self.dist_lat = dist_lat
         self.dist_vol = dist_vol
+        self.frames_per_chunk = frames_per_chunk
 
         """Sanity checks"""
         if self.match_dims not in (2, 3):
@@ -202,10 +206,50 @@ class GreedyHungarianMatching(EmitterMatcher):
             frame_low = target.frame_ix.min()
             frame_high = target.frame_ix.max()
         else:
-            return (emitter.EmptyEmitterSet(xy_unit=target.xyz, px_size=target.px_size),) * 4
+            return (emitter.EmptyEmitterSet(xy_unit=target.xy_unit, px_size=target.px_size),) * 4
 
-        out_pframe = output.split_in_frames(frame_low.item(), frame_high.item())
-        tar_pframe = target.split_in_frames(frame_low.item(), frame_high.item())
+        frame_low, frame_high = int(frame_low), int(frame_high)
+
+        if isinstance(output, emitter.EmitterSet) and isinstance(target, emitter.EmitterSet):
+            tp, fp, fn, tp_match = self._forward_frames(output, target, frame_low, frame_high)
+
+        else:  # out-of-core sets are read and matched in chunks of frames
+            builders = [emitter.EmitterSetBuilder() for _ in range(4)]
+
+            for f in range(frame_low, frame_high + 1, self.frames_per_chunk):
+                f_end = min(f + self.frames_per_chunk - 1, frame_high)
+                matches = self._forward_frames(output.get_subset_frame(f, f_end), target.get_subset_frame(f, f_end),
+                                               f, f_end)
+
+                for b, em in zip(builders, matches):
+                    b.append(em)
+
+            tp, fp, fn, tp_match = [b.build() for b in builders]
+
+        """Let tp and tp_match share the same id's. IDs of ground truth are copied to true positives."""
+        if (tp_match.id == -1).all().item():
+            tp_match.id = torch.arange(len(tp_match)).type(tp_match.id.dtype)
+
+        tp.id = tp_match.id.type(tp.id.dtype)
+
+        return self._return_match(tp=tp, fp=fp, fn=fn, tp_match=tp_match)
+
+    def _forward_frames(self, output: emitter.EmitterSet, target: emitter.EmitterSet, frame_low: int,
+                        frame_high: int) -> tuple:
+        """
+        Matches the emitters frame by frame within the frame range.
+
+        Returns:
+            tp, fp, fn, tp_match
+
+        """
+        # sort and convert units once for the whole sets, the per frame views inherit the converted coordinates
+        output = output if output.frame_sorted else output.sort_by_frame()
+        target = target if target.frame_sorted else target.sort_by_frame()
+        _ = output.xyz_nm, target.xyz_nm
+
+        out_pframe = output.split_in_frames(frame_low, frame_high, view=True)  # read only
+        tar_pframe = target.split_in_frames(frame_low, frame_high, view=True)
 
         tpl, fpl, fnl, tpml = [], [], [], []  # true positive list, false positive list, false neg. ...
 
@@ -226,10 +270,4 @@ class GreedyHungarianMatching(EmitterMatcher):
         fn = emitter.EmitterSet.cat(fnl)
         tp_match = emitter.EmitterSet.cat(tpml)
 
-        """Let tp and tp_match share the same id's. IDs of ground truth are copied to true positives."""
-        if (tp_match.id == -1).all().item():
-            tp_match.id = torch.arange(len(tp_match)).type(tp_match.id.dtype)
-
-        tp.id = tp_match.id.type(tp.id.dtype)
-
-        return self._return_match(tp=tp, fp=fp, fn=fn, tp_match=tp_match)
+        return tp, fp, fn, tp_match
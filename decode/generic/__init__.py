@@ -1,3 +1,4 @@
 import decode.generic.emitter
 
-from decode.generic.emitter import EmitterSet, CoordinateOnlyEmitter, RandomEmitterSet, EmptyEmitterSet
+from decode.generic.emitter import EmitterSet, EmitterSetBuilder, CoordinateOnlyEmitter, RandomEmitterSet, \
+    EmptyEmitterSet
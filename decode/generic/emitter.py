@@ -1,4 +1,6 @@
+import contextlib
 import copy
+import functools
 import warnings
 from pathlib import Path
 from typing import Union, Optional, Iterable
@@ -7,7 +9,29 @@ import numpy as np
 import torch
 
 import decode.generic.utils
-from . import slicing as gutil, test_utils as tutil
+from . import slicing as gutil, spatial, test_utils as tutil
+
+_conversion_cache_collectors = []  # CacheStats of the active conversion_cache_stats contexts
+
+
+@contextlib.contextmanager
+def conversion_cache_stats():
+    """
+    Context in which hits and misses of the unit conversion cache of all EmitterSets (e.g. xyz_nm) are counted.
+
+    Example:
+        >>> with conversion_cache_stats() as stats:
+        >>>     matcher.forward(em_out, em_tar)
+        >>> stats.hit_rate
+
+    """
+    stats = decode.generic.utils.CacheStats()
+    _conversion_cache_collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _conversion_cache_collectors.remove(stats)
+
 
 
 class EmitterSet:
@@ -28,16 +52,25 @@ class EmitterSet:
             xy_unit: Unit of the x and y coordinate.
             px_size: Pixel size for unit conversion. If not specified, derived attributes (xyz_px and xyz_nm)
                 can not be accessed
+            dtype_profile: Data types of the attributes (see __init__).
     """
     _eq_precision = 1E-8
     _power_auto_conversion_attrs = {'xyz_cr': 2, 'xyz_sig': 1}
     _xy_units = ('px', 'nm')
+    _optional_attrs = ('xyz_cr', 'phot_cr', 'bg_cr', 'xyz_sig', 'phot_sig', 'bg_sig')  # None if absent
+    # data types deviating from the float type of xyz (resp. int64 for frame_ix and id)
+    _dtype_profiles = {
+        'default': {},
+        'compact': {'frame_ix': torch.int32, 'id': torch.int32, 'prob': torch.float16, 'bg_cr': torch.float16,
+                    'xyz_sig': torch.float16, 'phot_sig': torch.float16, 'bg_sig': torch.float16},
+    }
 
     def __init__(self, xyz: torch.Tensor, phot: torch.Tensor, frame_ix: torch.LongTensor,
                  id: torch.LongTensor = None, prob: torch.Tensor = None, bg: torch.Tensor = None,
                  xyz_cr: torch.Tensor = None, phot_cr: torch.Tensor = None, bg_cr: torch.Tensor = None,
                  xyz_sig: torch.Tensor = None, phot_sig: torch.Tensor = None, bg_sig: torch.Tensor = None,
-                 sanity_check: bool = True, xy_unit: str = None, px_size: Union[tuple, torch.Tensor] = None):
+                 sanity_check: bool = True, xy_unit: str = None, px_size: Union[tuple, torch.Tensor] = None,
+                 dtype_profile: str = 'default'):
         """
         Initialises EmitterSet of :math:`N` emitters.
 
@@ -58,6 +91,14 @@ class EmitterSet:
             xy_unit: Unit of the x and y coordinate.
             px_size: Pixel size for unit conversion. If not specified, derived attributes (xyz_px and xyz_nm)
                 may not be accessed because one can not convert units without pixel size.
+            dtype_profile: 'default' stores all floating point attributes in the type of xyz and frame_ix and id as
+                int64. 'compact' stores frame_ix and id as int32 and prob, bg_cr and the error estimates as float16
+                for archiving large sets. Note that compact frame indices can not be used for indexing directly.
+
+        Note:
+            Cramer-Rao values and error estimates that are not specified are not allocated. On first access, a NaN
+            column is allocated and stored. As long as it is not written to, it is still considered absent when the
+            EmitterSet is stored, concatenated or saved, i.e. it does not occupy memory or disk space there.
         """
 
         self.xyz = None
@@ -77,11 +118,19 @@ class EmitterSet:
         self.phot_sig = None
         self.bg_sig = None
 
+        if dtype_profile not in self._dtype_profiles:
+            raise ValueError(f"Unsupported dtype profile {dtype_profile}. Must be one of {self._dtype_profiles.keys()}.")
+        self.dtype_profile = dtype_profile
+
         self._set_typed(xyz=xyz, phot=phot, frame_ix=frame_ix, id=id, prob=prob, bg=bg,
                         xyz_cr=xyz_cr, phot_cr=phot_cr, bg_cr=bg_cr,
                         xyz_sig=xyz_sig, phot_sig=phot_sig, bg_sig=bg_sig)
 
-        self._sorted = False
+        self._frame_sorted_ref = None  # (frame_ix, version) for which frame sorting is known to hold
+        self._optional_alloc = {}  # attr -> (NaN column allocated on access, its version), absent while unmodified
+        self._conversion_cache = {}  # (attr, tar_unit) -> (source state, converted, version of converted)
+        self._spatial_index_cache = {}  # (unit, dims, per_frame) -> (coordinate state, index)
+
         # get at least one_dim tensors
         at_least_one_dim(self.xyz,
                          self.phot,
@@ -89,9 +138,9 @@ class EmitterSet:
                          self.id,
                          self.prob,
                          self.bg,
-                         self.xyz_cr,
-                         self.phot_cr,
-                         self.bg_cr)
+                         self._xyz_cr,
+                         self._phot_cr,
+                         self._bg_cr)
 
         self.xy_unit = xy_unit
         self.px_size = px_size
@@ -102,12 +151,177 @@ class EmitterSet:
         if sanity_check:
             self._sanity_check()
 
+    @property
+    def frame_sorted(self) -> bool:
+        """
+        Returns true if the emitters are known to be sorted by their frame index. The flag is bound to the frame index
+        tensor and its version counter, i.e. it is invalidated by re-assignment or in-place modification of frame_ix.
+        Sorted EmitterSets are sliced by binary search instead of boolean masking (see get_subset_frame and
+        split_in_frames).
+        """
+        if self._frame_sorted_ref is None:
+            return False
+
+        frame_ix, version = self._frame_sorted_ref
+        if frame_ix is self.frame_ix and version == self.frame_ix._version:
+            return True
+
+        self._frame_sorted_ref = None
+        return False
+
+    @property
+    def is_view(self) -> bool:
+        """
+        Returns true if the data of this EmitterSet shares its storage with another tensor, e.g. because it was obtained
+        by view(). In-place modifications of a view are visible in the parent.
+        """
+        return any(v._base is not None for v in self._data_stored().values() if v is not None)
+
+    def _mark_frame_sorted(self):
+        """Declare the current frame index as sorted. The caller must guarantee that this is actually the case."""
+        self._frame_sorted_ref = (self.frame_ix, self.frame_ix._version)
+
+    def _frame_offsets(self, frame_bounds) -> list:
+        """
+        CSR style offsets of frame bounds in a frame sorted EmitterSet, i.e. for frame_bounds (a, b) the emitters with
+        a <= frame_ix < b are self[offsets[0]:offsets[1]]. O(log N) per bound.
+
+        Args:
+            frame_bounds: ascending frame indices
+
+        """
+        if not self.frame_sorted:
+            raise ValueError("Frame offsets are only available for frame sorted EmitterSets.")
+
+        frame_bounds = torch.as_tensor(frame_bounds, dtype=self.frame_ix.dtype, device=self.frame_ix.device)
+        return torch.searchsorted(self.frame_ix, frame_bounds).tolist()
+
+    def spatial_index(self, per_frame: bool = True, dims: int = 3, unit: Optional[str] = None):
+        """
+        Returns a spatial index (KD-tree) over the coordinates of this EmitterSet for radius, box and nearest neighbour
+        queries (see decode.generic.spatial.SpatialIndex). The index is cached and rebuilt only if xyz, frame_ix,
+        xy_unit or px_size have been re-assigned or modified in-place since.
+
+        Args:
+            per_frame: index per frame (queries only see emitters on their frame) or global
+            dims: number of coordinates to index, e.g. 2 for lateral only queries
+            unit: unit of the indexed coordinates ('px' or 'nm'). None for the unit of the EmitterSet
+
+        Returns:
+            decode.generic.spatial.SpatialIndex
+
+        """
+        if unit not in (None, 'px', 'nm'):
+            raise ValueError(f"Unsupported unit {unit}.")
+
+        # keyed on the source coordinates and unit meta data, i.e. independent of the (cached) unit conversion
+        state = self._conversion_state('xyz') + (self.frame_ix, self.frame_ix._version)
+
+        key = (unit, dims, per_frame)
+        entry = self._spatial_index_cache.get(key)
+        if entry is not None and all(a is b if isinstance(a, torch.Tensor) else a == b
+                                     for a, b in zip(entry[0], state)):
+            return entry[1]
+
+        xyz = self.xyz if unit is None else self._pxnm_conversion_cached('xyz', tar_unit=unit, power=1.)
+        index = spatial.SpatialIndex(xyz, self.frame_ix if per_frame else None, dims=dims)
+        self._spatial_index_cache[key] = (state, index)
+
+        return index
+
+    @property
+    def xyz_cr(self) -> torch.Tensor:
+        return self._get_optional('xyz_cr')
+
+    @xyz_cr.setter
+    def xyz_cr(self, xyz_cr):
+        self._xyz_cr = xyz_cr
+
+    @property
+    def phot_cr(self) -> torch.Tensor:
+        return self._get_optional('phot_cr')
+
+    @phot_cr.setter
+    def phot_cr(self, phot_cr):
+        self._phot_cr = phot_cr
+
+    @property
+    def bg_cr(self) -> torch.Tensor:
+        return self._get_optional('bg_cr')
+
+    @bg_cr.setter
+    def bg_cr(self, bg_cr):
+        self._bg_cr = bg_cr
+
+    @property
+    def xyz_sig(self) -> torch.Tensor:
+        return self._get_optional('xyz_sig')
+
+    @xyz_sig.setter
+    def xyz_sig(self, xyz_sig):
+        self._xyz_sig = xyz_sig
+
+    @property
+    def phot_sig(self) -> torch.Tensor:
+        return self._get_optional('phot_sig')
+
+    @phot_sig.setter
+    def phot_sig(self, phot_sig):
+        self._phot_sig = phot_sig
+
+    @property
+    def bg_sig(self) -> torch.Tensor:
+        return self._get_optional('bg_sig')
+
+    @bg_sig.setter
+    def bg_sig(self, bg_sig):
+        self._bg_sig = bg_sig
+
+    def _get_optional(self, attr: str) -> torch.Tensor:
+        """Returns an optional attribute. If absent, a NaN column of size N is allocated and stored."""
+        v = getattr(self, '_' + attr)
+        if v is not None:
+            return v
+
+        size = (len(self), 3) if attr.startswith('xyz') else (len(self),)
+        v = torch.full(size, float('nan'), dtype=self._dtype(attr), device=self.xyz.device)
+        setattr(self, '_' + attr, v)
+        self._optional_alloc[attr] = (v, v._version)
+
+        return v
+
+    def _is_absent(self, attr: str) -> bool:
+        """Optional attribute is absent, i.e. not specified or only allocated on access and not written to since"""
+        v = getattr(self, '_' + attr)
+        if v is None:
+            return True
+
+        alloc = self._optional_alloc.get(attr)
+        return alloc is not None and alloc[0] is v and v._version == alloc[1]
+
+    def _dtype(self, attr: str) -> torch.dtype:
+        """Data type of an attribute in the current dtype profile"""
+        return self._dtype_profiles[self.dtype_profile].get(attr, self.xyz.dtype)
+
+    def to_dtype_profile(self, dtype_profile: str):
+        """
+        Returns a copy of this EmitterSet stored in the specified dtype profile.
+
+        Args:
+            dtype_profile: 'default' or 'compact'
+
+        """
+        em_dict = self.to_dict()
+        em_dict['dtype_profile'] = dtype_profile
+
+        return EmitterSet(**em_dict, sanity_check=False)
+
     @property
     def xyz_px(self) -> torch.Tensor:
         """
         Returns xyz in pixel coordinates and performs respective transformations if needed.
         """
-        return self._pxnm_conversion(self.xyz, in_unit=self.xy_unit, tar_unit='px', power=1.)
+        return self._pxnm_conversion_cached('xyz', tar_unit='px', power=1.)
 
     @xyz_px.setter
     def xyz_px(self, xyz):
@@ -119,7 +333,7 @@ class EmitterSet:
         """
         Returns xyz in nanometres and performs respective transformations if needed.
         """
-        return self._pxnm_conversion(self.xyz, in_unit=self.xy_unit, tar_unit='nm', power=1.)
+        return self._pxnm_conversion_cached('xyz', tar_unit='nm', power=1.)
 
     @xyz_nm.setter
     def xyz_nm(self, xyz):  # xyz in nanometres
@@ -146,11 +360,11 @@ class EmitterSet:
 
     @property
     def xyz_sig_tot_nm(self) -> torch.Tensor:
-        return (self.xyz_sig_nm ** 2).sum(1).sqrt()
+        return (self.xyz_sig_nm.type(self.xyz.dtype) ** 2).sum(1).sqrt()
 
     @property
     def xyz_sig_weighted_tot_nm(self) -> torch.Tensor:
-        return self._calc_sigma_weighted_total(self.xyz_sig_nm, self.dim() == 3)
+        return self._calc_sigma_weighted_total(self.xyz_sig_nm.type(self.xyz.dtype), self.dim() == 3)
 
     @property
     def phot_scr(self) -> torch.Tensor:  # sqrt cramer-rao of photon count
@@ -158,7 +372,7 @@ class EmitterSet:
 
     @property
     def bg_scr(self) -> torch.Tensor:  # sqrt cramer-rao of bg count
-        return self.bg_cr.sqrt()
+        return self.bg_cr.type(self.xyz.dtype).sqrt()
 
     def __getattr__(self, item):
         """Auto unit convert a couple of attributes by trailing unit specification"""
@@ -169,21 +383,22 @@ class EmitterSet:
             if tar_unit not in ('nm', 'px'):
                 raise NotImplementedError
 
-            return self._pxnm_conversion(
-                getattr(self, attr_base),
-                in_unit=self.xy_unit,
-                tar_unit=tar_unit,
-                power=self._power_auto_conversion_attrs[attr_base])
+            return self._pxnm_conversion_cached(attr_base, tar_unit=tar_unit,
+                                                power=self._power_auto_conversion_attrs[attr_base])
 
         raise AttributeError
 
     @property
     def meta(self) -> dict:
         """Return metadata of EmitterSet"""
-        return {
+        meta = {
             'xy_unit': self.xy_unit,
             'px_size': self.px_size
         }
+        if self.dtype_profile != 'default':  # only non-default, for compatibility of stored sets
+            meta['dtype_profile'] = self.dtype_profile
+
+        return meta
 
     @property
     def data(self) -> dict:
@@ -203,6 +418,13 @@ class EmitterSet:
             'bg_sig': self.bg_sig,
         }
 
+    def _data_stored(self) -> dict:
+        """Return intrinsic data as stored, i.e. absent optional attributes are None (they are not allocated)"""
+        data = {k: getattr(self, k) for k in ('xyz', 'phot', 'frame_ix', 'id', 'prob', 'bg')}
+        data.update({k: None if self._is_absent(k) else getattr(self, '_' + k) for k in self._optional_attrs})
+
+        return data
+
     def dim(self) -> int:
         """
         Returns dimensionality of coordinates. If z is 0 everywhere, it returns 2, else 3.
@@ -229,7 +451,7 @@ class EmitterSet:
         """
         em_dict = {}
         em_dict.update(self.meta)
-        em_dict.update(self.data)
+        em_dict.update(self._data_stored())
 
         return em_dict
 
@@ -247,22 +469,25 @@ class EmitterSet:
         if not isinstance(file, Path):
             file = Path(file)
 
+        # absent optional attributes are passed as None, i.e. they are not allocated for saving
         if file.suffix == '.pt':
-            emitter_io.save_torch(file, self.data, self.meta)
+            emitter_io.save_torch(file, self._data_stored(), self.meta)
         elif file.suffix in ('.h5', '.hdf5'):
-            emitter_io.save_h5(file, self.data, self.meta)
+            emitter_io.save_h5(file, self._data_stored(), self.meta)
         elif file.suffix == '.csv':
-            emitter_io.save_csv(file, self.data, self.meta)
+            emitter_io.save_csv(file, self._data_stored(), self.meta)
         else:
             raise ValueError
 
     @staticmethod
-    def load(file: Union[str, Path]):
+    def load(file: Union[str, Path], lazy: bool = False):
         """
         Loads the set of emitters which was saved by the 'save' method.
 
         Args:
             file: path to the emitterset
+            lazy: do not load the data but return an out-of-core set that reads it upon request (hdf5 files only,
+                see decode.utils.emitter_io.LazyH5EmitterSet)
 
         Returns:
             EmitterSet
@@ -272,6 +497,12 @@ class EmitterSet:
 
         file = Path(file) if not isinstance(file, Path) else file
 
+        if lazy:
+            if file.suffix not in ('.h5', '.hdf5'):
+                raise ValueError(f"Lazy loading is only supported for hdf5 files, not for {file.suffix}.")
+
+            return emitter_io.LazyH5EmitterSet(file)
+
         if file.suffix == '.pt':
             em_dict, meta, _ = emitter_io.load_torch(file)
         elif file.suffix in ('.h5', '.hdf5'):
@@ -303,7 +534,13 @@ class EmitterSet:
         if id is not None and (id.dtype not in (torch.int16, torch.int32, torch.int64)):
             raise ValueError(f"ID must be None or integer type not {id.dtype}.")
 
-        i_type = torch.int64
+        profile = self._dtype_profiles[self.dtype_profile]
+        i_type = profile.get('frame_ix', torch.int64)
+        id_type = profile.get('id', torch.int64)
+
+        def type_optional(attr, v):
+            """Absent optional attributes stay None"""
+            return v.type(profile.get(attr, f_type)) if v is not None else None
 
         # make xyz always 3 dim
         xyz = xyz if xyz.shape[1] == 3 else torch.cat((xyz, torch.zeros_like(xyz[:, [0]])), 1)
@@ -317,17 +554,11 @@ class EmitterSet:
             self.frame_ix = frame_ix.type(i_type)
 
             # Optionals
-            self.id = id if id is not None else -torch.ones_like(frame_ix)
-            self.prob = prob.type(f_type) if prob is not None else torch.ones_like(frame_ix).type(f_type)
-            self.bg = bg.type(f_type) if bg is not None else float('nan') * torch.ones_like(frame_ix).type(f_type)
-
-            self.xyz_cr = xyz_cr.type(f_type) if xyz_cr is not None else float('nan') * torch.ones_like(self.xyz)
-            self.phot_cr = phot_cr.type(f_type) if phot_cr is not None else float('nan') * torch.ones_like(self.phot)
-            self.bg_cr = bg_cr.type(f_type) if bg_cr is not None else float('nan') * torch.ones_like(self.bg)
-
-            self.xyz_sig = xyz_sig.type(f_type) if xyz_sig is not None else float('nan') * torch.ones_like(self.xyz)
-            self.phot_sig = phot_sig.type(f_type) if phot_sig is not None else float('nan') * torch.ones_like(self.phot)
-            self.bg_sig = bg_sig.type(f_type) if bg_sig is not None else float('nan') * torch.ones_like(self.bg)
+            self.id = id.type(id_type) if id is not None else -torch.ones_like(frame_ix, dtype=id_type)
+            self.prob = prob.type(profile.get('prob', f_type)) if prob is not None else \
+                torch.ones_like(frame_ix, dtype=profile.get('prob', f_type))
+            self.bg = bg.type(profile.get('bg', f_type)) if bg is not None else \
+                float('nan') * torch.ones_like(frame_ix, dtype=profile.get('bg', f_type))
 
         else:
             self.xyz = torch.zeros((0, 3)).type(f_type)
@@ -335,17 +566,19 @@ class EmitterSet:
             self.frame_ix = torch.zeros((0,)).type(i_type)
 
             # Optionals
-            self.id = -torch.ones((0,)).type(i_type)
-            self.prob = torch.ones((0,)).type(f_type)
-            self.bg = float('nan') * torch.ones_like(self.prob)
+            self.id = -torch.ones((0,)).type(id_type)
+            self.prob = torch.ones((0,)).type(profile.get('prob', f_type))
+            self.bg = float('nan') * torch.ones((0,)).type(profile.get('bg', f_type))
 
-            self.xyz_cr = float('nan') * torch.ones((0, 3)).type(f_type)
-            self.phot_cr = float('nan') * torch.ones_like(self.prob)
-            self.bg_cr = float('nan') * torch.ones_like(self.bg)
+            xyz_cr, phot_cr, bg_cr, xyz_sig, phot_sig, bg_sig = (None, ) * 6
 
-            self.xyz_sig = float('nan') * torch.ones((0, 3)).type(f_type)
-            self.phot_sig = float('nan') * torch.ones_like(self.prob)
-            self.bg_sig = float('nan') * torch.ones_like(self.bg)
+        self.xyz_cr = type_optional('xyz_cr', xyz_cr)
+        self.phot_cr = type_optional('phot_cr', phot_cr)
+        self.bg_cr = type_optional('bg_cr', bg_cr)
+
+        self.xyz_sig = type_optional('xyz_sig', xyz_sig)
+        self.phot_sig = type_optional('phot_sig', phot_sig)
+        self.bg_sig = type_optional('bg_sig', bg_sig)
 
     def _inplace_replace(self, em):
         """
@@ -367,8 +600,10 @@ class EmitterSet:
         Returns:
             (bool) sane or not sane
         """
+        # optional attributes as stored, i.e. absent ones are not allocated for the check
+        optional = [getattr(self, '_' + k) for k in self._optional_attrs]
         if not same_shape_tensor(0, self.xyz, self.phot, self.frame_ix, self.id, self.bg,
-                                 self.xyz_cr, self.phot_cr, self.bg_cr):
+                                 *[v for v in optional if v is not None]):
             raise ValueError("Coordinates, photons, frame ix, id and prob are not of equal shape in 0th dimension.")
 
         if not same_dim_tensor(torch.ones(1), self.phot, self.prob, self.frame_ix, self.id):
@@ -500,7 +735,8 @@ class EmitterSet:
 
     def __getitem__(self, item):
         """
-        Implements array indexing for this class.
+        Implements array indexing for this class. The returned EmitterSet holds a copy of the data (see view for a
+        storage sharing subset).
 
         Args:
             item: (int), or indexing
@@ -520,13 +756,25 @@ class EmitterSet:
 
     def clone(self):
         """
-        Returns a deep copy of this EmitterSet.
+        Returns a deep copy of this EmitterSet. The copy of a view only holds the data of the view.
 
         Returns:
             EmitterSet
 
         """
-        return copy.deepcopy(self)
+        # clone the data tensors instead of deep copying them, since a deepcopy of a view copies the storage of the base
+        memo = {id(v): v.clone() for v in self._data_stored().values() if v is not None}
+        memo.update({id(getattr(self, '_' + k)): None for k in self._optional_attrs if self._is_absent(k)})
+        memo[id(self._optional_alloc)] = {}
+        memo[id(self._conversion_cache)] = {}
+        memo[id(self._spatial_index_cache)] = {}
+        em = copy.deepcopy(self, memo)
+
+        em._frame_sorted_ref = None
+        if self.frame_sorted:
+            em._mark_frame_sorted()
+
+        return em
 
     def _calc_sigma_weighted_total(self, xyz_sigma_nm, use_3d):
 
@@ -556,13 +804,18 @@ class EmitterSet:
 
         """
 
+        emittersets = list(emittersets)
+        if len(emittersets) == 0:
+            raise ValueError("No EmitterSets to concatenate.")
+
         meta = []
         data = []
         for em in emittersets:
             meta.append(em.meta)
-            data.append(em.data)
+            data.append(em._data_stored())
 
         n_chunks = len(data)
+        n_per_chunk = torch.tensor([len(em) for em in emittersets])
 
         if remap_frame_ix is not None and step_frame_ix is not None:
             raise ValueError("You cannot specify remap frame ix and step frame ix at the same time.")
@@ -573,13 +826,23 @@ class EmitterSet:
         else:
             shift = torch.zeros(n_chunks).int()
 
-        # apply shift
-        for d, s in zip(data, shift):
-            d['frame_ix'] = d['frame_ix'] + s
+        # concatenating frame sorted sets with ascending (shifted) frame ranges results in a frame sorted set
+        cat_sorted = _cat_is_frame_sorted(emittersets, shift)
 
-        # list of dicts to dict of lists
-        data = {k: torch.cat([x[k] for x in data], 0) for k in data[0]}
-        # meta = {k: [x[k] for x in meta] for k in meta[0]}
+        """Write all chunks into preallocated columns (one pass per attribute, no intermediate copies)"""
+        data_cat = {}
+        for k in data[0]:
+            if all(x[k] is None for x in data):  # absent optional attributes stay absent
+                data_cat[k] = None
+                continue
+
+            data_cat[k] = _cat_preallocated([x[k] if x[k] is not None else getattr(em, k)
+                                             for x, em in zip(data, emittersets)], int(n_per_chunk.sum()))
+        data = data_cat
+
+        # apply shift in place
+        if (shift != 0).any():
+            data['frame_ix'] += torch.repeat_interleave(shift.to(data['frame_ix']), n_per_chunk.to(shift.device))
 
         # px_size and xy unit is taken from the first element that is not None
         xy_unit = None
@@ -594,7 +857,14 @@ class EmitterSet:
                 px_size = m['px_size']
                 break
 
-        return EmitterSet(xy_unit=xy_unit, px_size=px_size, **data)
+        # dtype profile is taken from the first element
+        dtype_profile = meta[0].get('dtype_profile', 'default')
+
+        em = EmitterSet(xy_unit=xy_unit, px_size=px_size, dtype_profile=dtype_profile, **data)
+        if cat_sorted:
+            em._mark_frame_sorted()
+
+        return em
 
     def sort_by_frame_(self):
         """
@@ -603,6 +873,7 @@ class EmitterSet:
         """
         em = self.sort_by_frame()
         self._inplace_replace(em)
+        self._mark_frame_sorted()
 
     def sort_by_frame(self):
         """
@@ -612,9 +883,14 @@ class EmitterSet:
             Sorted copy of this emitterset
 
         """
+        if self.frame_sorted:
+            em = self.clone()
+            em._mark_frame_sorted()
+            return em
+
         _, ix = self.frame_ix.sort()
         em = self[ix]
-        em._sorted = True
+        em._mark_frame_sorted()
 
         return em
 
@@ -628,21 +904,78 @@ class EmitterSet:
             (EmitterSet)
         """
         if isinstance(ix, int):
-            ix = [ix]
+            if not -len(self) <= ix < len(self):
+                raise IndexError(f"Index {ix} out of bounds of EmitterSet of size {len(self)}")
+
+            ix = ix if ix >= 0 else ix + len(self)
+            ix = slice(ix, ix + 1)
+
+        if isinstance(ix, slice):
+            return self._get_view(ix).clone()
 
         # PyTorch single element support
-        if not isinstance(ix, torch.BoolTensor) and isinstance(ix, torch.Tensor) and ix.numel() == 1:
+        if isinstance(ix, torch.Tensor) and ix.dtype != torch.bool and ix.numel() == 1:
             ix = [int(ix)]
 
         # Todo: Check for numpy boolean array
         if isinstance(ix, (np.ndarray, np.generic)) and ix.size == 1:  # numpy support
             ix = [int(ix)]
 
-        return EmitterSet(xyz=self.xyz[ix], phot=self.phot[ix], frame_ix=self.frame_ix[ix], id=self.id[ix],
-                          prob=self.prob[ix], bg=self.bg[ix],
-                          xyz_sig=self.xyz_sig[ix], phot_sig=self.phot_sig[ix], bg_sig=self.bg_sig[ix],
-                          xyz_cr=self.xyz_cr[ix], phot_cr=self.phot_cr[ix], bg_cr=self.bg_cr[ix],
-                          sanity_check=False, xy_unit=self.xy_unit, px_size=self.px_size)
+        data = {k: v[ix] if v is not None else None for k, v in self._data_stored().items()}
+        return EmitterSet(**data, **self.meta, sanity_check=False)
+
+    def view(self, ix: slice):
+        """
+        Returns a subset of emitters by slice that shares the storage of its data with this instance, i.e. no data is
+        copied (see is_view). In-place modifications of the view alter this instance as well, hence views are meant
+        for read only access, e.g. when iterating over frames.
+
+        Args:
+            ix: slice
+
+        Returns:
+            (EmitterSet)
+        """
+        if not isinstance(ix, slice):
+            raise TypeError(f"Views are only supported for slices, not for {type(ix)}.")
+
+        return self._get_view(ix)
+
+    def _get_view(self, ix: slice):
+        """
+        Returns a subset of emitters by slice whose data tensors are views on the tensors of this instance, i.e. no data
+        is copied. Type conversion and default values of the constructor are skipped, since the data is already typed.
+
+        Args:
+            ix: slice
+
+        Returns:
+            (EmitterSet)
+        """
+        em = EmitterSet.__new__(EmitterSet)
+        for k, v in self._data_stored().items():
+            setattr(em, k, v[ix] if v is not None else None)
+
+        em.xy_unit = self.xy_unit
+        em.px_size = self.px_size
+        em.dtype_profile = self.dtype_profile
+        em._frame_sorted_ref = None
+        em._optional_alloc = {}
+        em._conversion_cache = {}
+        em._spatial_index_cache = {}
+
+        # slices (with positive step) of a frame sorted set are frame sorted
+        if self.frame_sorted:
+            em._mark_frame_sorted()
+
+        # valid unit conversions are inherited as views as well
+        for key in list(self._conversion_cache.keys()):
+            out = self._get_cached_conversion(key)
+            if out is not None:
+                out = out[ix]
+                em._conversion_cache[key] = (em._conversion_state(key[0]), out, out._version)
+
+        return em
 
     def get_subset_frame(self, frame_start, frame_end, frame_ix_shift=None):
         """
@@ -657,13 +990,19 @@ class EmitterSet:
 
         """
 
-        ix = (self.frame_ix >= frame_start) * (self.frame_ix <= frame_end)
-        em = self[ix]
+        if self.frame_sorted:
+            ix_start, ix_end = self._frame_offsets((frame_start, frame_end + 1))
+            em = self[ix_start:ix_end]
+        else:
+            ix = (self.frame_ix >= frame_start) * (self.frame_ix <= frame_end)
+            em = self[ix]
 
         if not frame_ix_shift:
             return em
         elif len(em) != 0:  # only shift if there is actually something
-            em.frame_ix += frame_ix_shift
+            em.frame_ix = em.frame_ix + frame_ix_shift
+            if self.frame_sorted:
+                em._mark_frame_sorted()
 
         return em
 
@@ -676,6 +1015,9 @@ class EmitterSet:
             bool
 
         """
+        if self.frame_sorted:
+            return len(self) >= 1 and bool(self.frame_ix[0] == self.frame_ix[-1])
+
         return True if torch.unique(self.frame_ix).shape[0] == 1 else False
 
     def chunks(self, chunks: int):
@@ -715,23 +1057,34 @@ class EmitterSet:
         if fraction == 1.:
             return self
 
-        xyz_sig = self.xyz_sig
-
-        x_sig_var = torch.var(xyz_sig[:, 0])
-        y_sig_var = torch.var(xyz_sig[:, 1])
-        z_sig_var = torch.var(xyz_sig[:, 2])
-        tot_var = xyz_sig[:, 0] ** 2 + (torch.sqrt(x_sig_var / y_sig_var) * xyz_sig[:, 1]) ** 2
+        xyz_sig = self.xyz_sig.type(self.xyz.dtype)
+        tot_var = self._sigma_tot_var(xyz_sig, torch.var(xyz_sig, 0), is_3d)
 
-        if is_3d:
-            tot_var += (np.sqrt(x_sig_var / z_sig_var) * xyz_sig[:, 2]) ** 2
-
-        max_s = np.percentile(tot_var.cpu().numpy(), fraction * 100.)
+        # threshold and mask stay on the device of the data
+        max_s = decode.generic.utils.quantile(tot_var, fraction)
         if return_low:
-            filt_sig = torch.where(tot_var < max_s)
+            return self[tot_var < max_s]
         else:
-            filt_sig = torch.where(tot_var > max_s)
+            return self[tot_var > max_s]
+
+    @staticmethod
+    def _sigma_tot_var(xyz_sig: torch.Tensor, sig_var: torch.Tensor, is_3d: bool) -> torch.Tensor:
+        """
+        Total variance of the error estimates as used by filter_by_sigma. y (and z) are rescaled by the ratio of the
+        variance of the x error to the variance of their error.
+
+        Args:
+            xyz_sig: error estimates of size N x 3
+            sig_var: variance of the error estimates (over all emitters) of size 3
+            is_3d: take z into account
+
+        """
+        tot_var = xyz_sig[:, 0] ** 2 + (torch.sqrt(sig_var[0] / sig_var[1]) * xyz_sig[:, 1]) ** 2
+
+        if is_3d:
+            tot_var += (torch.sqrt(sig_var[0] / sig_var[2]) * xyz_sig[:, 2]) ** 2
 
-        return self[filt_sig]
+        return tot_var
 
     def hist_detection(self) -> dict():
         """
@@ -746,13 +1099,14 @@ class EmitterSet:
             'sigma_z': np.histogram(self.xyz_sig[:, 2]),
         }
 
-    def split_in_frames(self, ix_low: int = 0, ix_up: int = None) -> list:
+    def split_in_frames(self, ix_low: int = 0, ix_up: int = None, view: bool = False) -> list:
         """
         Splits a set of emitters in a list of emittersets based on their respective frame index.
 
         Args:
             ix_low: (int, 0) lower bound
             ix_up: (int, None) upper bound
+            view: return storage sharing views instead of copies (see view), for read only access
 
         Returns:
             list
@@ -763,7 +1117,171 @@ class EmitterSet:
         ix_low = ix_low if ix_low is not None else self.frame_ix.min().item()
         ix_up = ix_up if ix_up is not None else self.frame_ix.max().item()
 
-        return gutil.split_sliceable(x=self, x_ix=self.frame_ix, ix_low=ix_low, ix_high=ix_up)
+        em = self if self.frame_sorted else self.sort_by_frame()
+        if not view:
+            return gutil.split_sliceable(x=em, x_ix=em.frame_ix, ix_low=ix_low, ix_high=ix_up, presorted=True)
+
+        offsets = em._frame_offsets(range(ix_low, ix_up + 2))
+        return [em.view(slice(start, stop)) for start, stop in zip(offsets[:-1], offsets[1:])]
+
+    def _segments_by_id(self, frame_gap: Optional[int] = None) -> tuple:
+        """
+        Sorts the emitters by id and frame (stable) and splits them in segments of equal id. If frame_gap is specified,
+        a segment is additionally split where the frame index increases by more than frame_gap.
+
+        Returns:
+            ix: sort order
+            seg: segment index of the sorted emitters
+            counts: number of emitters per segment
+        """
+        ix = torch.from_numpy(np.lexsort((self.frame_ix.cpu().numpy(), self.id.cpu().numpy()))).to(self.xyz.device)
+        id_sorted = self.id[ix]
+
+        start = torch.ones(len(self), dtype=torch.bool, device=self.xyz.device)
+        start[1:] = id_sorted[1:] != id_sorted[:-1]
+        if frame_gap is not None:
+            frame_sorted = self.frame_ix[ix]
+            start[1:] |= (frame_sorted[1:] - frame_sorted[:-1]) > frame_gap
+
+        seg = start.long().cumsum(0) - 1
+        counts = torch.bincount(seg)
+
+        return ix, seg, counts
+
+    def _reduce_segments(self, ix: torch.Tensor, seg: torch.Tensor, counts: torch.Tensor) -> dict:
+        """Segment reductions (see reduce_by_id) of the emitters sorted by ix and split in segments seg"""
+        n_seg = len(counts)
+        f_type = self.xyz.dtype
+        last = counts.cumsum(0) - 1
+        first = last - counts + 1
+
+        def seg_sum(v):
+            return torch.zeros((n_seg, *v.size()[1:]), dtype=v.dtype, device=v.device).index_add_(0, seg, v)
+
+        xyz, phot = self.xyz[ix], self.phot[ix].type(f_type)
+        xyz_sum = seg_sum(xyz)
+        phot_sum = seg_sum(phot)
+        xyz_weighted = seg_sum(xyz * phot.unsqueeze(1)) / phot_sum.unsqueeze(1)
+        # segments without photons fall back to the plain mean
+        xyz_mean = xyz_sum / counts.unsqueeze(1).type(f_type)
+        xyz_weighted = torch.where(phot_sum.unsqueeze(1) != 0, xyz_weighted, xyz_mean)
+
+        return {
+            'id': self.id[ix][first],
+            'on_time': counts,
+            'phot': phot_sum,
+            'xyz': xyz_mean,
+            'xyz_weighted': xyz_weighted,
+            'prob': seg_sum(self.prob[ix].type(f_type)) / counts.type(f_type),
+            'bg': seg_sum(self.bg[ix].type(f_type)) / counts.type(f_type),
+            'frame_min': self.frame_ix[ix][first],
+            'frame_max': self.frame_ix[ix][last],
+        }
+
+    def reduce_by_id(self) -> dict:
+        """
+        Aggregates the emitters per identity, e.g. per fluorophore of a blinking simulation. All reductions are
+        vectorised segment sums over a single sort by id.
+
+        Returns:
+            dict of tensors with one entry per unique id (ascending):
+                id: identity
+                on_time: number of emitters (i.e. frames on) of the id
+                phot: summed photon count
+                xyz: mean position
+                xyz_weighted: photon weighted mean position
+                prob: mean probability
+                bg: mean background
+                frame_min: first frame
+                frame_max: last frame
+
+        """
+        if len(self) == 0:
+            return self._reduce_segments(*(torch.zeros(0, dtype=torch.long, device=self.xyz.device),) * 3)
+
+        return self._reduce_segments(*self._segments_by_id())
+
+    def merge_consecutive(self, frame_gap: int = 1):
+        """
+        Merges emitters of the same id on consecutive frames (e.g. the localisations of one blinking event) into a
+        single emitter with photon weighted mean position, summed photon count, mean probability and background and
+        the first frame as frame index. Absent and error attributes (crlb, sigma) are not propagated.
+
+        Args:
+            frame_gap: maximum frame difference of successive emitters of a merged event, i.e. 1 merges emitters on
+                directly consecutive frames only
+
+        Returns:
+            EmitterSet (sorted by frame and id)
+
+        """
+        if frame_gap < 0:
+            raise ValueError("Frame gap must not be negative.")
+
+        if len(self) == 0:
+            return EmitterSet(**self.to_dict(), sanity_check=False)
+
+        red = self._reduce_segments(*self._segments_by_id(frame_gap=frame_gap))
+
+        # stable sort, i.e. the merged emitters are sorted by frame and by id within a frame
+        ix = torch.from_numpy(np.argsort(red['frame_min'].cpu().numpy(), kind='stable')).to(self.xyz.device)
+        em = EmitterSet(xyz=red['xyz_weighted'][ix], phot=red['phot'][ix], frame_ix=red['frame_min'][ix],
+                        id=red['id'][ix], prob=red['prob'][ix], bg=red['bg'][ix], sanity_check=False, **self.meta)
+        em._mark_frame_sorted()
+
+        return em
+
+    def _conversion_state(self, attr: str) -> tuple:
+        """State on which a unit conversion of attr depends"""
+        src = getattr(self, attr)
+        px_size_version = self.px_size._version if self.px_size is not None else None
+
+        return src, src._version, self.xy_unit, self.px_size, px_size_version
+
+    def _get_cached_conversion(self, key: tuple) -> Optional[torch.Tensor]:
+        """
+        Returns the cached unit conversion if neither the source attribute, xy_unit nor px_size have been re-assigned
+        or modified in-place since and the cached tensor itself has not been modified in-place. Otherwise None.
+        """
+        entry = self._conversion_cache.get(key)
+        if entry is None:
+            return None
+
+        state, out, out_version = entry
+        state_now = self._conversion_state(key[0])
+        # tensors are compared by identity (their content is covered by the version counters)
+        if out._version != out_version or not all(a is b if isinstance(a, torch.Tensor) else a == b
+                                                  for a, b in zip(state, state_now)):
+            del self._conversion_cache[key]
+            return None
+
+        return out
+
+    def _pxnm_conversion_cached(self, attr: str, tar_unit: str, power: float) -> torch.Tensor:
+        """
+        Converts an attribute to the target unit (see _pxnm_conversion). The result is cached until the attribute,
+        xy_unit or px_size change, so repeated accesses of e.g. xyz_nm do not recompute the conversion. Cache hits
+        return the cached tensor itself, i.e. results of repeated accesses alias each other and must not be modified
+        in-place (doing so invalidates the cache entry, but alters the previously returned results).
+
+        """
+        if self.xy_unit is None or self.xy_unit == tar_unit:  # no conversion to cache
+            return self._pxnm_conversion(getattr(self, attr), in_unit=self.xy_unit, tar_unit=tar_unit, power=power)
+
+        key = (attr, tar_unit)
+        out = self._get_cached_conversion(key)
+        if out is not None:
+            for stats in _conversion_cache_collectors:
+                stats.hit()
+            return out
+
+        for stats in _conversion_cache_collectors:
+            stats.miss()
+        state = self._conversion_state(attr)
+        out = self._pxnm_conversion(state[0], in_unit=self.xy_unit, tar_unit=tar_unit, power=power)
+        self._conversion_cache[key] = (state, out, out._version)
+
+        return out
 
     def _pxnm_conversion(self, xyz, in_unit, tar_unit, power: float = 1.):
 
@@ -822,22 +1340,158 @@ class EmitterSet:
 
     def populate_crlb(self, psf, **kwargs):
         """
-        Populate the CRLB values by the PSF function.
+        Populate the CRLB values by the PSF function. The bound is computed chunk wise (if implemented by the PSF) and
+        written into one preallocated buffer whose columns become xyz_cr, phot_cr and bg_cr.
 
         Args:
             psf (PSF): Point Spread function with CRLB implementation
-            **kwargs: additional arguments to be parsed to the CRLB method
+            **kwargs: additional arguments to be parsed to the CRLB method (crlb_chunked)
 
         Returns:
 
         """
 
-        crlb, _ = psf.crlb(self.xyz, self.phot, self.bg, **kwargs)
+        out = torch.empty((len(self), 5), device=self.xyz.device, dtype=self.xyz.dtype)
+        crlb = psf.crlb_chunked(self.xyz, self.phot, self.bg, out=out, **kwargs)
         self.xyz_cr = crlb[:, :3]
         self.phot_cr = crlb[:, 3]
         self.bg_cr = crlb[:, 4]
 
 
+class EmitterSetBuilder:
+    """
+    Incrementally concatenates EmitterSets, e.g. from a streaming producer, into preallocated columns that grow by a
+    constant factor (amortised constant cost per emitter). Use EmitterSet.cat if all sets are available at once.
+
+    Example:
+        >>> builder = EmitterSetBuilder()
+        >>> for i, em in enumerate(ems):  # any iterable of EmitterSets
+        >>>     builder.append(em, frame_ix_shift=i * batch_size)
+        >>> em_all = builder.build()
+
+    """
+
+    def __init__(self, capacity: int = 0, growth: float = 2.):
+        """
+
+        Args:
+            capacity: number of emitters to preallocate
+            growth: factor by which the capacity is increased when exceeded
+
+        """
+        if growth <= 1.:
+            raise ValueError(f"Growth factor must be larger than 1 but is {growth}.")
+
+        self.growth = growth
+
+        self._capacity = capacity
+        self._n = 0
+        self._data = None  # preallocated columns, allocated upon first append
+        self._xy_unit = None
+        self._px_size = None
+        self._dtype_profile = None
+        self._frame_sorted = True
+        self._frame_last = None
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _reserve(self, data: dict, n_add: int):
+        """
+        Make sure that n_add more emitters fit into the columns and that their dtype can hold the data. Optional
+        attributes are allocated once the first set that holds them is appended, the rows of the previous sets are NaN
+        filled.
+        """
+        n_req = self._n + n_add
+        capacity = self._capacity if n_req <= self._capacity else max(n_req, int(self._capacity * self.growth))
+        data_prev = self._data if self._data is not None else dict.fromkeys(data)
+
+        data_new = {}
+        for k, v in data.items():
+            col = data_prev[k]
+            ref = col if col is not None else v
+            if ref is None:  # absent so far
+                data_new[k] = None
+                continue
+
+            dtype = ref.dtype if v is None else torch.promote_types(ref.dtype, v.dtype)
+            if col is not None and capacity == self._capacity and dtype == col.dtype:
+                data_new[k] = col
+            elif col is not None:
+                data_new[k] = torch.empty((capacity, *col.shape[1:]), dtype=dtype, device=col.device)
+                data_new[k][:self._n] = col[:self._n]
+            else:
+                data_new[k] = torch.empty((capacity, *v.shape[1:]), dtype=dtype, device=v.device)
+                if dtype.is_floating_point:  # optional attribute that was absent in the previous sets
+                    data_new[k][:self._n] = float('nan')
+
+        self._data = data_new
+        self._capacity = capacity
+
+    def append(self, em: EmitterSet, frame_ix_shift: int = 0):
+        """
+        Append an EmitterSet. Its data is copied, i.e. em may be modified afterwards.
+
+        Args:
+            em: EmitterSet to append
+            frame_ix_shift: shift that is added to the frame index of em
+
+        """
+        # px_size and xy unit is taken from the first element that is not None, dtype profile from the first one
+        if self._xy_unit is None:
+            self._xy_unit = em.xy_unit
+        if self._px_size is None:
+            self._px_size = em.px_size
+        if self._dtype_profile is None:
+            self._dtype_profile = em.dtype_profile
+
+        n = len(em)
+        frame_ix_shift = int(frame_ix_shift)
+        data = em._data_stored()
+        self._reserve(data, n)
+
+        if n == 0:
+            return
+
+        if self._frame_sorted:
+            if not em.frame_sorted or \
+                    (self._frame_last is not None and em.frame_ix[0].item() + frame_ix_shift < self._frame_last):
+                self._frame_sorted = False
+            else:
+                self._frame_last = em.frame_ix[-1].item() + frame_ix_shift
+
+        ix = slice(self._n, self._n + n)
+        for k, v in data.items():
+            if self._data[k] is None:
+                continue
+
+            if v is not None:
+                self._data[k][ix] = v
+            else:
+                self._data[k][ix] = float('nan')
+
+        if frame_ix_shift != 0:
+            self._data['frame_ix'][ix] += frame_ix_shift
+
+        self._n += n
+
+    def build(self) -> EmitterSet:
+        """
+        Returns the concatenated EmitterSet. Its data are views on the first len(self) rows of the preallocated
+        columns, clone it to release excess capacity.
+
+        """
+        if self._data is None:
+            return EmptyEmitterSet(xy_unit=self._xy_unit, px_size=self._px_size)
+
+        em = EmitterSet(xy_unit=self._xy_unit, px_size=self._px_size, dtype_profile=self._dtype_profile,
+                        **{k: v[:self._n] if v is not None else None for k, v in self._data.items()})
+        if self._frame_sorted:
+            em._mark_frame_sorted()
+
+        return em
+
+
 class RandomEmitterSet(EmitterSet):
     """
     A helper calss when we only want to provide a number of emitters.
@@ -945,9 +1599,14 @@ class LooseEmitterSet:
     def te(self):  # end time
         return self.t0 + self.ontime
 
-    def _distribute_framewise(self):
+    def _distribute_framewise(self, frame_range: Optional[tuple] = None):
         """
-        Distributes the emitters framewise and prepares them for EmitterSet format.
+        Distributes the emitters framewise and prepares them for EmitterSet format. Single pass, i.e. the number of
+        frames per emitter is computed first and all outputs are gathered at once.
+
+        Args:
+            frame_range: (first, last) frame index (including). If specified, only the emitters on these frames are
+                generated.
 
         Returns:
             xyz_ (torch.Tensor): coordinates
@@ -956,65 +1615,88 @@ class LooseEmitterSet:
             id_ (torch.Tensor): identities
 
         """
-
+        te = self.te
         frame_start = torch.floor(self.t0).long()
-        frame_last = torch.floor(self.te).long()
-        frame_count = (frame_last - frame_start).long()
-
-        frame_count_full = frame_count - 2
-        ontime_first = torch.min(self.te - self.t0, frame_start + 1 - self.t0)
-        ontime_last = torch.min(self.te - self.t0, self.te - frame_last)
-
-        """Repeat by full-frame duration"""
-
-        # kick out everything that has no full frame_duration
-        ix_full = frame_count_full >= 0
-        xyz_ = self.xyz[ix_full, :]
-        flux_ = self.intensity[ix_full]
-        id_ = self.id[ix_full]
-        frame_start_full = frame_start[ix_full]
-        frame_dur_full_clean = frame_count_full[ix_full]
-
-        xyz_ = xyz_.repeat_interleave(frame_dur_full_clean + 1, dim=0)
-        phot_ = flux_.repeat_interleave(frame_dur_full_clean + 1, dim=0)  # because intensity * 1 = phot
-        id_ = id_.repeat_interleave(frame_dur_full_clean + 1, dim=0)
-        # because 0 is first occurence
-        frame_ix_ = frame_start_full.repeat_interleave(frame_dur_full_clean + 1, dim=0) \
-                    + decode.generic.utils.cum_count_per_group(id_) + 1
-
-        """First frame"""
-        # first
-        xyz_ = torch.cat((xyz_, self.xyz), 0)
-        phot_ = torch.cat((phot_, self.intensity * ontime_first), 0)
-        id_ = torch.cat((id_, self.id), 0)
-        frame_ix_ = torch.cat((frame_ix_, frame_start), 0)
-
-        # last (only if frame_last != frame_first
-        ix_with_last = frame_last >= frame_start + 1
-        xyz_ = torch.cat((xyz_, self.xyz[ix_with_last]))
-        phot_ = torch.cat((phot_, self.intensity[ix_with_last] * ontime_last[ix_with_last]), 0)
-        id_ = torch.cat((id_, self.id[ix_with_last]), 0)
-        frame_ix_ = torch.cat((frame_ix_, frame_last[ix_with_last]))
+        frame_last = torch.floor(te).long()
+
+        if frame_range is not None:
+            frame_start = frame_start.clamp(min=frame_range[0])
+            frame_last = frame_last.clamp(max=frame_range[1])
+
+        # number of frames per emitter (0 if outside of the frame range)
+        frame_count = (frame_last - frame_start + 1).clamp(min=0)
+
+        """Index of the emitter and frame index for every output"""
+        ix = torch.repeat_interleave(torch.arange(len(frame_count), device=frame_count.device), frame_count)
+        frame_offset = torch.cumsum(frame_count, 0) - frame_count  # output index of first frame of every emitter
+        frame_ix_ = frame_start[ix] + torch.arange(len(ix), device=ix.device) - frame_offset[ix]
+
+        """Photons are the intensity times the ontime within the respective frame"""
+        t0_, te_ = self.t0[ix], te[ix]
+        frame_float = frame_ix_.type(t0_.dtype)
+        ontime_ = torch.min(te_, frame_float + 1) - torch.max(t0_, frame_float)
+
+        xyz_ = self.xyz[ix]
+        phot_ = self.intensity[ix] * ontime_
+        id_ = self.id[ix]
 
         return xyz_, phot_, frame_ix_, id_
 
-    def return_emitterset(self):
+    def return_emitterset(self, frame_range: Optional[tuple] = None):
         """
         Returns EmitterSet with distributed emitters. The ID is preserved such that localisations coming from the same
         fluorophore will have the same ID.
 
+        Args:
+            frame_range: (first, last) frame index (including) of the returned emitters. If None, all frames are
+                returned.
+
         Returns:
             EmitterSet
         """
 
-        xyz_, phot_, frame_ix_, id_ = self._distribute_framewise()
+        xyz_, phot_, frame_ix_, id_ = self._distribute_framewise(frame_range)
         return EmitterSet(xyz_, phot_, frame_ix_.long(), id_.long(), xy_unit=self.xy_unit, px_size=self.px_size)
 
 
+def _cat_is_frame_sorted(emittersets: list, shift) -> bool:
+    """Checks whether the concatenation of (shifted) EmitterSets is frame sorted without looking at all elements."""
+    frame_last = None
+    for em, s in zip(emittersets, shift):
+        if not em.frame_sorted:
+            return False
+
+        if len(em) == 0:
+            continue
+
+        frame_first = em.frame_ix[0].item() + int(s)
+        if frame_last is not None and frame_first < frame_last:
+            return False
+
+        frame_last = em.frame_ix[-1].item() + int(s)
+
+    return True
+
+
+def _cat_preallocated(tensors: list, n: int) -> torch.Tensor:
+    """
+    Concatenates tensors along the 0th dimension into a single preallocated tensor of the promoted dtype.
+
+    Args:
+        tensors: list of tensors of equal trailing dimensions
+        n: total size in the 0th dimension
+
+    """
+    dtype = functools.reduce(torch.promote_types, [t.dtype for t in tensors])
+    out = torch.empty((n, *tensors[0].shape[1:]), dtype=dtype, device=tensors[0].device)
+
+    return torch.cat([t.to(dtype) for t in tensors], 0, out=out)
+
+
 def at_least_one_dim(*args) -> None:
     """Make tensors at least one dimensional (inplace)"""
     for arg in args:
-        if arg.dim() == 0:
+        if arg is not None and arg.dim() == 0:
             arg.unsqueeze_(0)
 
 
@@ -1,8 +1,7 @@
-import numpy as np
 import torch
 
 
-def split_sliceable(x, x_ix: torch.Tensor, ix_low: int, ix_high: int):
+def split_sliceable(x, x_ix: torch.Tensor, ix_low: int, ix_high: int, presorted: bool = False):
     """
     Split a sliceable / iterable according to an index into list of elements between lower and upper bound.
     Not present elements will be filled with empty instances of the iterable itself.
@@ -16,6 +15,8 @@ def split_sliceable(x, x_ix: torch.Tensor, ix_low: int, ix_high: int):
         x_ix (torch.Tensor): index according to which to split
         ix_low (int): lower bound
         ix_high (int): upper bound
+        presorted (bool): x and x_ix are already sorted by x_ix, in which case the sort is skipped and the splits are
+            contiguous slices of x
 
     Returns:
         x_list: list of instances sliced as specified by the x_ix
@@ -29,18 +30,22 @@ def split_sliceable(x, x_ix: torch.Tensor, ix_low: int, ix_high: int):
     if len(x_ix) != len(x):
         raise ValueError("Index and sliceable are not of same length (along first index).")
 
+    if ix_high < ix_low:  # empty range
+        return []
+
     """Sort iterable by x_ix"""
-    x_ix, re = torch.sort(x_ix)
-    x = x[re]
+    if not presorted:
+        x_ix, re = torch.sort(x_ix)
+        x = x[re]
 
     """
     arange( + 2) because + 1 for pythonic and another + 1 because the loop before return below goes from 0 to on 
     range('len' - 1)
     """
-    picker = np.arange(ix_low, ix_high + 2)
-    ix_sort = np.searchsorted(x_ix, picker)
+    picker = torch.arange(ix_low, ix_high + 2, dtype=x_ix.dtype, device=x_ix.device)
+    ix_sort = torch.searchsorted(x_ix, picker).tolist()
 
-    return [x[ix_sort[i]:ix_sort[i + 1]] for i in range(ix_sort.shape[0] - 1)]
+    return [x[ix_sort[i]:ix_sort[i + 1]] for i in range(len(ix_sort) - 1)]
 
 
 def ix_split(ix: torch.Tensor, ix_min: int, ix_max: int):
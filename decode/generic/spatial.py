@@ -0,0 +1,186 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+from scipy.spatial import cKDTree
+
+
+class SpatialIndex:
+    """
+    KD-tree over emitter coordinates for radius, box and nearest-neighbour queries.
+
+    The index is either global (queries see all emitters) or per frame (queries only see emitters on the frame they
+    are issued for). Per frame indexing is done in a single tree by appending the frame index, scaled by a separation
+    larger than the spatial extent of the data, as an extra coordinate. Hence all queries are vectorised across
+    frames and no python loop over frames is needed.
+
+    Example:
+        >>> index = SpatialIndex(em.xyz, em.frame_ix)
+        >>> ix_query, ix_ref, dist = index.query_radius(em.xyz, r=1., frame_ix=em.frame_ix)
+
+    """
+
+    def __init__(self, xyz: torch.Tensor, frame_ix: Optional[torch.Tensor] = None, dims: int = 3,
+                 leafsize: int = 16):
+        """
+
+        Args:
+            xyz: coordinates of size N x D (D >= dims)
+            frame_ix: frame index of size N. If specified, the index is per frame, otherwise global
+            dims: number of coordinates to use, e.g. 2 for lateral only queries
+            leafsize: leaf size of the KD-tree
+
+        """
+        if xyz.dim() != 2 or xyz.size(1) < dims:
+            raise ValueError(f"Coordinates must be of size N x D with D >= {dims}.")
+        if frame_ix is not None and len(frame_ix) != len(xyz):
+            raise ValueError("Coordinates and frame index must be of same length.")
+
+        self.dims = dims
+        self.per_frame = frame_ix is not None
+        self._n = len(xyz)
+
+        xyz = xyz[:, :dims].detach().cpu().double().numpy()
+
+        if self.per_frame:
+            self._frame_ix = frame_ix.detach().cpu().long().numpy()
+
+            # frames are separated by far more than the diameter of the data, such that neighbours on the same frame
+            # are always closer than any emitter on another frame
+            span = np.linalg.norm(xyz.max(0) - xyz.min(0)) if self._n >= 1 else 0.
+            self._frame_sep = 1e3 * (span + 1.)
+            xyz = self._append_frame(xyz, self._frame_ix)
+
+        self._tree = cKDTree(xyz, leafsize=leafsize)
+
+    def __len__(self):
+        return self._n
+
+    def _append_frame(self, xyz: np.ndarray, frame_ix: np.ndarray) -> np.ndarray:
+        return np.concatenate([xyz, (frame_ix * self._frame_sep)[:, None]], 1)
+
+    def _prepare_query(self, xyz: torch.Tensor, frame_ix: Optional[torch.Tensor]) -> Tuple[np.ndarray, np.ndarray]:
+        """Checks the query arguments and returns the query points (with frame coordinate) and their frame index."""
+        if self.per_frame and frame_ix is None:
+            raise ValueError("Index is per frame, queries must specify their frame index.")
+        if not self.per_frame and frame_ix is not None:
+            raise ValueError("Index is global, queries must not specify a frame index.")
+
+        xyz = xyz.detach().cpu().double().numpy()
+        if xyz.ndim != 2 or xyz.shape[1] < self.dims:
+            raise ValueError(f"Query points must be of size M x D with D >= {self.dims}.")
+        xyz = xyz[:, :self.dims]
+
+        if not self.per_frame:
+            return xyz, None
+
+        if len(frame_ix) != len(xyz):
+            raise ValueError("Query points and frame index must be of same length.")
+        frame_ix = frame_ix.detach().cpu().long().numpy()
+
+        return self._append_frame(xyz, frame_ix), frame_ix
+
+    def _pairs_within(self, query: np.ndarray, frame_ix: Optional[np.ndarray], r: float, p: float) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """All (query, reference) pairs within distance r in the Minkowski p-norm, sorted by query then reference"""
+        if len(query) == 0 or self._n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        pairs = cKDTree(query).sparse_distance_matrix(self._tree, max_distance=r, p=p, output_type='ndarray')
+        ix_q, ix_r, dist = pairs['i'].astype(np.int64), pairs['j'].astype(np.int64), pairs['v']
+
+        # only relevant if r exceeds the frame separation
+        if self.per_frame:
+            same_frame = frame_ix[ix_q] == self._frame_ix[ix_r]
+            ix_q, ix_r, dist = ix_q[same_frame], ix_r[same_frame], dist[same_frame]
+
+        order = np.lexsort((ix_r, ix_q))
+        return ix_q[order], ix_r[order], dist[order]
+
+    def query_radius(self, xyz: torch.Tensor, r: float, frame_ix: Optional[torch.Tensor] = None) \
+            -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Finds all emitters within (euclidean) distance r of the query points.
+
+        Args:
+            xyz: query points of size M x D
+            r: radius
+            frame_ix: frame index of the query points (required iff the index is per frame)
+
+        Returns:
+            ix_query: index of the query point of each pair
+            ix_ref: index of the emitter of each pair
+            dist: distance of each pair
+
+        """
+        query, frame_ix = self._prepare_query(xyz, frame_ix)
+        ix_q, ix_r, dist = self._pairs_within(query, frame_ix, r=r, p=2)
+
+        return torch.from_numpy(ix_q), torch.from_numpy(ix_r), torch.from_numpy(dist).float()
+
+    def query_box(self, lower: torch.Tensor, upper: torch.Tensor, frame_ix: Optional[torch.Tensor] = None) \
+            -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Finds all emitters within axis aligned boxes (bounds inclusive).
+
+        Args:
+            lower: lower corners of the boxes of size M x dims (or dims for a single box)
+            upper: upper corners of the boxes of size M x dims (or dims for a single box)
+            frame_ix: frame index of the boxes (required iff the index is per frame)
+
+        Returns:
+            ix_query: index of the box of each pair
+            ix_ref: index of the emitter of each pair
+
+        """
+        lower, upper = torch.atleast_2d(lower), torch.atleast_2d(upper)
+        if lower.size() != upper.size():
+            raise ValueError("Lower and upper corners must be of same size.")
+        if (lower > upper).any():
+            raise ValueError("Lower corners must not be larger than upper corners.")
+
+        """Chebyshev query around the box centres with the largest half width, then exact containment check"""
+        query, frame_ix = self._prepare_query((lower + upper) / 2, frame_ix)
+        r = ((upper - lower)[:, :self.dims] / 2).max().item() if len(lower) >= 1 else 0.
+        ix_q, ix_r, _ = self._pairs_within(query, frame_ix, r=r, p=np.inf)
+
+        lower = lower[:, :self.dims].detach().cpu().double().numpy()
+        upper = upper[:, :self.dims].detach().cpu().double().numpy()
+        ref = self._tree.data[ix_r, :self.dims]
+        inside = ((ref >= lower[ix_q]) & (ref <= upper[ix_q])).all(1)
+
+        return torch.from_numpy(ix_q[inside]), torch.from_numpy(ix_r[inside])
+
+    def knn(self, xyz: torch.Tensor, k: int, frame_ix: Optional[torch.Tensor] = None,
+            max_dist: float = float('inf')) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Finds the k nearest emitters of the query points. Missing neighbours (fewer than k emitters on the frame or
+        within max_dist) are marked by index -1 and infinite distance.
+
+        Args:
+            xyz: query points of size M x D
+            k: number of neighbours
+            frame_ix: frame index of the query points (required iff the index is per frame)
+            max_dist: upper bound of the neighbour distance
+
+        Returns:
+            dist: distances of size M x k, sorted ascending
+            ix: index of the neighbours of size M x k
+
+        """
+        if k < 1:
+            raise ValueError("Number of neighbours must be positive.")
+
+        query, _ = self._prepare_query(xyz, frame_ix)
+        if len(query) == 0 or self._n == 0:
+            return torch.full((len(query), k), float('inf')), torch.full((len(query), k), -1, dtype=torch.long)
+
+        # neighbours on other frames are at least the frame separation away
+        if self.per_frame:
+            max_dist = min(max_dist, self._frame_sep)
+
+        dist, ix = self._tree.query(query, k=k, distance_upper_bound=max_dist)
+        dist, ix = dist.reshape(len(query), k), ix.reshape(len(query), k).astype(np.int64)
+        ix[ix == self._n] = -1
+
+        return torch.from_numpy(dist).float(), torch.from_numpy(ix)
@@ -1,3 +1,4 @@
+import math
 from typing import Tuple
 
 import numpy as np
@@ -64,3 +65,124 @@ def frame_grid(img_size, xextent=None, yextent=None, *, origin=None, px_size=Non
     bin_ctr_y = (bin_y + (bin_y[1] - bin_y[0]) / 2)[:-1]
 
     return bin_x, bin_y, bin_ctr_x, bin_ctr_y
+
+
+class CacheStats:
+    """
+    Hit and miss counter of a cache for instrumentation.
+
+    Example:
+        >>> stats = CacheStats()
+        >>> stats.hit()
+        >>> stats.miss()
+        >>> stats.hit_rate
+        0.5
+
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"CacheStats(hits={self.hits}, misses={self.misses})"
+
+    def hit(self, n: int = 1):
+        self.hits += n
+
+    def miss(self, n: int = 1):
+        self.misses += n
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups that were hits (nan if there was no lookup)"""
+        n = self.hits + self.misses
+        return self.hits / n if n != 0 else float('nan')
+
+
+def quantile(x: torch.Tensor, q: float) -> torch.Tensor:
+    """
+    Quantile of a 1D tensor with linear interpolation (as np.percentile / torch.quantile) by selection (kthvalue)
+    instead of a full sort. The result stays on the device of x, i.e. there is no host synchronisation.
+
+    Args:
+        x: 1D tensor
+        q: quantile, 0 <= q <= 1
+
+    Returns:
+        0D tensor
+
+    """
+    if not 0. <= q <= 1.:
+        raise ValueError(f"Quantile must be in [0, 1] and not {q}.")
+    if x.dim() != 1 or len(x) == 0:
+        raise ValueError("Quantile is only supported for non-empty 1D tensors.")
+
+    pos = q * (len(x) - 1)
+    lo, hi = math.floor(pos), math.ceil(pos)
+
+    x_lo = x.kthvalue(lo + 1).values
+    if hi == lo:
+        return x_lo
+
+    return x_lo + (x.kthvalue(hi + 1).values - x_lo) * (pos - lo)
+
+
+class HistogramQuantileSketch:
+    """
+    Approximate quantiles of a stream of values that does not fit in memory at once. The values are accumulated in a
+    fixed binning of a known value range, the quantile error is at most one bin width (high - low) / n_bins.
+
+    Example:
+        >>> sketch = HistogramQuantileSketch(0., 1.)
+        >>> for x in chunks:
+        >>>     sketch.update(x)
+        >>> sketch.quantile(0.5)
+
+    """
+
+    def __init__(self, low: float, high: float, n_bins: int = 2 ** 16):
+        """
+
+        Args:
+            low: lower bound of the values
+            high: upper bound of the values
+            n_bins: number of bins
+
+        """
+        if not high > low:
+            raise ValueError("Upper bound must be larger than lower bound.")
+
+        self.low = low
+        self.high = high
+        self.n_bins = n_bins
+        self.count = torch.zeros(n_bins, dtype=torch.double)
+
+    def __len__(self) -> int:
+        return int(self.count.sum().item())
+
+    def update(self, x: torch.Tensor):
+        """Adds values (out of range values are clamped to the bounds)."""
+        x = x.detach().double().clamp(self.low, self.high)
+        self.count += torch.histc(x, bins=self.n_bins, min=self.low, max=self.high).cpu()
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile (linear within the bin)."""
+        if not 0. <= q <= 1.:
+            raise ValueError(f"Quantile must be in [0, 1] and not {q}.")
+        if len(self) == 0:
+            raise ValueError("Quantile of empty sketch.")
+
+        cum = self.count.cumsum(0)
+        rank = q * cum[-1]
+        ix = min(int(torch.searchsorted(cum, rank.unsqueeze(0)).item()), self.n_bins - 1)
+
+        cum_before = cum[ix - 1] if ix >= 1 else torch.tensor(0.)
+        frac = ((rank - cum_before) / self.count[ix]).clamp(0., 1.) if self.count[ix] > 0 else torch.tensor(0.)
+        width = (self.high - self.low) / self.n_bins
+
+        return self.low + (ix + frac.item()) * width
@@ -1,9 +1,53 @@
+import concurrent.futures
 import time
+from typing import Optional, Tuple
 
 import torch
+import torch.multiprocessing
 from torch.utils.data import Dataset
 
 from decode.generic import emitter
+from decode.neuralfitter import target_generator, weight_generator
+from decode.neuralfitter.utils import processing
+from decode.simulation import background
+
+
+def simulate_acquisition(simulator, chunk_size: Optional[int] = None) -> Tuple[emitter.EmitterSet, torch.Tensor,
+                                                                               torch.Tensor]:
+    """
+    Samples an acquisition of a simulator, chunk wise into preallocated frames on the CPU if chunk_size is specified.
+
+    Args:
+        simulator: simulation instance
+        chunk_size: number of frames simulated at once, None for all at once
+
+    Returns:
+        EmitterSet: sampled emitters
+        torch.Tensor: frames
+        torch.Tensor: background frames
+
+    """
+    if chunk_size is None:
+        return simulator.sample()
+
+    rng = simulator.next_rng()
+    emitter = simulator.sample_emitters(rng)
+    ix_low, ix_high = simulator.frame_bounds(emitter)
+
+    frames, bg_frames = None, None
+    i = 0
+    for _, frames_chunk, bg_chunk in simulator.forward_chunks(emitter, chunk_size, ix_low, ix_high, rng=rng):
+        if frames is None:
+            frames = torch.empty((ix_high - ix_low + 1, *frames_chunk.size()[1:]), dtype=frames_chunk.dtype)
+            if bg_chunk is not None:
+                bg_frames = torch.empty((ix_high - ix_low + 1, *bg_chunk.size()[1:]), dtype=bg_chunk.dtype)
+
+        frames[i:i + len(frames_chunk)] = frames_chunk.cpu()
+        if bg_chunk is not None:
+            bg_frames[i:i + len(bg_chunk)] = bg_chunk.cpu()
+        i += len(frames_chunk)
+
+    return emitter, frames, bg_frames
 
 
 class SMLMDataset(Dataset):
@@ -94,18 +138,72 @@ class SMLMDataset(Dataset):
         if self.em_proc is not None:
             tar_emitter = self.em_proc.forward(tar_emitter)
 
+        """Bin the emitters once if all binning components of target and weight generator use the same grid"""
+        bin_ix = self._shared_bin_index(tar_emitter)
+
         if self.tar_gen is not None:
-            target = self.tar_gen.forward(tar_emitter, bg_frame)
+            if bin_ix is not None and self._accepts_bin_ix(self.tar_gen):
+                target = self.tar_gen.forward(tar_emitter, bg_frame, bin_ix=bin_ix)
+            else:
+                target = self.tar_gen.forward(tar_emitter, bg_frame)
         else:
             target = None
 
         if self.weight_gen is not None:
-            weight = self.weight_gen.forward(tar_emitter, target)
+            if bin_ix is not None and self._accepts_bin_ix(self.weight_gen):
+                weight = self.weight_gen.forward(tar_emitter, target, bin_ix=bin_ix)
+            else:
+                weight = self.weight_gen.forward(tar_emitter, target)
         else:
             weight = None
 
         return frames, target, weight, tar_emitter
 
+    @classmethod
+    def _components(cls, gen) -> list:
+        """Components of a generator, TransformSequences are resolved recursively"""
+        if gen is None:
+            return []
+        if isinstance(gen, processing.TransformSequence):
+            return [c for com in gen.com for c in cls._components(com)]
+        return [gen]
+
+    @staticmethod
+    def _bin_psf(com):
+        """The DeltaPSF by which a component bins the emitters, None if it does not bin (or cannot take a bin_ix)"""
+        if isinstance(com, target_generator.UnifiedEmbeddingTarget):
+            return com._delta_psf
+        if isinstance(com, weight_generator.SimpleWeight):
+            return com.target_equivalent._delta_psf
+        if isinstance(com, background.BgPerEmitterFromBgFrame):
+            return com.delta_psf
+        return None
+
+    @classmethod
+    def _accepts_bin_ix(cls, gen) -> bool:
+        return isinstance(gen, processing.TransformSequence) or cls._bin_psf(gen) is not None
+
+    def _shared_bin_index(self, tar_emitter):
+        """
+        Bin index of the target emitters if all components of target and weight generator (also within
+        TransformSequences) that bin the emitters do so on the same grid, else None.
+        """
+        binning = [com for com in self._components(self.tar_gen) + self._components(self.weight_gen)
+                   if self._bin_psf(com) is not None]
+        if len(binning) == 0:
+            return None
+
+        # BgPerEmitterFromBgFrame bins the coordinates as they are, the shared index is computed in px
+        if tar_emitter.xy_unit != 'px' and any(isinstance(com, background.BgPerEmitterFromBgFrame) for com in binning):
+            return None
+
+        grids = {(tuple(psf.xextent), tuple(psf.yextent), tuple(psf.img_shape))
+                 for psf in (self._bin_psf(com) for com in binning)}
+        if len(grids) != 1:
+            return None
+
+        return self._bin_psf(binning[0]).search_bin_index(tar_emitter.xyz_px[:, :2], raise_outside=False)
+
     def _return_sample(self, frame, target, weight, emitter):
 
         if self.return_em:
@@ -214,7 +312,13 @@ class SMLMLiveDataset(SMLMStaticDataset):
     """
 
     def __init__(self, *, simulator, em_proc, frame_proc, bg_frame_proc, tar_gen, weight_gen, frame_window, pad,
-                 return_em=False):
+                 return_em=False, sim_chunk_size: int = None):
+        """
+
+        Args:
+            sim_chunk_size: if specified, the acquisition is simulated in chunks of this many frames which are
+                collected on the CPU, i.e. the memory of the simulation itself (e.g. on the GPU) is bound by the chunk
+        """
 
         super().__init__(emitter=None, frames=None,
                          em_proc=em_proc, frame_proc=frame_proc, bg_frame_proc=bg_frame_proc,
@@ -222,8 +326,13 @@ class SMLMLiveDataset(SMLMStaticDataset):
                          frame_window=frame_window, pad=pad, return_em=return_em)
 
         self.simulator = simulator
+        self.sim_chunk_size = sim_chunk_size
         self._bg_frames = None
 
+    def _simulate(self):
+        """Samples an acquisition, chunk wise into preallocated frames on the CPU if sim_chunk_size is specified."""
+        return simulate_acquisition(self.simulator, self.sim_chunk_size)
+
     def sanity_check(self):
 
         super().sanity_check()
@@ -239,16 +348,29 @@ class SMLMLiveDataset(SMLMStaticDataset):
 
         """
 
-        def set_frame_ix(em):  # helper function
-            em.frame_ix = torch.zeros_like(em.frame_ix)
-            return em
-
         """Sample new dataset."""
         t0 = time.time()
-        emitter, frames, bg_frames = self.simulator.sample()
+        emitter, frames, bg_frames = self._simulate()
         if verbose:
             print(f"Sampled dataset in {time.time() - t0:.2f}s. {len(emitter)} emitters on {frames.size(0)} frames.")
 
+        self.set_sample(emitter, frames, bg_frames)
+
+    def set_sample(self, emitter, frames: torch.Tensor, bg_frames: torch.Tensor):
+        """
+        Sets a sampled acquisition as the dataset (e.g. simulated by an AsyncResampler).
+
+        Args:
+            emitter: emitters
+            frames: frames
+            bg_frames: background frames
+
+        """
+
+        def set_frame_ix(em):  # helper function
+            em.frame_ix = torch.zeros_like(em.frame_ix)
+            return em
+
         """Split Emitters into list of emitters (per frame) and set frame_ix to 0."""
         emitter = emitter.split_in_frames(0, frames.size(0) - 1)
         emitter = [set_frame_ix(em) for em in emitter]
@@ -266,10 +388,10 @@ class SMLMAPrioriDataset(SMLMLiveDataset):
     """
 
     def __init__(self, *, simulator, em_proc, frame_proc, bg_frame_proc, tar_gen, weight_gen, frame_window, pad,
-                 return_em=False):
+                 return_em=False, sim_chunk_size: int = None):
         super().__init__(simulator=simulator, em_proc=em_proc, frame_proc=frame_proc, bg_frame_proc=bg_frame_proc,
                          tar_gen=tar_gen, weight_gen=weight_gen, frame_window=frame_window, pad=pad,
-                         return_em=return_em)
+                         return_em=return_em, sim_chunk_size=sim_chunk_size)
 
         self._em_split = None  # emitter splitted in frames
         self._target = None
@@ -289,8 +411,7 @@ class SMLMAPrioriDataset(SMLMLiveDataset):
             hw = (self.frame_window - 1) // 2  # half window without centre
 
             # ToDo: Change here when pythonize emitter / frame indexing
-            em = self._emitter.get_subset_frame(hw, len(self))
-            em.frame_ix -= hw
+            em = self._emitter.get_subset_frame(hw, len(self), -hw)
 
             return em
         else:
@@ -305,11 +426,23 @@ class SMLMAPrioriDataset(SMLMLiveDataset):
 
         """
         t0 = time.time()
-        emitter, frames, bg_frames = self.simulator.sample()
+        emitter, frames, bg_frames = self._simulate()
 
         if verbose:
             print(f"Sampled dataset in {time.time() - t0:.2f}s. {len(emitter)} emitters on {frames.size(0)} frames.")
 
+        self.set_sample(emitter, frames, bg_frames)
+
+    def set_sample(self, emitter, frames: torch.Tensor, bg_frames: torch.Tensor):
+        """
+        Sets a sampled acquisition as the dataset and processes it.
+
+        Args:
+            emitter: emitters
+            frames: frames
+            bg_frames: background frames
+
+        """
         frames, target, weight, tar_emitter = self._process_sample(frames, emitter, bg_frames)
         self._frames = frames.cpu()
         self._emitter = tar_emitter
@@ -363,3 +496,111 @@ class SMLMLiveSampleDataset(SMLMDataset):
         frames, target, weight, tar_emitter = self._process_sample(frames, tar_emitter, bg_frames)
 
         return self._return_sample(frames, target, weight, tar_emitter)
+
+
+_resampler_simulator = None  # simulator of the AsyncResampler process, set by its initializer
+_resampler_chunk_size = None
+
+
+def _init_resampler(simulator, chunk_size: Optional[int]):
+    global _resampler_simulator, _resampler_chunk_size
+    _resampler_simulator, _resampler_chunk_size = simulator, chunk_size
+
+
+def _resample(seed: int):
+    """Simulates an acquisition in the resampler process, tensors are returned on the CPU (i.e. via shared memory)"""
+    torch.manual_seed(seed)
+
+    t0 = time.time()
+    em, frames, bg_frames = simulate_acquisition(_resampler_simulator, _resampler_chunk_size)
+    frames, bg_frames = frames.cpu(), bg_frames.cpu() if bg_frames is not None else None
+
+    return em, frames, bg_frames, time.time() - t0
+
+
+class AsyncResampler:
+    """
+    Double buffered resampling of a live dataset. The next acquisition is simulated in a background process while the
+    current one is in use (e.g. trained on) and it is set as the dataset at once upon swap (e.g. at the end of an
+    epoch). The process simulates with a copy of the simulator of the dataset as of the first start.
+
+    Attributes:
+        dataset (SMLMLiveDataset): dataset to resample
+        sim_time (float): time the last swapped in acquisition took to simulate (in the background process)
+        wait_time (float): time the last swap waited for the simulation, i.e. > 0 if simulation is the bottleneck
+
+    Example:
+        >>> resampler = AsyncResampler(ds_train, start_method='spawn')
+        >>> resampler.start()
+        >>> for epoch in range(epochs):
+        >>>     train(...)
+        >>>     resampler.swap()
+
+    """
+
+    def __init__(self, dataset: SMLMLiveDataset, start_method: Optional[str] = None):
+        """
+
+        Args:
+            dataset: dataset to resample
+            start_method: multiprocessing start method of the background process (default of torch.multiprocessing
+                if None). Use 'spawn' if the simulation runs on CUDA
+
+        """
+        self.dataset = dataset
+        self.start_method = start_method
+
+        self.sim_time = None
+        self.wait_time = None
+
+        self._executor = None
+        self._pending = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        """Starts the simulation of the next acquisition in the background (if not already running)."""
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=torch.multiprocessing.get_context(self.start_method),
+                initializer=_init_resampler, initargs=(self.dataset.simulator, self.dataset.sim_chunk_size))
+
+        if self._pending is None:
+            seed = torch.randint(2 ** 62, size=(1,)).item()  # from the RNG of the main process, i.e. reproducible
+            self._pending = self._executor.submit(_resample, seed)
+
+    def swap(self, verbose: bool = False):
+        """
+        Waits for the acquisition that is simulated in the background, sets it as the dataset and starts the simulation
+        of the next one.
+
+        Args:
+            verbose: print timing information
+
+        """
+        self.start()
+
+        t0 = time.time()
+        em, frames, bg_frames, self.sim_time = self._pending.result()  # re-raises exceptions of the process
+        self.wait_time = time.time() - t0
+        self._pending = None
+
+        self.dataset.set_sample(em, frames, bg_frames)
+        self.start()
+
+        if verbose:
+            print(f"Swapped in dataset simulated in {self.sim_time:.2f}s (waited {self.wait_time:.2f}s). "
+                  f"{len(em)} emitters on {frames.size(0)} frames.")
+
+    def close(self):
+        """Stops the background process, a pending simulation is discarded."""
+        if self._executor is not None:
+            if self._pending is not None:
+                self._pending.cancel()
+            self._executor.shutdown()
+            self._executor = None
+            self._pending = None
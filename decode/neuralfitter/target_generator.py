@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Union
+from typing import Optional, Tuple, Union
 
 import torch
 
@@ -211,10 +211,52 @@ class UnifiedEmbeddingTarget(TargetGenerator):
 
         return em, ix_low, ix_high
 
+    def _filter_forward_binned(self, em: EmitterSet, ix_low: (int, None), ix_high: (int, None),
+                               bin_ix: Tuple[torch.Tensor, torch.Tensor]):
+        """
+        Filter as _filter_forward, given the bin index of the emitters (see bin_index) which is filtered alongside.
+        Emitters outside of the frame are those whose bin index is out of range.
+
+        Args:
+            em:
+            ix_low:
+            ix_high:
+            bin_ix: x and y bin index of em
+
+        """
+        if ix_low is None:
+            ix_low = self.ix_low
+        if ix_high is None:
+            ix_high = self.ix_high
+
+        x_ix, y_ix = bin_ix
+        is_emit = (em.frame_ix >= ix_low) * (em.frame_ix <= ix_high) * \
+                  (x_ix >= 0) * (x_ix < self.img_shape[0]) * (y_ix >= 0) * (y_ix < self.img_shape[1])
+
+        em = em[is_emit]
+        em.frame_ix -= ix_low
+
+        return em, ix_low, ix_high, (x_ix[is_emit], y_ix[is_emit])
+
+    def bin_index(self, em: EmitterSet) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Bin index of the emitters. Can be computed once per sample and passed on to the forward of this target,
+        SimpleWeight and BgPerEmitterFromBgFrame on the same grid, such that the emitters are binned only once.
+        Emitters outside of the frame have an index out of range.
+
+        Args:
+            em: set of emitters
+
+        Returns:
+            x_ix, y_ix
+
+        """
+        return self._delta_psf.search_bin_index(em.xyz_px[:, :2], raise_outside=False)
+
     def forward_(self, xyz: torch.Tensor, phot: torch.Tensor, frame_ix: torch.LongTensor,
-                 ix_low: int, ix_high: int) -> torch.Tensor:
+                 ix_low: int, ix_high: int, bin_ix: Optional[Tuple[torch.Tensor, torch.Tensor]] = None) -> torch.Tensor:
         """Get index of central bin for each emitter."""
-        x_ix, y_ix = self._delta_psf.search_bin_index(xyz[:, :2])
+        x_ix, y_ix = self._delta_psf.search_bin_index(xyz[:, :2]) if bin_ix is None else bin_ix
 
         assert isinstance(frame_ix, torch.LongTensor)
 
@@ -231,9 +273,26 @@ class UnifiedEmbeddingTarget(TargetGenerator):
 
         return target
 
-    def forward(self, em: EmitterSet, bg: torch.Tensor = None, ix_low: int = None, ix_high: int = None) -> torch.Tensor:
-        em, ix_low, ix_high = self._filter_forward(em, ix_low, ix_high)  # filter em that are out of view
-        target = self.forward_(xyz=em.xyz_px, phot=em.phot, frame_ix=em.frame_ix, ix_low=ix_low, ix_high=ix_high)
+    def forward(self, em: EmitterSet, bg: torch.Tensor = None, ix_low: int = None, ix_high: int = None,
+                bin_ix: Optional[Tuple[torch.Tensor, torch.Tensor]] = None) -> torch.Tensor:
+        """
+        Forward calculate target as by the emitters and background (see TargetGenerator).
+
+        Args:
+            em: set of emitters
+            bg: background frame
+            ix_low: lower frame index
+            ix_high: upper frame index
+            bin_ix: (optional) precomputed bin index of em (see bin_index)
+
+        """
+        if bin_ix is None:
+            em, ix_low, ix_high = self._filter_forward(em, ix_low, ix_high)  # filter em that are out of view
+        else:
+            em, ix_low, ix_high, bin_ix = self._filter_forward_binned(em, ix_low, ix_high, bin_ix)
+
+        target = self.forward_(xyz=em.xyz_px, phot=em.phot, frame_ix=em.frame_ix, ix_low=ix_low, ix_high=ix_high,
+                               bin_ix=bin_ix)
 
         if bg is not None:
             target = torch.cat((target, bg.unsqueeze(0).unsqueeze(0)), 1)
@@ -13,15 +13,22 @@ def setup_random_simulation(param):
         """
 
     psf = decode.utils.calibration_io.SMAPSplineCoefficient(
-        calib_file=param.InOut.calibration_file).init_spline(
+        calib_file=param.InOut.calibration_file, cache_dir=param.InOut.cache_dir).init_spline(
         xextent=param.Simulation.psf_extent[0],
         yextent=param.Simulation.psf_extent[1],
         img_shape=param.Simulation.img_size,
         device=param.Hardware.device_simulation,
         roi_size=param.Simulation.roi_size,
-        roi_auto_center=param.Simulation.roi_auto_center
+        roi_auto_center=param.Simulation.roi_auto_center,
+        n_threads=param.Hardware.cpu_threads_simulation
     )
 
+    if param.Simulation.psf_fft.mode is not None:
+        psf = decode.simulation.psf_kernel.FFTConvolutionPSF(
+            psf, z_range=param.Simulation.emitter_extent[2], n_z=param.Simulation.psf_fft.n_z,
+            kernel_size=param.Simulation.psf_fft.kernel_size, oversampling=param.Simulation.psf_fft.oversampling,
+            mode=param.Simulation.psf_fft.mode, density_crossover=param.Simulation.psf_fft.density_crossover)
+
     """Structure Prior"""
     prior_struct = decode.simulation.structure_prior.RandomStructure.parse(param)
 
@@ -47,8 +54,22 @@ def setup_random_simulation(param):
     else:
         noise = decode.simulation.camera.Photon2Camera.parse(param)
 
+    """Frame wise RNG streams if seeded, independent ones for the train and test set"""
+    if param.Simulation.seed is not None:
+        rng = decode.simulation.rng.RNGContext(param.Simulation.seed)
+        rng_train, rng_test = rng.spawn('train'), rng.spawn('test')
+    else:
+        rng_train, rng_test = None, None
+
     simulation_train = decode.simulation.simulator.Simulation(psf=psf, em_sampler=prior_train, background=bg,
-                                                              noise=noise, frame_range=frame_range_train)
+                                                              noise=noise, frame_range=frame_range_train,
+                                                              rng=rng_train)
+
+    if param.Hardware.num_worker_sim is not None and param.Hardware.num_worker_sim >= 1:
+        # CUDA can not be re-initialised in forked workers
+        start_method = 'spawn' if 'cuda' in str(param.Hardware.device_simulation) else None
+        simulation_train = decode.simulation.simulator.ParallelSimulation(
+            simulation_train, n_workers=param.Hardware.num_worker_sim, start_method=start_method)
 
     frame_range_test = (0, param.TestSet.test_size)
 
@@ -56,6 +77,6 @@ def setup_random_simulation(param):
         param, structure=prior_struct, frames=frame_range_test)
 
     simulation_test = decode.simulation.simulator.Simulation(psf=psf, em_sampler=prior_test, background=bg, noise=noise,
-                                                             frame_range=frame_range_test)
+                                                             frame_range=frame_range_test, rng=rng_test)
 
     return simulation_train, simulation_test
@@ -185,6 +185,7 @@ def live_engine_setup(param_file: str, device_overwrite: str = None, debug: bool
         first_epoch = 0
 
     converges = False
+    resampler = None
     n = 0
     n_max = param.HyperParameter.auto_restart_param.num_restarts
 
@@ -197,6 +198,13 @@ def live_engine_setup(param_file: str, device_overwrite: str = None, debug: bool
             threshold=param.HyperParameter.auto_restart_param.restart_treshold,
         )
 
+        """Simulate the next training set in the background while training (double buffered)"""
+        if resampler is not None:
+            resampler.close()  # dataset changed upon restart
+        if param.Simulation.mode == 'acquisition' and param.Hardware.async_simulation:
+            resampler = decode.neuralfitter.dataset.AsyncResampler(ds_train, start_method='spawn')
+            resampler.start()
+
         for i in range(first_epoch, param.HyperParameter.epochs):
             logger.add_scalar('learning/learning_rate', optimizer.param_groups[0]['lr'], i)
 
@@ -263,10 +271,18 @@ def live_engine_setup(param_file: str, device_overwrite: str = None, debug: bool
 
             """Draw new samples Samples"""
             if param.Simulation.mode in 'acquisition':
-                ds_train.sample(True)
+                if resampler is not None:
+                    resampler.swap(True)
+                    logger.add_scalar('sampling/sim_time', resampler.sim_time, i)
+                    logger.add_scalar('sampling/wait_time', resampler.wait_time, i)
+                else:
+                    ds_train.sample(True)
             elif param.Simulation.mode != 'samples':
                 raise ValueError
 
+    if resampler is not None:
+        resampler.close()
+
     if converges:
         print("Training finished after reaching maximum number of epochs.")
     else:
@@ -1,3 +1,4 @@
+import inspect
 from operator import itemgetter
 from typing import Callable
 
@@ -46,12 +47,26 @@ class TransformSequence:
         """
         return self.com.__len__()
 
-    def forward(self, *x):
+    @staticmethod
+    def _accepted_kwargs(com, kwargs: dict) -> dict:
+        """Subset of the keyword arguments that the forward method of a component accepts"""
+        if not kwargs:
+            return kwargs
+
+        params = inspect.signature(com.forward).parameters
+        if any(p.kind == inspect.Parameter.VAR_KEYWORD for p in params.values()):
+            return kwargs
+
+        return {k: v for k, v in kwargs.items() if k in params}
+
+    def forward(self, *x, **kwargs):
         """
         Forwards the input data sequentially through all components
 
         Args:
             *x: arbitrary input data
+            **kwargs: keyword arguments that are passed to those components whose forward method accepts them (e.g. a
+                precomputed bin_ix)
 
         Returns:
             Any: Output of the last component
@@ -59,19 +74,20 @@ class TransformSequence:
         """
 
         for i, com in enumerate(self.com):
+            com_kwargs = self._accepted_kwargs(com, kwargs)
 
             if isinstance(x, tuple):
 
                 if self._input_slice is not None:
                     com_in = itemgetter(*self._input_slice[i])(x)  # get specific outputs as input for next com
                     if len(self._input_slice[i]) >= 2:
-                        x = com.forward(*com_in)
+                        x = com.forward(*com_in, **com_kwargs)
                     else:
-                        x = com.forward(com_in)
+                        x = com.forward(com_in, **com_kwargs)
                 else:
-                    x = com.forward(*x)
+                    x = com.forward(*x, **com_kwargs)
             else:
-                x = com.forward(x)
+                x = com.forward(x, **com_kwargs)
 
         return x
 
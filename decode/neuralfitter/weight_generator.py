@@ -1,6 +1,6 @@
 from abc import abstractmethod
 from deprecated import deprecated
-from typing import Union
+from typing import Optional, Tuple, Union
 
 import torch
 import torch.nn
@@ -125,7 +125,19 @@ class SimpleWeight(WeightGenerator):
                 raise ValueError(f"Index does not match")
 
     def forward(self, tar_em: emc.EmitterSet, tar_frames: torch.Tensor,
-                ix_low: Union[int, None] = None, ix_high: Union[int, None] = None) -> torch.Tensor:
+                ix_low: Union[int, None] = None, ix_high: Union[int, None] = None,
+                bin_ix: Optional[Tuple[torch.Tensor, torch.Tensor]] = None) -> torch.Tensor:
+        """
+        Calculate weight map based on target frames and target emitters.
+
+        Args:
+            tar_em: target EmitterSet
+            tar_frames: target frames
+            ix_low: lower frame index
+            ix_high: upper frame index
+            bin_ix: (optional) precomputed bin index of tar_em (see UnifiedEmbeddingTarget.bin_index)
+
+        """
 
         if self.squeeze_batch_dim and tar_frames.dim() == 3:
             tar_frames = tar_frames.unsqueeze(0)
@@ -133,7 +145,11 @@ class SimpleWeight(WeightGenerator):
         if self._forward_safety:
             self.check_forward_sanity(tar_em, tar_frames, ix_low, ix_high)
 
-        tar_em, ix_low, ix_high = self.target_equivalent._filter_forward(tar_em, ix_low, ix_high)
+        if bin_ix is None:
+            tar_em, ix_low, ix_high = self.target_equivalent._filter_forward(tar_em, ix_low, ix_high)
+        else:
+            tar_em, ix_low, ix_high, bin_ix = self.target_equivalent._filter_forward_binned(tar_em, ix_low, ix_high,
+                                                                                            bin_ix)
 
         """Set Detection and Background to 1."""
         weight_frames = torch.zeros_like(tar_frames)
@@ -145,7 +161,7 @@ class SimpleWeight(WeightGenerator):
         weight = torch.ones_like(tar_em.phot)
 
         batch_size = ix_high - ix_low + 1
-        ix_x, ix_y = self.weight_psf.search_bin_index(xyz[:, :2])
+        ix_x, ix_y = self.weight_psf.search_bin_index(xyz[:, :2]) if bin_ix is None else bin_ix
         ix_batch_roi, ix_x_roi, ix_y_roi, _, _, id = self.target_equivalent._get_roi_px(ix_batch, ix_x, ix_y)
 
         """Set ROI"""
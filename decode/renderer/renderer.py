@@ -143,21 +143,31 @@ class Renderer2D(Renderer):
         Forward emitterset through rendering and output rendered data.
 
         Args:
-            em: emitter set
+            em: emitter set. Out-of-core sets (e.g. decode.utils.emitter_io.LazyH5EmitterSet) are rendered chunk by
+                chunk without loading them at once.
             col_vec: torch tensor (1 dim) with the same length as em
 
         """
 
+        if len(em) == 0:  # no extent can be determined from the emitters
+            return self._forward_empty(col_vec)
+
         xyz_extent = self.get_extent(em)
-        ind_mask = (
-                (em.xyz_nm[:, 0] >= xyz_extent[0][0])
-                * (em.xyz_nm[:, 0] <= xyz_extent[0][1])
-                * (em.xyz_nm[:, 1] >= xyz_extent[1][0])
-                * (em.xyz_nm[:, 1] <= xyz_extent[1][1])
-                * (em.xyz_nm[:, 2] >= xyz_extent[2][0])
-                * (em.xyz_nm[:, 2] <= xyz_extent[2][1])
-        )
 
+        if not isinstance(em, emitter.EmitterSet):
+            if col_vec is not None:
+                raise NotImplementedError("Colour coding is not supported for out-of-core EmitterSets.")
+
+            # accumulate the histogram chunk by chunk
+            bins_x, bins_y = self._hist_bins(xyz_extent[self.plot_axis[0]], xyz_extent[self.plot_axis[1]])
+            hist = np.zeros((len(bins_x) - 1, len(bins_y) - 1))
+            for em_chunk in em.iter_chunks():
+                hist += self._hist2d(em_chunk[self._in_extent(em_chunk, xyz_extent)], None,
+                                     xyz_extent[self.plot_axis[0]], xyz_extent[self.plot_axis[1]])
+
+            return self._post_process(hist)
+
+        ind_mask = self._in_extent(em, xyz_extent)
         em_sub = em[ind_mask]
 
         if col_vec is not None:
@@ -210,35 +220,76 @@ class Renderer2D(Renderer):
             hist = self._hist2d(em_sub, None, xyz_extent[self.plot_axis[0]],
                                 xyz_extent[self.plot_axis[1]])
 
-            if self.rel_clip is not None:
-                hist = np.clip(hist, 0.0, hist.max() * self.rel_clip)
-            if self.abs_clip is not None:
-                hist = np.clip(hist, 0.0, self.abs_clip)
+            return self._post_process(hist)
+
+    def _forward_empty(self, col_vec=None) -> torch.Tensor:
+        """Zero histogram of an empty set. A plotted axis without specified extent has a single bin."""
+        extent = (self.xextent, self.yextent, self.zextent)
+        x_ext, y_ext = extent[self.plot_axis[0]], extent[self.plot_axis[1]]
+        bins_x, bins_y = self._hist_bins(x_ext if x_ext is not None else (0., 0.),
+                                         y_ext if y_ext is not None else (0., 0.))
+
+        shape = (len(bins_x) - 1, len(bins_y) - 1) + ((3,) if col_vec is not None else ())
+        return torch.zeros(shape, dtype=torch.float64)
 
-            if self.sigma_blur is not None:
-                hist = gaussian_filter(hist, sigma=[self.sigma_blur / self.px_size,
-                                                    self.sigma_blur / self.px_size])
+    def _post_process(self, hist: np.ndarray) -> torch.Tensor:
+        """Clipping, blur and contrast of the intensity histogram"""
+        if self.rel_clip is not None:
+            hist = np.clip(hist, 0.0, hist.max() * self.rel_clip)
+        if self.abs_clip is not None:
+            hist = np.clip(hist, 0.0, self.abs_clip)
 
-            hist = np.clip(hist, 0, hist.max() / self.contrast)
-            return torch.from_numpy(hist)
+        if self.sigma_blur is not None:
+            hist = gaussian_filter(hist, sigma=[self.sigma_blur / self.px_size,
+                                                self.sigma_blur / self.px_size])
+
+        hist = np.clip(hist, 0, hist.max() / self.contrast)
+        return torch.from_numpy(hist)
+
+    @staticmethod
+    def _in_extent(em: emitter.EmitterSet, xyz_extent) -> torch.Tensor:
+        """Mask of the emitters within the extent"""
+        xyz_nm = em.xyz_nm
+        return (
+                (xyz_nm[:, 0] >= xyz_extent[0][0])
+                * (xyz_nm[:, 0] <= xyz_extent[0][1])
+                * (xyz_nm[:, 1] >= xyz_extent[1][0])
+                * (xyz_nm[:, 1] <= xyz_extent[1][1])
+                * (xyz_nm[:, 2] >= xyz_extent[2][0])
+                * (xyz_nm[:, 2] <= xyz_extent[2][1])
+        )
 
     def get_extent(self, em) -> Tuple[tuple, tuple, tuple]:
+        extent = (self.xextent, self.yextent, self.zextent)
+        if all(e is not None for e in extent):
+            return extent
+
+        # out-of-core sets are reduced chunk by chunk
+        em_chunks = [em] if isinstance(em, emitter.EmitterSet) else em.iter_chunks()
+        xyz_min_max = [(e.xyz_nm.min(0)[0], e.xyz_nm.max(0)[0]) for e in em_chunks if len(e) >= 1]
+        if len(xyz_min_max) == 0:
+            raise ValueError("Can not determine the extent of an empty EmitterSet. Specify x, y and z extent.")
+
+        xyz_min, xyz_max = zip(*xyz_min_max)
+        xyz_min = torch.stack(xyz_min).min(0)[0]
+        xyz_max = torch.stack(xyz_max).max(0)[0]
+
+        return tuple((xyz_min[i], xyz_max[i]) if e is None else e for i, e in enumerate(extent))
+
+    def _hist_bins(self, x_hist_ext, y_hist_ext) -> Tuple[np.ndarray, np.ndarray]:
+        """Bin edges of the histogram. An empty extent (e.g. of a single emitter) results in a single bin."""
 
-        xextent = (
-        em.xyz_nm[:, 0].min(), em.xyz_nm[:, 0].max()) if self.xextent is None else self.xextent
-        yextent = (
-        em.xyz_nm[:, 1].min(), em.xyz_nm[:, 1].max()) if self.yextent is None else self.yextent
-        zextent = (
-        em.xyz_nm[:, 2].min(), em.xyz_nm[:, 2].max()) if self.zextent is None else self.zextent
+        def bins(ext):
+            b = np.arange(ext[0], ext[1] + self.px_size, self.px_size)
+            return b if len(b) >= 2 else np.array([float(ext[0]), float(ext[0]) + self.px_size])
 
-        return xextent, yextent, zextent
+        return bins(x_hist_ext), bins(y_hist_ext)
 
     def _hist2d(self, em: emitter.EmitterSet, col_vec, x_hist_ext, y_hist_ext, c_range=None):
 
         xy = em.xyz_nm[:, self.plot_axis].numpy()
 
-        hist_bins_x = np.arange(x_hist_ext[0], x_hist_ext[1] + self.px_size, self.px_size)
-        hist_bins_y = np.arange(y_hist_ext[0], y_hist_ext[1] + self.px_size, self.px_size)
+        hist_bins_x, hist_bins_y = self._hist_bins(x_hist_ext, y_hist_ext)
 
         int_hist, _, _ = np.histogram2d(xy[:, 0], xy[:, 1], bins=(hist_bins_x, hist_bins_y))
 
@@ -3,8 +3,10 @@ import decode.simulation.noise_distributions
 import decode.simulation.camera
 import decode.simulation.emitter_generator
 import decode.simulation.psf_kernel
+import decode.simulation.rng
 import decode.simulation.simulator
 import decode.simulation.structure_prior
 
-from decode.simulation.simulator import Simulation
+from decode.simulation.rng import RNGContext
+from decode.simulation.simulator import Simulation, ParallelSimulation
 from decode.simulation.structure_prior import RandomStructure
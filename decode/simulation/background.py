@@ -1,10 +1,11 @@
 from abc import ABC, abstractmethod  # abstract class
 from collections import namedtuple
+from typing import Optional, Sequence, Tuple
 
-import numpy as np
 import torch
 
 from decode.simulation import psf_kernel as psf_kernel
+from decode.simulation.rng import RNGContext
 
 
 class Background(ABC):
@@ -30,6 +31,11 @@ class Background(ABC):
 
         self.sanity_check()
 
+    @property
+    def supports_rng(self) -> bool:
+        """Whether sample can draw from an RNG context"""
+        return True
+
     def sanity_check(self):
         """
         Tests the sanity of the instance.
@@ -40,13 +46,17 @@ class Background(ABC):
                              f"Available modes are: {self._forward_modes}")
 
     @abstractmethod
-    def sample(self, size: torch.Size, device=torch.device('cpu')) -> torch.Tensor:
+    def sample(self, size: torch.Size, device=torch.device('cpu'), rng: Optional[RNGContext] = None,
+               frame_ix: Optional[Sequence[int]] = None) -> torch.Tensor:
         """
         Samples from background implementation in the specified size.
 
         Args:
             size: size of the sample
             device: where to put the data
+            rng: if specified, each frame is sampled from its own generator (stream 'background' and frame index)
+                instead of the global RNG
+            frame_ix: frame indices of the first dimension (required with rng)
 
         Returns:
             background sample
@@ -54,20 +64,26 @@ class Background(ABC):
         """
         raise NotImplementedError
 
-    def sample_like(self, x: torch.Tensor) -> torch.Tensor:
+    def sample_like(self, x: torch.Tensor, rng: Optional[RNGContext] = None,
+                    frame_ix: Optional[Sequence[int]] = None) -> torch.Tensor:
         """
         Samples background in the shape and on the device as the the input.
 
         Args:
             x: input
+            rng: RNG context (see sample)
+            frame_ix: frame indices of the first dimension of x (required with rng)
 
         Returns:
             background sample
 
         """
-        return self.sample(size=x.size(), device=x.device)
+        if rng is None:
+            return self.sample(size=x.size(), device=x.device)
+
+        return self.sample(size=x.size(), device=x.device, rng=rng, frame_ix=frame_ix)
 
-    def forward(self, x: torch.Tensor):
+    def forward(self, x: torch.Tensor, rng: Optional[RNGContext] = None, frame_ix: Optional[Sequence[int]] = None):
         """
         Samples background in the same shape and on the same device as the input x.
         Depending on the 'forward_return' attribute the bg is
@@ -77,13 +93,15 @@ class Background(ABC):
 
         Args:
             x: input frames. Dimension :math:`(N,C,H,W)`
+            rng: RNG context (see sample)
+            frame_ix: frame indices of the first dimension of x (required with rng)
 
         Returns:
             (see above description)
 
         """
 
-        bg = self.sample_like(x)
+        bg = self.sample_like(x, rng=rng, frame_ix=frame_ix)
 
         if self.forward_return == 'like':
             return bg
@@ -104,7 +122,8 @@ class UniformBackground(Background):
 
     """
 
-    def __init__(self, bg_uniform: (float, tuple) = None, bg_sampler=None, forward_return=None):
+    def __init__(self, bg_uniform: (float, tuple) = None, bg_sampler=None, forward_return=None,
+                 bg_sampler_generator: bool = False):
         """
         Adds spatially constant background.
 
@@ -112,6 +131,8 @@ class UniformBackground(Background):
             bg_uniform (float or tuple of floats): background value or background range. If tuple (bg range) the value
                 will be sampled from a random uniform.
             bg_sampler (function): a custom bg sampler function that can take a sample_shape argument
+            bg_sampler_generator: the custom bg sampler takes a generator keyword argument as well. Required in order to
+                sample with an RNG context
 
         """
         super().__init__(forward_return=forward_return)
@@ -119,6 +140,9 @@ class UniformBackground(Background):
         if (bg_uniform is not None) and (bg_sampler is not None):
             raise ValueError("You must either specify bg_uniform XOR a bg_distribution")
 
+        self._bg_uniform = bg_uniform
+        self._bg_sampler_generator = bg_sampler_generator
+
         if bg_sampler is None:
             if isinstance(bg_uniform, (list, tuple)):
                 self._bg_distribution = torch.distributions.uniform.Uniform(*bg_uniform).sample
@@ -132,12 +156,19 @@ class UniformBackground(Background):
     def parse(param):
         return UniformBackground(param.Simulation.bg_uniform)
 
-    def sample(self, size, device=torch.device('cpu')):
+    @property
+    def supports_rng(self) -> bool:
+        return self._bg_uniform is not None or self._bg_sampler_generator
+
+    def sample(self, size, device=torch.device('cpu'), rng=None, frame_ix=None):
 
         assert len(size) in (2, 3, 4), "Not implemented size spec."
 
         # create as many sample as there are batch-dims
-        bg = self._bg_distribution(sample_shape=[size[0]] if len(size) >= 3 else torch.Size([]))
+        if rng is None:
+            bg = self._bg_distribution(sample_shape=[size[0]] if len(size) >= 3 else torch.Size([]))
+        else:
+            bg = self._sample_frames(rng, frame_ix, size[0] if len(size) >= 3 else None)
 
         # unsqueeze until we have enough dimensions
         if len(size) >= 3:
@@ -145,6 +176,30 @@ class UniformBackground(Background):
 
         return bg.to(device) * torch.ones(size, device=device)
 
+    def _sample_frames(self, rng: RNGContext, frame_ix: Sequence[int], n: Optional[int]) -> torch.Tensor:
+        """Background value per frame, each from the generator of its frame index"""
+        if frame_ix is None or len(frame_ix) != (n if n is not None else 1):
+            raise ValueError("Frame indices must be specified per frame (first dimension) when using an RNG context.")
+
+        if self._bg_uniform is None:
+            if not self._bg_sampler_generator:
+                raise ValueError("Sampling with an RNG context requires a custom background sampler that takes a "
+                                 "generator (see bg_sampler_generator).")
+
+            bg = torch.stack([torch.as_tensor(self._bg_distribution(sample_shape=torch.Size([]),
+                                                                    generator=rng.generator('background', ix)))
+                              for ix in frame_ix]).float()
+
+        elif not isinstance(self._bg_uniform, (list, tuple)):
+            bg = self._bg_uniform * torch.ones(len(frame_ix))
+
+        else:
+            low, high = self._bg_uniform
+            bg = torch.tensor([low + (high - low) * torch.rand(1, generator=rng.generator('background', ix)).item()
+                               for ix in frame_ix])
+
+        return bg if n is not None else bg.squeeze(0)
+
 
 def _get_delta_sampler(val: float):
     def delta_sampler(sample_shape) -> float:
@@ -209,7 +264,17 @@ class BgPerEmitterFromBgFrame:
         x_mean = torch.nn.functional.conv2d(self.padding(x), self.kernel, stride=1, padding=0)  # since already padded
         return x_mean
 
-    def forward(self, tar_em, tar_bg):
+    def forward(self, tar_em, tar_bg, bin_ix: Optional[Tuple[torch.Tensor, torch.Tensor]] = None):
+        """
+        Writes the local mean background of the background frames into the emitters' bg attribute.
+
+        Args:
+            tar_em: set of emitters
+            tar_bg: background frames
+            bin_ix: (optional) precomputed bin index of tar_em on the same grid, tar_em must be in px
+                (see decode.neuralfitter.target_generator.UnifiedEmbeddingTarget.bin_index)
+
+        """
 
         if tar_bg.dim() == 3:
             tar_bg = tar_bg.unsqueeze(1)
@@ -220,17 +285,19 @@ class BgPerEmitterFromBgFrame:
         local_mean = self._mean_filter(tar_bg)
 
         """Extract background values at the position where the emitter is and write it"""
-        pos_x = tar_em.xyz[:, 0]
-        pos_y = tar_em.xyz[:, 1]
         bg_frame_ix = (-int(tar_em.frame_ix.min()) + tar_em.frame_ix).long()
 
-        ix_x = torch.from_numpy(np.digitize(pos_x.numpy(), self.bin_x, right=False) - 1)
-        ix_y = torch.from_numpy(np.digitize(pos_y.numpy(), self.bin_y, right=False) - 1)
+        if bin_ix is None:
+            ix_x, ix_y = self.delta_psf.search_bin_index(tar_em.xyz[:, :2], raise_outside=False)
+        else:
+            ix_x, ix_y = bin_ix
 
         """Kill everything that is outside"""
         in_frame = torch.ones_like(ix_x).bool()
         in_frame *= (ix_x >= 0) * (ix_x <= self.img_shape[0] - 1) * (ix_y >= 0) * (ix_y <= self.img_shape[1] - 1)
 
-        tar_em.bg[in_frame] = local_mean[bg_frame_ix[in_frame], 0, ix_x[in_frame], ix_y[in_frame]]
+        bg = tar_em.bg.clone()  # do not write into the storage of a parent set if tar_em is a view
+        bg[in_frame] = local_mean[bg_frame_ix[in_frame], 0, ix_x[in_frame], ix_y[in_frame]]
+        tar_em.bg = bg
 
         return tar_em
@@ -1,17 +1,52 @@
 from abc import ABC, abstractmethod  # abstract class
-from typing import Union
+from typing import Optional, Sequence, Union
 
 import torch
 from deprecated import deprecated
 
 from . import noise_distributions
+from .rng import RNGContext
 from ..neuralfitter import sampling
 
 
+@torch.jit.script
+def _affine_(x: torch.Tensor, scale: float, offset: float) -> torch.Tensor:
+    """In place x * scale + offset"""
+    return x.mul_(scale).add_(offset)
+
+
+@torch.jit.script
+def _adc_(x: torch.Tensor, e_per_adu: float, baseline: float) -> torch.Tensor:
+    """In place analog digital conversion, i.e. max(floor(x / e_per_adu) + baseline, 0)"""
+    return x.div_(e_per_adu).floor_().add_(baseline).clamp_(min=0.)
+
+
+@torch.jit.script
+def _to_photons_(x: torch.Tensor, baseline: float, e_per_adu: float, em_gain: Optional[float], spur: float,
+                 qe: float) -> torch.Tensor:
+    """In place conversion of camera units to the expected photon count"""
+    x.sub_(baseline).mul_(e_per_adu)
+    if em_gain is not None:
+        x.div_(em_gain)
+
+    return x.sub_(spur).div_(qe)
+
+
 class Camera(ABC):
 
     @abstractmethod
-    def forward(self, x: torch.Tensor, device: Union[str, torch.device] = None) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, device: Union[str, torch.device] = None, rng: Optional[RNGContext] = None,
+                frame_ix: Optional[Sequence[int]] = None) -> torch.Tensor:
+        """
+        Forwards frames through the camera.
+
+        Args:
+            x: frames of dimension *, H, W
+            device: device for forward
+            rng: if specified, the noise of each frame is drawn from its own generator (by frame index)
+            frame_ix: frame indices of the first dimension of x (required with rng)
+
+        """
         raise NotImplementedError
 
     @abstractmethod
@@ -69,13 +104,21 @@ class Photon2Camera(Camera):
                f"e_per_adu {self.e_per_adu} | Baseline {self.baseline} | Readnoise {self._read_sigma}\n" + \
                f"Output in Photon units: {self.photon_units}"
 
-    def forward(self, x: torch.Tensor, device: Union[str, torch.device] = None) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, device: Union[str, torch.device] = None, rng: Optional[RNGContext] = None,
+                frame_ix: Optional[Sequence[int]] = None) -> torch.Tensor:
         """
         Forwards frame through camera
 
         Args:
             x: camera frame of dimension *, H, W
             device: device for forward
+            rng: if specified, the noise of each frame is drawn from its own generator (stream 'camera' and frame
+                index) instead of the global RNG, i.e. it does not depend on the other frames of the call
+            frame_ix: frame indices of the first dimension of x (required with rng)
+
+        Note:
+            With rng, the frames are processed one by one (one generator each), which is slower than processing the
+            whole batch at once for small frames, in particular on CUDA (see test_rng.TestComponents for a benchmark).
 
         Returns:
             torch.Tensor
@@ -85,31 +128,85 @@ class Photon2Camera(Camera):
         elif self.device is not None:
             x = x.to(self.device)
 
-        """Clamp input to 0."""
-        x = torch.clamp(x, 0.)
+        forward_impl = self._forward_fused if self._fusable else self._forward_distributions
+
+        if rng is None:
+            camera = forward_impl(x)
+        else:
+            if frame_ix is None or x.dim() < 3 or len(frame_ix) != x.size(0):
+                raise ValueError("Frame indices must be specified per frame (first dimension) when using an RNG "
+                                 "context.")
+
+            camera = torch.empty_like(x)
+            for i, ix in enumerate(frame_ix):
+                camera[i] = forward_impl(x[i], rng.generator('camera', ix, device=x.device))
+
+        if self.photon_units:
+            return self._backward_(camera)
+
+        return camera
+
+    @property
+    def _fusable(self) -> bool:
+        """The fused camera model applies to the built-in noise distributions only (not to subclasses or others)"""
+        return type(self.poisson) is noise_distributions.Poisson and type(self.gain) is noise_distributions.Gamma \
+            and type(self.read) is noise_distributions.Gaussian
+
+    @staticmethod
+    def _sample(dist, x: torch.Tensor, generator: Optional[torch.Generator]) -> torch.Tensor:
+        """Samples a noise distribution, the generator is only passed if specified (custom ones may not take it)"""
+        if generator is None:
+            return dist.forward(x)
 
-        """Poisson for photon characteristics of emitter (plus autofluorescence etc."""
-        camera = self.poisson.forward(x * self.qe + self.spur)
+        return dist.forward(x, generator=generator)
+
+    def _forward_distributions(self, x: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        """Camera model as separate passes through the noise distributions"""
+
+        """Poisson for photon characteristics of emitter (plus autofluorescence etc.), input clamped to 0."""
+        camera = self._sample(self.poisson, torch.clamp(x, min=0.) * self.qe + self.spur, generator)
 
         """Gamma for EM-Gain (EM-CCD cameras, not sCMOS)"""
         if self._em_gain is not None:
-            camera = self.gain.forward(camera)
+            camera = self._sample(self.gain, camera, generator)
 
         """Gaussian for read-noise. Takes camera and adds zero centred gaussian noise."""
-        camera = self.read.forward(camera)
+        camera = self._sample(self.read, camera, generator)
+
+        """Electrons per ADU (floor function), plus manufacturer baseline. Make sure it's not below 0."""
+        return _adc_(camera, float(self.e_per_adu), float(self.baseline))
+
+    def _forward_fused(self, x: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        """
+        Camera model with as few full passes and allocations as possible: the elementwise steps run in place (as
+        scripted kernels), the buffer of the photon rate is reused for the readout noise. Same ops and order as the
+        built-in noise distributions (i.e. identical output for the same RNG state), except that zero readout noise is
+        skipped. For other noise distributions see _forward_distributions.
+        """
 
-        """Electrons per ADU, (floor function)"""
-        camera /= self.e_per_adu
-        camera = camera.floor()
+        """Poisson for photon characteristics of emitter (plus autofluorescence etc.), input clamped to 0."""
+        buf = torch.empty_like(x)
+        torch.clamp(x, min=0., out=buf)
+        camera = torch.poisson(_affine_(buf, float(self.qe), float(self.spur)), generator=generator)
 
-        """Add Manufacturer baseline. Make sure it's not below 0."""
-        camera += self.baseline
-        camera = torch.max(camera, torch.tensor([0.]).to(camera.device))
+        """Gamma for EM-Gain (EM-CCD cameras, not sCMOS), as Gamma.sample"""
+        if self._em_gain is not None:
+            camera = noise_distributions.standard_gamma(camera, generator=generator)
+            camera.div_(1 / self.gain.scale).clamp_(min=torch.finfo(camera.dtype).tiny)
 
-        if self.photon_units:
-            return self.backward(camera, device)
+        """Gaussian for read-noise. Takes camera and adds zero centred gaussian noise."""
+        sigma = self.read.sigma
+        if isinstance(sigma, torch.Tensor) or sigma != 0:
+            camera.add_(buf.normal_(generator=generator).mul_(sigma))
 
-        return camera
+        """Electrons per ADU (floor function), plus manufacturer baseline. Make sure it's not below 0."""
+        return _adc_(camera, float(self.e_per_adu), float(self.baseline))
+
+    def _backward_(self, x: torch.Tensor) -> torch.Tensor:
+        """In place variant of backward"""
+        return _to_photons_(x, float(self.baseline), float(self.e_per_adu),
+                            float(self._em_gain) if self._em_gain is not None else None, float(self.spur),
+                            float(self.qe))
 
     def backward(self, x: torch.Tensor, device: Union[str, torch.device] = None) -> torch.Tensor:
         """
@@ -128,13 +225,7 @@ class Photon2Camera(Camera):
         elif self.device is not None:
             x = x.to(self.device)
 
-        out = (x - self.baseline) * self.e_per_adu
-        if self._em_gain is not None:
-            out /= self._em_gain
-        out -= self.spur
-        out /= self.qe
-
-        return out
+        return self._backward_(x.clone())
 
 
 class PerfectCamera(Photon2Camera):
@@ -219,13 +310,16 @@ class SCMOS(Photon2Camera):
 
         return super().forward(x, device=device), sigma
 
-    def forward(self, x: torch.Tensor, device: Union[str, torch.device] = None) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, device: Union[str, torch.device] = None, rng: Optional[RNGContext] = None,
+                frame_ix: Optional[Sequence[int]] = None) -> torch.Tensor:
         """
         Forwards model input image 'x' through camera.
 
         Args:
             x: model image
             device:
+            rng: RNG context (see Photon2Camera.forward)
+            frame_ix: frame indices of the first dimension of x (required with rng)
 
         Returns:
             Sampled noisy image
@@ -238,4 +332,4 @@ class SCMOS(Photon2Camera):
         else:
             self.read = noise_distributions.Gaussian(self._read_sigma.to(device))
 
-        return super().forward(x, device=device)
+        return super().forward(x, device=device, rng=rng, frame_ix=frame_ix)
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod  # abstract class
+from typing import Optional
 from deprecated import deprecated
 
 import numpy as np
@@ -9,6 +10,13 @@ import decode.generic.emitter
 from . import structure_prior
 
 
+def _sample_poisson(lam: float, generator: Optional[torch.Generator]) -> int:
+    if generator is None:
+        return np.random.poisson(lam=lam)
+
+    return int(torch.poisson(torch.tensor(float(lam), dtype=torch.double), generator=generator).item())
+
+
 class EmitterSampler(ABC):
     """
     Abstract emitter sampler. All implementations / childs must implement a sample method.
@@ -26,7 +34,7 @@ class EmitterSampler(ABC):
         return self.sample()
 
     @abstractmethod
-    def sample(self) -> decode.generic.emitter.EmitterSet:
+    def sample(self, generator: Optional[torch.Generator] = None) -> decode.generic.emitter.EmitterSet:
         raise NotImplementedError
 
 
@@ -74,32 +82,36 @@ class EmitterSamplerFrameIndependent(EmitterSampler):
     def em_avg(self) -> float:
         return self._em_avg
 
-    def sample(self) -> decode.generic.emitter.EmitterSet:
+    def sample(self, generator: Optional[torch.Generator] = None) -> decode.generic.emitter.EmitterSet:
         """
         Sample an EmitterSet.
 
+        Args:
+            generator: random number generator (global torch / numpy RNG if None)
+
         Returns:
             EmitterSet:
 
         """
-        n = np.random.poisson(lam=self._em_avg)
+        n = _sample_poisson(self._em_avg, generator)
 
-        return self.sample_n(n=n)
+        return self.sample_n(n=n, generator=generator)
 
-    def sample_n(self, n: int) -> decode.generic.emitter.EmitterSet:
+    def sample_n(self, n: int, generator: Optional[torch.Generator] = None) -> decode.generic.emitter.EmitterSet:
         """
         Sample 'n' emitters, i.e. the number of emitters is given and is not sampled from the Poisson dist.
 
         Args:
             n: number of emitters
+            generator: random number generator (global if None)
 
         """
 
         if n < 0:
             raise ValueError("Negative number of samples is not well-defined.")
 
-        xyz = self.structure.sample(n)
-        phot = torch.randint(*self.photon_range, (n,))
+        xyz = self.structure.sample(n, generator=generator)
+        phot = torch.randint(*self.photon_range, (n,), generator=generator)
 
         return decode.generic.emitter.EmitterSet(xyz=xyz, phot=phot,
                                                  frame_ix=torch.zeros_like(phot).long(),
@@ -165,46 +177,60 @@ class EmitterSamplerBlinking(EmitterSamplerFrameIndependent):
     def _num_frames_plus(self):
         return self._frame_range_plus[1] - self._frame_range_plus[0] + 1
 
-    def sample(self):
+    def sample(self, generator: Optional[torch.Generator] = None):
         """
         Return sampled EmitterSet in the specified frame range.
 
+        Args:
+            generator: random number generator (global torch / numpy RNG if None)
+
         Returns:
             EmitterSet
 
         """
 
-        n = self.n_sampler(self._emitter_av_total)
+        n = self.n_sampler(self._emitter_av_total) if generator is None else \
+            _sample_poisson(self._emitter_av_total, generator)
 
-        loose_em = self.sample_loose_emitter(n=n)
-        em = loose_em.return_emitterset()
-        em = em.get_subset_frame(*self.frame_range)  # because the simulated frame range is larger
+        loose_em = self.sample_loose_emitter(n=n, generator=generator)
+        em = loose_em.return_emitterset(frame_range=self.frame_range)  # because the simulated frame range is larger
 
         return em
 
     def sample_n(self, *args, **kwargs):
         raise NotImplementedError
 
-    def sample_loose_emitter(self, n) -> decode.generic.emitter.LooseEmitterSet:
+    def sample_loose_emitter(self, n, generator: Optional[torch.Generator] = None) \
+            -> decode.generic.emitter.LooseEmitterSet:
         """
         Generate loose EmitterSet. Loose emitters are emitters that are not yet binned to frames.
 
         Args:
             n: number of 'loose' emitters
+            generator: random number generator (global if None)
 
         Returns:
             LooseEmitterSet
 
         """
 
-        xyz = self.structure.sample(n)
+        xyz = self.structure.sample(n, generator=generator)
 
         """Draw from intensity distribution but clamp the value so as not to fall below 0."""
-        intensity = torch.clamp(self.intensity_dist.sample((n,)), self.intensity_th)
+        if generator is None:
+            intensity = self.intensity_dist.sample((n,))
+        else:  # torch.distributions do not take a generator
+            intensity = self.intensity_mu_sig[0] + self.intensity_mu_sig[1] * torch.randn(n, generator=generator)
+        intensity = torch.clamp(intensity, self.intensity_th)
 
         """Distribute emitters in time. Increase the range a bit."""
-        t0 = self.t0_dist.sample((n,))
-        ontime = self.lifetime_dist.rsample((n,))
+        if generator is None:
+            t0 = self.t0_dist.sample((n,))
+            ontime = self.lifetime_dist.rsample((n,))
+        else:
+            low, high = self._frame_range_plus
+            t0 = low + (high - low) * torch.rand(n, generator=generator)
+            ontime = torch.empty(n).exponential_(1 / self.lifetime_avg, generator=generator)
 
         return decode.generic.emitter.LooseEmitterSet(xyz, intensity, ontime, t0, id=torch.arange(n).long(),
                                                       xy_unit=self.xy_unit, px_size=self.px_size)
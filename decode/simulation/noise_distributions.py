@@ -1,7 +1,31 @@
 from abc import ABC, abstractmethod  # abstract class
+from typing import Optional
+
 import torch
 
 
+def standard_gamma(concentration: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    """
+    Samples the Gamma distribution of rate 1, optionally from a specific generator.
+
+    Note:
+        torch has no public Gamma sampler that takes a generator. With a generator, this wraps the private
+        torch._standard_gamma (which torch.distributions.Gamma.sample calls as well) and raises a RuntimeError if the
+        installed torch version does not provide it. Without a generator, torch.distributions.Gamma is used.
+
+    """
+    if generator is None:
+        return torch.distributions.gamma.Gamma(concentration, torch.ones_like(concentration),
+                                               validate_args=False).sample()
+
+    if not hasattr(torch, '_standard_gamma'):
+        raise RuntimeError("Sampling the Gamma distribution from a specific generator requires "
+                           "torch._standard_gamma, which is not available in this torch version. "
+                           "Sample without a generator instead.")
+
+    return torch._standard_gamma(concentration, generator=generator)
+
+
 class NoiseDistribution(ABC):
     """
     Abstract noise.
@@ -11,12 +35,13 @@ class NoiseDistribution(ABC):
         super().__init__()
 
     @abstractmethod
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
         """
         Samples the noise distribution based on the input x.
 
         Args:
             x: input
+            generator: random number generator on the device of x (global if None)
 
         Returns:
             noisy sample
@@ -32,7 +57,7 @@ class ZeroNoise(NoiseDistribution):
     def __init__(self):
         super().__init__()
 
-    def forward(self, x):
+    def forward(self, x, generator=None):
         return x
 
 
@@ -54,7 +79,10 @@ class Gamma(NoiseDistribution):
         super().__init__()
         self.scale = scale
 
-    def forward(self, x):
+    def forward(self, x, generator=None):
+        if generator is not None:  # as Gamma.sample, which does not take a generator
+            return (standard_gamma(x, generator) * self.scale).clamp_(min=torch.finfo(x.dtype).tiny)
+
         # disable validate_args because 0 is okay for sampling
         return torch.distributions.gamma.Gamma(x, 1 / self.scale, validate_args=False).sample()
 
@@ -76,7 +104,10 @@ class Gaussian(NoiseDistribution):
         super().__init__()
         self.sigma = sigma
 
-    def forward(self, x):
+    def forward(self, x, generator=None):
+        if generator is not None:
+            return x + self.sigma * torch.randn(x.size(), generator=generator, dtype=x.dtype, device=x.device)
+
         return x + self.sigma * torch.randn_like(x)
 
 
@@ -88,6 +119,9 @@ class Poisson(NoiseDistribution):
     def __init__(self):
         super().__init__()
 
-    def forward(self, x):
+    def forward(self, x, generator=None):
+        if generator is not None:
+            return torch.poisson(x, generator=generator)
+
         # disable validate_args because 0 is okay for sampling
         return torch.distributions.poisson.Poisson(x, validate_args=False).sample()
@@ -0,0 +1,248 @@
+"""
+Throughput benchmark of the PSF implementations (frames/s and emitters/s of forward, emitters/s of the CRLB) across
+emitter densities, image sizes and z extents. Results are stored as JSON and can be compared against a baseline file,
+in order to catch performance regressions of psf_kernel.
+
+Example:
+    python -m decode.simulation.psf_benchmark -o psf_bench.json -b psf_bench_baseline.json -c calib.mat
+
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import torch
+
+from . import psf_kernel
+
+
+def _extent(img_size: int) -> Tuple[float, float]:
+    return -0.5, img_size - 0.5
+
+
+def _psf_factories(calibration_file: Optional[str] = None) -> Dict[str, Callable[[int, Tuple[float, float]],
+                                                                                 psf_kernel.PSF]]:
+    """PSF constructors by name, arguments are the image size (px) and the z extent (nm)."""
+    factories = {
+        'DeltaPSF': lambda img_size, z_extent: psf_kernel.DeltaPSF(
+            _extent(img_size), _extent(img_size), (img_size, img_size)),
+        'GaussianPSF': lambda img_size, z_extent: psf_kernel.GaussianPSF(
+            _extent(img_size), _extent(img_size), z_extent, (img_size, img_size), sigma_0=1.5, roi_radius=12),
+    }
+
+    if calibration_file is not None:
+        import decode.utils.calibration_io  # not at module level, only needed for the spline
+
+        calib = decode.utils.calibration_io.SMAPSplineCoefficient(calib_file=calibration_file)
+        factories['CubicSplinePSF'] = lambda img_size, z_extent: calib.init_spline(
+            _extent(img_size), _extent(img_size), (img_size, img_size), device='cpu', roi_size=(26, 26))
+
+    return factories
+
+
+def _random_emitters(n: int, n_frames: int, img_size: int, z_extent: Tuple[float, float]):
+    xyz = torch.rand(n, 3) * torch.tensor([img_size, img_size, z_extent[1] - z_extent[0]]) + \
+        torch.tensor([-0.5, -0.5, z_extent[0]])
+    phot = torch.ones(n) * 1000.
+    bg = torch.ones(n) * 10.
+    frame_ix = torch.randint(n_frames, size=(n,))
+
+    return xyz, phot, bg, frame_ix
+
+
+def _best_time(fn: Callable, repeats: int) -> float:
+    """Minimum wall time of repeated calls, after one warm up call"""
+    fn()
+
+    t = float('inf')
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        t = min(t, time.perf_counter() - t0)
+
+    return t
+
+
+def benchmark_forward(psf: psf_kernel.PSF, density: int, n_frames: int, img_size: int,
+                      z_extent: Tuple[float, float], repeats: int = 3) -> Dict[str, float]:
+    """
+    Measures the forward throughput of a PSF.
+
+    Args:
+        psf: PSF instance
+        density: emitters per frame
+        n_frames: number of frames
+        img_size: image size the PSF was constructed with
+        z_extent: z range of the emitters
+        repeats: number of timed calls (best is taken)
+
+    Returns:
+        dict with frames_per_s and emitters_per_s
+
+    """
+    xyz, phot, _, frame_ix = _random_emitters(density * n_frames, n_frames, img_size, z_extent)
+    t = _best_time(lambda: psf.forward(xyz, phot, frame_ix, 0, n_frames - 1), repeats)
+
+    return {'frames_per_s': n_frames / t, 'emitters_per_s': density * n_frames / t}
+
+
+def benchmark_crlb(psf: psf_kernel.CubicSplinePSF, n: int, img_size: int, z_extent: Tuple[float, float],
+                   repeats: int = 3) -> Dict[str, float]:
+    """
+    Measures the (chunked) CRLB throughput of a PSF.
+
+    Returns:
+        dict with emitters_per_s
+
+    """
+    xyz, phot, bg, _ = _random_emitters(n, 1, img_size, z_extent)
+    t = _best_time(lambda: psf.crlb_chunked(xyz, phot, bg), repeats)
+
+    return {'emitters_per_s': n / t}
+
+
+def run_suite(calibration_file: Optional[str] = None, psfs: Optional[List[str]] = None,
+              img_sizes: Tuple[int, ...] = (32, 64, 128), densities: Tuple[int, ...] = (10, 100, 1000),
+              z_extents: Tuple[Tuple[float, float], ...] = ((0., 0.), (-500., 500.)), n_frames: int = 20,
+              n_crlb: int = 1000, repeats: int = 3) -> dict:
+    """
+    Runs the benchmark for all combinations of PSF, image size, emitter density and z extent.
+
+    Args:
+        calibration_file: spline calibration, CubicSplinePSF and CRLB are skipped if not specified
+        psfs: names of the PSFs to benchmark (default all available)
+        img_sizes: image sizes (square) in px
+        densities: emitters per frame
+        z_extents: z ranges of the emitters in nm
+        n_frames: frames per forward
+        n_crlb: emitters of the CRLB benchmark
+        repeats: timed calls per case
+
+    Returns:
+        results, i.e. dict of meta information and the results per case (key PSF/img_size/density/z_extent)
+
+    """
+    factories = _psf_factories(calibration_file)
+    if psfs is not None:
+        if not set(psfs) <= set(factories.keys()):
+            raise ValueError(f"Unknown or unavailable PSFs {set(psfs) - set(factories.keys())}, "
+                             f"available are {list(factories.keys())}.")
+        factories = {k: v for k, v in factories.items() if k in psfs}
+
+    cases = {}
+    for name, factory in factories.items():
+        for img_size in img_sizes:
+            for z_extent in z_extents:
+                psf = factory(img_size, z_extent)
+
+                for density in densities:
+                    key = f"{name}/img{img_size}/dens{density}/z{z_extent[0]:g}_{z_extent[1]:g}"
+                    cases[key] = benchmark_forward(psf, density, n_frames, img_size, z_extent, repeats)
+
+                if isinstance(psf, psf_kernel.CubicSplinePSF):
+                    key = f"{name}.crlb/img{img_size}/z{z_extent[0]:g}_{z_extent[1]:g}"
+                    cases[key] = benchmark_crlb(psf, n_crlb, img_size, z_extent, repeats)
+
+    meta = {
+        'date': datetime.datetime.now().isoformat(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+    }
+
+    return {'meta': meta, 'cases': cases}
+
+
+def save_results(results: dict, path: Union[str, Path]):
+    with Path(path).open('w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: Union[str, Path]) -> dict:
+    with Path(path).open() as f:
+        return json.load(f)
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> List[dict]:
+    """
+    Compares results against a baseline. A case regressed if any of its throughputs is below (1 - tolerance) times
+    the baseline. Cases that are not in both are ignored.
+
+    Args:
+        results: benchmark results (see run_suite)
+        baseline: baseline results
+        tolerance: relative throughput loss that is accepted (e.g. to account for noise of the measurement)
+
+    Returns:
+        list of regressions (dict with case, metric, value, baseline and ratio)
+
+    """
+    regressions = []
+    for case, metrics in results['cases'].items():
+        if case not in baseline['cases']:
+            continue
+
+        for metric, value in metrics.items():
+            ref = baseline['cases'][case].get(metric)
+            if ref is not None and value < (1 - tolerance) * ref:
+                regressions.append({'case': case, 'metric': metric, 'value': value, 'baseline': ref,
+                                    'ratio': value / ref})
+
+    return regressions
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='PSF throughput benchmark.')
+
+    parser.add_argument('-o', '--output', default=None,
+                        help='Specify the JSON file the results are written to.',
+                        type=str, required=False)
+
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='Specify a baseline JSON file to compare against. Exits with 1 upon regression.',
+                        type=str, required=False)
+
+    parser.add_argument('-t', '--tolerance', default=0.2,
+                        help='Relative throughput loss that is not considered a regression.',
+                        type=float, required=False)
+
+    parser.add_argument('-c', '--calibration_file', default=None,
+                        help='Specify a spline calibration file to include CubicSplinePSF and CRLB.',
+                        type=str, required=False)
+
+    parser.add_argument('-r', '--repeats', default=3,
+                        help='Number of timed calls per case.',
+                        type=int, required=False)
+
+    return parser.parse_args(args)
+
+
+def main(args=None) -> int:
+    args = parse_args(args)
+
+    results = run_suite(calibration_file=args.calibration_file, repeats=args.repeats)
+    for case, metrics in results['cases'].items():
+        print(f"{case}: " + ", ".join(f"{k} {v:.4g}" for k, v in metrics.items()))
+
+    if args.output is not None:
+        save_results(results, args.output)
+
+    if args.baseline is None:
+        return 0
+
+    regressions = compare(results, load_results(args.baseline), args.tolerance)
+    for r in regressions:
+        print(f"Regression {r['case']} {r['metric']}: {r['value']:.4g} vs. baseline {r['baseline']:.4g} "
+              f"({r['ratio']:.2f}x).")
+
+    return 1 if len(regressions) >= 1 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,16 @@
+import concurrent.futures
 import math
 import warnings
 from abc import ABC, abstractmethod
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 
 import numpy as np
 import spline  # cubic spline implementation
 import torch
+import torch.fft
 
-from decode.generic import slicing as gutil
 import decode.generic.utils
+import decode.utils.cache
 
 
 class PSF(ABC):
@@ -45,6 +47,29 @@ class PSF(ABC):
     def crlb(self, *args, **kwargs):
         raise NotImplementedError
 
+    def crlb_chunked(self, xyz: torch.Tensor, phot: torch.Tensor, bg: torch.Tensor, out: torch.Tensor = None,
+                     **kwargs) -> torch.Tensor:
+        """
+        Computes the Cramer-Rao bound and writes it into a (preallocated) output. Implementations may overwrite this
+        with a memory bounded variant, the default falls back to crlb.
+
+        Args:
+            xyz:
+            phot:
+            bg:
+            out: output of size N x N_par, allocated if None
+            **kwargs: passed on to crlb
+
+        Returns:
+            crlb (torch.Tensor): Cramer-Rao-Lower Bound. Dimension N x N_par
+        """
+        crlb, _ = self.crlb(xyz, phot, bg, **kwargs)
+        if out is None:
+            return crlb
+
+        out[:] = crlb
+        return out
+
     @abstractmethod
     def forward(self, xyz: torch.Tensor, weight: torch.Tensor, frame_ix: torch.Tensor, ix_low: int, ix_high: int):
         """
@@ -91,6 +116,93 @@ class PSF(ABC):
     def _forward_single_frame(self, xyz: torch.Tensor, weight: torch.Tensor):
         raise NotImplementedError
 
+    @staticmethod
+    def _sort_frames(xyz: torch.Tensor, weight: Optional[torch.Tensor], frame_ix: torch.Tensor, ix_low: int,
+                     ix_high: int):
+        """
+        Sorts the emitters by frame index (skipped if already sorted) and restricts them to the frame range.
+
+        Returns:
+            xyz, weight, frame_ix (shifted to start at 0) of the emitters in the frame range and CSR offsets of size
+            F + 1, i.e. the emitters of frame i are [offsets[i]:offsets[i + 1]]
+        """
+        frame_ix = frame_ix.long()
+        if len(frame_ix) >= 2 and not (frame_ix[1:] >= frame_ix[:-1]).all():
+            frame_ix, order = frame_ix.sort()
+            xyz = xyz[order]
+            weight = weight[order] if weight is not None else None
+
+        offsets = torch.searchsorted(frame_ix, torch.arange(ix_low, ix_high + 2, device=frame_ix.device))
+        start, stop = offsets[0].item(), offsets[-1].item()
+
+        xyz = xyz[start:stop]
+        weight = weight[start:stop] if weight is not None else None
+
+        return xyz, weight, frame_ix[start:stop] - ix_low, offsets - start
+
+    def _forward_batched(self, xyz: torch.Tensor, weight: torch.Tensor, frame_ix: torch.Tensor,
+                         ix_low: int, ix_high: int):
+        """
+        Batched forward protocol. The emitters are sorted by frame once, the frames are preallocated and the
+        implementation writes into them (see _write_frames). To be called after PSF.forward.
+
+        Example::
+            >>> xyz, weight, frame_ix, ix_low, ix_high = super().forward(xyz, weight, frame_ix, ix_low, ix_high)
+            >>> return self._forward_batched(xyz, weight, frame_ix, ix_low, ix_high)
+
+        Args:
+            xyz: coordinates of size N x (2 or 3)
+            weight: photon value
+            frame_ix: frame index
+            ix_low (int): lower frame_index
+            ix_high (int): upper frame_index
+
+        Returns:
+            frames (torch.Tensor): F x H x W
+        """
+        xyz, weight, frame_ix, offsets = self._sort_frames(xyz, weight, frame_ix, ix_low, ix_high)
+
+        frames = torch.zeros((ix_high - ix_low + 1, *self.img_shape), device=xyz.device)
+        self._write_frames(frames, xyz, weight, frame_ix, offsets)
+
+        return frames
+
+    def _write_frames(self, frames: torch.Tensor, xyz: torch.Tensor, weight: Optional[torch.Tensor],
+                      frame_ix: torch.Tensor, offsets: torch.Tensor):
+        """
+        Writes the emitters into the preallocated (zero) frames. Implementations with a natively batched forward
+        override this, the default evaluates the single frame implementation per frame.
+
+        Args:
+            frames: zero initialised frames of size F x H x W
+            xyz: coordinates sorted by frame of size N x (2 or 3)
+            weight: photon value sorted by frame or None
+            frame_ix: sorted frame index in [0, F)
+            offsets: CSR offsets of size F + 1, the emitters of frame i are [offsets[i]:offsets[i + 1]]
+        """
+        for i, (start, stop) in enumerate(zip(offsets[:-1].tolist(), offsets[1:].tolist())):
+            frames[i] = self._forward_single_frame(xyz[start:stop], weight[start:stop] if weight is not None else None)
+
+    @staticmethod
+    def _add_rois(frames: torch.Tensor, frame_ix: torch.Tensor, ix_x: torch.Tensor, ix_y: torch.Tensor,
+                  rois: torch.Tensor):
+        """
+        Scatter-adds ROIs into the frames. Pixels of the ROIs outside the frames are dropped.
+
+        Args:
+            frames: frames of size F x H x W (contiguous)
+            frame_ix: frame index of the ROIs of size N
+            ix_x: pixel index in x of the rows of the ROIs of size N x h
+            ix_y: pixel index in y of the columns of the ROIs of size N x w
+            rois: ROIs of size N x h x w
+        """
+        h, w = frames.size(-2), frames.size(-1)
+
+        inside = ((ix_x >= 0) * (ix_x < h)).unsqueeze(2) * ((ix_y >= 0) * (ix_y < w)).unsqueeze(1)
+        ix = (frame_ix.long().view(-1, 1, 1) * h + ix_x.unsqueeze(2)) * w + ix_y.unsqueeze(1)
+
+        frames.view(-1).index_add_(0, ix[inside], rois[inside].type_as(frames))
+
     def _forward_single_frame_wrapper(self, xyz: torch.Tensor, weight: torch.Tensor, frame_ix: torch.Tensor,
                                       ix_low: int, ix_high: int):
         """
@@ -108,12 +220,15 @@ class PSF(ABC):
         Returns:
             frames (torch.Tensor): N x H x W, stacked frames
         """
-        ix_split, n_splits = gutil.ix_split(frame_ix, ix_min=ix_low, ix_max=ix_high)
-        if weight is not None:
-            frames = [self._forward_single_frame(xyz[ix_split[i]], weight[ix_split[i]]) for i in range(n_splits)]
-        else:
-            frames = [self._forward_single_frame(xyz[ix_split[i]], None) for i in range(n_splits)]
-        frames = torch.stack(frames, 0)
+        # sort once and slice instead of masking per frame
+        xyz, weight, frame_ix, offsets = self._sort_frames(xyz, weight, frame_ix, ix_low, ix_high)
+
+        frames = None  # the frame size is only known after the first frame
+        for i, (start, stop) in enumerate(zip(offsets[:-1].tolist(), offsets[1:].tolist())):
+            frame = self._forward_single_frame(xyz[start:stop], weight[start:stop] if weight is not None else None)
+            if frames is None:
+                frames = frame.new_zeros((len(offsets) - 1, *frame.size()))
+            frames[i] = frame
 
         return frames
 
@@ -130,13 +245,11 @@ class DeltaPSF(PSF):
     def __init__(self, xextent, yextent, img_shape):
         super().__init__(xextent=xextent, yextent=yextent, img_shape=img_shape)
 
-        from decode.generic.process import RemoveOutOfFOV
-
-        self._fov_filter = RemoveOutOfFOV(xextent=self.xextent, yextent=self.yextent, zextent=None)
-
         self._bin_x, self._bin_y, self._bin_ctr_x, self._bin_ctr_y = \
             decode.generic.utils.frame_grid(img_shape, xextent, yextent)
 
+        self._bin_edges_device = {}
+
     @property
     def bin_ctr_x(self):
         """
@@ -151,6 +264,21 @@ class DeltaPSF(PSF):
         """
         return self._bin_ctr_y
 
+    def _bin_edges(self, device: torch.device) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Bin edges on the specified device, transferred once per device"""
+        if device not in self._bin_edges_device:
+            self._bin_edges_device[device] = (self._bin_x.to(device), self._bin_y.to(device))
+
+        return self._bin_edges_device[device]
+
+    def _bin_index(self, xy: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Bin index of x and y by bucketize against the bin edges"""
+        bin_x, bin_y = self._bin_edges(xy.device)
+        x_ix = torch.bucketize(xy[:, 0].to(bin_x.dtype).contiguous(), bin_x, right=True) - 1
+        y_ix = torch.bucketize(xy[:, 1].to(bin_y.dtype).contiguous(), bin_y, right=True) - 1
+
+        return x_ix, y_ix
+
     def search_bin_index(self, xy: torch.Tensor, raise_outside: bool = True):
         """
         Returns the index of the bin in question, x ix and y ix.
@@ -163,8 +291,7 @@ class DeltaPSF(PSF):
 
         """
 
-        x_ix = np.searchsorted(self._bin_x, xy[:, 0], side='right') - 1
-        y_ix = np.searchsorted(self._bin_y, xy[:, 1], side='right') - 1
+        x_ix, y_ix = self._bin_index(xy)
 
         if raise_outside:
             if (~((x_ix >= 0) * (x_ix <= len(self._bin_x) - 2) *
@@ -193,17 +320,23 @@ class DeltaPSF(PSF):
 
         xyz, weight, frame_ix, ix_low, ix_high = super().forward(xyz, weight, frame_ix, ix_low, ix_high)
 
-        """Remove Emitters that are out of the frame"""
-        mask = self._fov_filter.clean_emitter(xyz)
+        """The scatter does not depend on the frame order, hence the emitters are not sorted (cf. _forward_batched)"""
+        frames = torch.zeros((ix_high - ix_low + 1, *self.img_shape), device=xyz.device)
+        self._write_frames(frames, xyz, weight, frame_ix, None)
 
-        x_ix, y_ix = self.search_bin_index(xyz[mask], raise_outside=True)
-        n_ix = frame_ix[mask].long()
+        return frames
 
-        """Generate frames"""
-        frames = torch.zeros((ix_high - ix_low + 1, *self.img_shape))
-        frames[n_ix, x_ix, y_ix] = weight[mask]
+    def _write_frames(self, frames: torch.Tensor, xyz: torch.Tensor, weight: torch.Tensor, frame_ix: torch.Tensor,
+                      offsets: Optional[torch.Tensor]):
+        """
+        Batched implementation, writes all emitters at once. One bucketize per axis, one flat index into the frames
+        and one index_put_. Emitters outside of the frame are those whose bin index is out of range.
+        """
+        x_ix, y_ix = self.search_bin_index(xyz[:, :2], raise_outside=False)
+        inside = (x_ix >= 0) * (x_ix < self.img_shape[0]) * (y_ix >= 0) * (y_ix < self.img_shape[1])
 
-        return frames
+        ix_flat = (frame_ix.long().to(frames.device) * self.img_shape[0] + x_ix) * self.img_shape[1] + y_ix
+        frames.view(-1).index_put_((ix_flat[inside],), weight[inside].to(frames))
 
 
 class GaussianPSF(PSF):
@@ -212,7 +345,8 @@ class GaussianPSF(PSF):
 
     """
 
-    def __init__(self, xextent: Tuple[float, float], yextent, zextent, img_shape, sigma_0, peak_weight=False):
+    def __init__(self, xextent: Tuple[float, float], yextent, zextent, img_shape, sigma_0, peak_weight=False,
+                 roi_radius: Optional[int] = None):
         """
         Init of Gaussian Expect. If no z extent is provided we assume 2D PSF.
 
@@ -223,11 +357,19 @@ class GaussianPSF(PSF):
             img_shape: (tuple) img shape
             sigma_0: sigma in focus in px
             peak_weight: (bool) if true: use peak intensity instead of integral under the curve
+            roi_radius: (int, optional) if specified, each emitter is only evaluated on the (2 roi_radius + 1)^2 pixels
+                around the pixel it is located in instead of on the full frame. The PSF is truncated outside the ROI,
+                i.e. the radius should be a couple of (astigmatic) sigmas
         """
         super().__init__(xextent=xextent, yextent=yextent, zextent=zextent, img_shape=img_shape)
 
         self.sigma_0 = sigma_0
         self.peak_weight = peak_weight
+        self.roi_radius = roi_radius
+        self._max_outer_elements = 2 ** 24  # pixel values evaluated at once in the batched forward
+
+        if self.roi_radius is not None and self.roi_radius < 0:
+            raise ValueError("ROI radius must not be negative.")
 
     @staticmethod
     def astigmatism(z, sigma_0=1.00, foc_shift=250, rl_range=280.0):
@@ -317,8 +459,58 @@ class GaussianPSF(PSF):
             frames (torch.Tensor): frames of size N x H x W where N is the batch dimension.
         """
         xyz, weight, frame_ix, ix_low, ix_high = super().forward(xyz, weight, frame_ix, ix_low, ix_high)
-        return self._forward_single_frame_wrapper(xyz=xyz, weight=weight, frame_ix=frame_ix,
-                                                  ix_low=ix_low, ix_high=ix_high)
+        return self._forward_batched(xyz, weight, frame_ix, ix_low, ix_high)
+
+    def _write_frames(self, frames: torch.Tensor, xyz: torch.Tensor, weight: Optional[torch.Tensor],
+                      frame_ix: torch.Tensor, offsets: torch.Tensor):
+        """
+        Batched implementation for all frames at once. The PSF is separable, hence per emitter only two 1D erf
+        differences over the pixels in x and y are evaluated and their outer product is scatter-added into the frames.
+        Without ROI these are all pixels of the frame, with ROI only the (2 roi_radius + 1) pixels around the pixel the
+        emitter is located in, i.e. O(N roi^2) instead of O(N H W).
+        """
+        h, w = self.img_shape
+        if len(xyz) == 0:
+            return
+
+        xyz = xyz.float()
+        weight = weight.type_as(xyz) if weight is not None else torch.ones_like(xyz[:, 0])
+
+        if self.zextent is not None:
+            sig = self.astigmatism(xyz[:, 2], sigma_0=self.sigma_0)
+            sig_x, sig_y = sig[:, [0]], sig[:, [1]]
+        else:
+            sig_x = sig_y = torch.full_like(xyz[:, [0]], self.sigma_0)
+
+        amp = weight / 4
+        if self.peak_weight:
+            amp = amp * 2 * math.pi * sig_x.squeeze(1) * sig_y.squeeze(1)
+
+        """Pixel indices (N x pixels) on which each emitter is evaluated"""
+        px_x = (self.xextent[1] - self.xextent[0]) / h
+        px_y = (self.yextent[1] - self.yextent[0]) / w
+        if self.roi_radius is not None:
+            offset = torch.arange(-self.roi_radius, self.roi_radius + 1, device=xyz.device)
+            ix_x = ((xyz[:, [0]] - self.xextent[0]) / px_x).floor().long() + offset
+            ix_y = ((xyz[:, [1]] - self.yextent[0]) / px_y).floor().long() + offset
+        else:
+            ix_x = torch.arange(h, device=xyz.device).expand(len(xyz), -1)
+            ix_y = torch.arange(w, device=xyz.device).expand(len(xyz), -1)
+
+        """Separable integrals over the pixels"""
+        edge_x = self.xextent[0] + ix_x.type_as(xyz) * px_x - xyz[:, [0]]
+        edge_y = self.yextent[0] + ix_y.type_as(xyz) * px_y - xyz[:, [1]]
+        gauss_x = torch.erf((edge_x + px_x) / (math.sqrt(2) * sig_x)) - torch.erf(edge_x / (math.sqrt(2) * sig_x))
+        gauss_y = torch.erf((edge_y + px_y) / (math.sqrt(2) * sig_y)) - torch.erf(edge_y / (math.sqrt(2) * sig_y))
+
+        gauss_x = gauss_x * amp.unsqueeze(1)
+
+        """Scatter the outer products into the frames, in chunks of emitters to bound the memory"""
+        chunk = max(1, self._max_outer_elements // (ix_x.size(1) * ix_y.size(1)))
+        for i in range(0, len(xyz), chunk):
+            sl = slice(i, i + chunk)
+            rois = gauss_x[sl].unsqueeze(2) * gauss_y[sl].unsqueeze(1)
+            self._add_rois(frames, frame_ix[sl], ix_x[sl], ix_y[sl], rois)
 
 
 class CubicSplinePSF(PSF):
@@ -331,7 +523,8 @@ class CubicSplinePSF(PSF):
 
     def __init__(self, xextent, yextent, img_shape, ref0, coeff, vx_size,
                  *, roi_size: (None, tuple) = None, ref_re: (None, torch.Tensor, tuple) = None,
-                 roi_auto_center: bool = False, device: str = 'cuda:0', max_roi_chunk: int = 500000):
+                 roi_auto_center: bool = False, device: str = 'cuda:0', max_roi_chunk: int = 500000,
+                 cache_dir=None, coeff_key: Optional[str] = None, n_threads: int = 1):
         """
         Initialise Spline PSF
 
@@ -347,6 +540,14 @@ class CubicSplinePSF(PSF):
             device: specify the device for the implementation to run on. Must be like ('cpu', 'cuda', 'cuda:1')
             max_roi_chunk (int): max number of rois to be processed at a time via the cuda kernel. If you run into
                 memory allocation errors, decrease this number or free some space on your CUDA device.
+            cache_dir: (optional) directory of a content addressed cache of the coefficients (keyed by coefficients,
+                vx_size, roi_size and extent). The coefficients are then memory mapped from the cache and unpickled
+                instances (e.g. in DataLoader workers) attach to the cache file instead of receiving a copy
+            coeff_key: (optional) key identifying the coefficients in the cache, e.g. the hash of the calibration file.
+                If None, the coefficients are hashed by content
+            n_threads (int): number of threads of the CPU implementation. forward splits the frames and derivative
+                the emitters in chunks that are computed in parallel by the (stateless) spline implementation. This
+                scales if the native calls release the GIL
         """
         super().__init__(xextent=xextent, yextent=yextent, zextent=None, img_shape=img_shape)
 
@@ -365,9 +566,39 @@ class CubicSplinePSF(PSF):
         self._device, self._device_ix = decode.utils.hardware._specific_device_by_str(device)
         self.max_roi_chunk = max_roi_chunk
 
+        if n_threads < 1:
+            raise ValueError("Number of threads must be positive.")
+        self.n_threads = n_threads
+        self._thread_pool = None  # created upon first use
+
+        self._cache_dir = cache_dir
+        self._coeff_key = coeff_key
+        self._coeff_file = None
+        if cache_dir is not None:
+            self._attach_coeff_cache(cache_dir)
+
         self._init_spline_impl()
         self.sanity_check()
 
+    def _attach_coeff_cache(self, cache_dir):
+        """
+        Stores the coefficients in the cache (if not present yet) and replaces them by a memory map of the entry. The
+        coefficients are hashed only if no key is given. The key is kept, so that copies (see cpu, cuda) do not hash
+        them again.
+        """
+        cache = decode.utils.cache.DiskCache(cache_dir)
+        if self._coeff_key is None:
+            self._coeff_key = decode.utils.cache.hash_key(self._coeff)
+
+        key = decode.utils.cache.hash_key('cubic_spline', self._coeff_key, self.vx_size, tuple(self.roi_size_px),
+                                          self.xextent, self.yextent)
+
+        if not cache.has_array(key):
+            cache.save_array(key, self._coeff.numpy())
+
+        self._coeff = torch.from_numpy(cache.load_array(key))
+        self._coeff_file = cache.array_file(key)
+
     def _shift_ref(self, ref_re, auto_center):
 
         if ref_re is not None and auto_center:
@@ -460,6 +691,17 @@ class CubicSplinePSF(PSF):
         # over 5 because 5 derivatives, over 2 because you return drv and roi
         return self.max_roi_chunk // (5 * 2)
 
+    @property
+    def _threaded(self) -> bool:
+        return self._device == 'cpu' and self.n_threads > 1
+
+    @property
+    def _pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = concurrent.futures.ThreadPoolExecutor(self.n_threads)
+
+        return self._thread_pool
+
     """Pickle"""
     def __getstate__(self):
         """
@@ -472,6 +714,12 @@ class CubicSplinePSF(PSF):
 
         self_no_impl = dict(self.__dict__)
         del self_no_impl['_spline_impl']
+        self_no_impl['_thread_pool'] = None
+
+        # cached coefficients are re-attached from the cache file instead of being pickled
+        if self._coeff_file is not None:
+            self_no_impl['_coeff'] = None
+
         return self_no_impl
 
     def __setstate__(self, state):
@@ -485,6 +733,15 @@ class CubicSplinePSF(PSF):
 
         """
         self.__dict__ = state
+        self.__dict__.setdefault('_cache_dir', None)
+        self.__dict__.setdefault('_coeff_file', None)
+        self.__dict__.setdefault('_coeff_key', None)
+        self.__dict__.setdefault('n_threads', 1)
+        self.__dict__.setdefault('_thread_pool', None)
+
+        if self._coeff is None:
+            self._coeff = torch.from_numpy(decode.utils.cache.load_array_mmap(self._coeff_file))
+
         self._init_spline_impl()
 
     def cuda(self, ix: int = 0):
@@ -502,7 +759,8 @@ class CubicSplinePSF(PSF):
             return self
 
         return CubicSplinePSF(xextent=self.xextent, yextent=self.yextent, img_shape=self.img_shape, ref0=self.ref0,
-                              coeff=self._coeff, vx_size=self.vx_size, roi_size=self.roi_size_px, device=f'cuda:{ix}')
+                              coeff=self._coeff, vx_size=self.vx_size, roi_size=self.roi_size_px, device=f'cuda:{ix}',
+                              cache_dir=self._cache_dir, coeff_key=self._coeff_key, n_threads=self.n_threads)
 
     def cpu(self):
         """
@@ -516,7 +774,8 @@ class CubicSplinePSF(PSF):
             return self
 
         return CubicSplinePSF(xextent=self.xextent, yextent=self.yextent, img_shape=self.img_shape, ref0=self.ref0,
-                              coeff=self._coeff, vx_size=self.vx_size, roi_size=self.roi_size_px, device='cpu')
+                              coeff=self._coeff, vx_size=self.vx_size, roi_size=self.roi_size_px, device='cpu',
+                              cache_dir=self._cache_dir, coeff_key=self._coeff_key, n_threads=self.n_threads)
 
     def coord2impl(self, xyz):
         """
@@ -636,6 +895,26 @@ class CubicSplinePSF(PSF):
         if self._max_drv_roi_chunk is not None and len(xyz) > self._max_drv_roi_chunk:
             return self._forward_drv_chunks(xyz, phot, bg, add_bg=add_bg, chunk_size=self._max_drv_roi_chunk)
 
+        if self._threaded and len(xyz) >= 2 * self.n_threads:
+            return self._derivative_threaded(xyz, phot, bg, add_bg)
+
+        return self._derivative_impl(xyz, phot, bg, add_bg)
+
+    def _derivative_threaded(self, xyz: torch.Tensor, phot: torch.Tensor, bg: torch.Tensor, add_bg: bool):
+        """Computes chunks of emitters on the thread pool, each writes into its rows of the preallocated output."""
+        n = len(xyz)
+        drv_rois = torch.empty((n, self.n_par, *self.roi_size_px))
+        rois = torch.empty((n, *self.roi_size_px))
+
+        def run(ix: slice):
+            drv_rois[ix], rois[ix] = self._derivative_impl(xyz[ix], phot[ix], bg[ix], add_bg)
+
+        bounds = torch.linspace(0, n, self.n_threads + 1).long().tolist()
+        list(self._pool.map(run, [slice(i, j) for i, j in zip(bounds[:-1], bounds[1:])]))
+
+        return drv_rois, rois
+
+    def _derivative_impl(self, xyz: torch.Tensor, phot: torch.Tensor, bg: torch.Tensor, add_bg: bool):
         xyz_, _ = self.frame2roi_coord(xyz)
         xyz_ = self.coord2impl(xyz_)
         n_rois = xyz.size(0)
@@ -667,18 +946,39 @@ class CubicSplinePSF(PSF):
         """
         drv, rois = self.derivative(xyz, phot, bg, True)
 
+        return self._fisher_from_drv(drv, rois), rois
+
+    @staticmethod
+    def _fisher_from_drv(drv: torch.Tensor, rois: torch.Tensor) -> torch.Tensor:
         """
-        Construct fisher by batched matrix multiplication. For this we have to play around with the axis of the
-        derivatives.
+        Fisher matrix of Poisson distributed px values, i.e. F_kl = sum_px (d_k mu * d_l mu) / mu. The contraction over
+        the pixels is done by einsum, without the N x H x W x N_par x N_par intermediate of an outer product per px.
         """
-        drv_ = drv.permute(0, 2, 3, 1)
-        fisher = torch.matmul(drv_.unsqueeze(-1), drv_.unsqueeze(-2))  # derivative contribution
-        fisher = fisher / rois.unsqueeze(-1).unsqueeze(-1)  # px value contribution
+        return torch.einsum('nkhw,nlhw->nkl', drv / rois.unsqueeze(1), drv)
 
-        """Aggregate the drv along the pixel dimension"""
-        fisher = fisher.sum(1).sum(1)
+    @staticmethod
+    def inv_cholesky_diag(fisher: torch.Tensor) -> torch.Tensor:
+        """
+        Diagonal of the inverse of a batch of symmetric positive definite matrices by Cholesky factorisation. With
+        L L^T = F the diagonal is diag(F^-1)_i = sum_k (L^-1)_ki^2, i.e. only one triangular solve is needed. Falls
+        back to torch.inverse if the batch is not (numerically) positive definite.
+
+        Args:
+            fisher: matrices of size N x N_par x N_par
+
+        Returns:
+            diagonal of the inverses of size N x N_par
+        """
+        f = fisher.double()
+        try:
+            l_tri = torch.cholesky(f)
+        except RuntimeError:
+            return torch.diagonal(torch.inverse(f), dim1=-2, dim2=-1).to(fisher.dtype)
 
-        return fisher, rois
+        eye = torch.eye(f.size(-1), dtype=f.dtype, device=f.device).expand_as(f)
+        l_inv, _ = torch.triangular_solve(eye, l_tri, upper=False)
+
+        return (l_inv ** 2).sum(-2).to(fisher.dtype)
 
     def crlb(self, xyz: torch.Tensor, phot: torch.Tensor, bg: torch.Tensor, inversion=None):
         """
@@ -708,6 +1008,56 @@ class CubicSplinePSF(PSF):
 
         return crlb, rois
 
+    def crlb_chunked(self, xyz: torch.Tensor, phot: torch.Tensor, bg: torch.Tensor, out: torch.Tensor = None,
+                     inversion=None, max_bytes: int = 2 ** 28) -> torch.Tensor:
+        """
+        Memory bounded Cramer-Rao bound. Derivatives, Fisher matrices and their inversion are computed chunk by chunk
+        such that the derivatives in flight (of all threads) do not exceed max_bytes, and the result of each chunk is
+        written into its rows of the output. On the CPU, chunks are processed by the thread pool (see n_threads).
+
+        Args:
+            xyz:
+            phot:
+            bg:
+            out: output of size N x N_par (e.g. to be sliced into the crlb attributes of an EmitterSet), allocated
+                if None
+            inversion: (function) batch inversion as in crlb. Defaults to the diagonal of the Cholesky inverse
+            max_bytes: upper bound of the memory of the derivatives computed at the same time
+
+        Returns:
+            crlb (torch.Tensor): Cramer-Rao-Lower Bound. Dimension N x N_par
+        """
+        if out is None:
+            out = torch.empty((len(xyz), self.n_par))
+        if out.size() != torch.Size([len(xyz), self.n_par]):
+            raise ValueError(f"Output must be of size {len(xyz)} x {self.n_par}.")
+
+        if inversion is not None:
+            def inv_diag(fisher):
+                return torch.diagonal(inversion(fisher), dim1=1, dim2=2)
+        else:
+            inv_diag = self.inv_cholesky_diag
+
+        """Chunk size from the memory ceiling: derivatives, scaled derivatives and ROIs per emitter and worker"""
+        n_workers = self.n_threads if self._threaded else 1
+        bytes_emitter = 4 * (2 * self.n_par + 1) * self.roi_size_px[0] * self.roi_size_px[1]
+        chunk_size = max(1, max_bytes // (bytes_emitter * n_workers))
+        if self._max_drv_roi_chunk is not None:
+            chunk_size = min(chunk_size, self._max_drv_roi_chunk)
+
+        def run(ix: slice):
+            drv, rois = self._derivative_impl(xyz[ix], phot[ix], bg[ix], True)
+            out[ix] = inv_diag(self._fisher_from_drv(drv, rois))
+
+        chunks = [slice(i, min(i + chunk_size, len(xyz))) for i in range(0, len(xyz), chunk_size)]
+        if n_workers >= 2 and len(chunks) >= 2:
+            list(self._pool.map(run, chunks))
+        else:
+            for c in chunks:
+                run(c)
+
+        return out
+
     def crlb_sq(self, xyz: torch.Tensor, phot: torch.Tensor, bg: torch.Tensor, inversion=None):
         """
         Function for the lazy ones to compute the sqrt Cramer-Rao bound. Outputs ROIs additionally (since its
@@ -762,12 +1112,42 @@ class CubicSplinePSF(PSF):
         if self.max_roi_chunk is not None and len(xyz) > self.max_roi_chunk:
             return self._forward_chunks(xyz, weight, frame_ix, ix_low, ix_high, self.max_roi_chunk)
 
+        n_frames = ix_high - ix_low + 1
+        if self._threaded and n_frames >= 2:
+            return self._forward_threaded(xyz, weight, frame_ix, n_frames)
+
+        return self._forward_impl(xyz, weight, frame_ix, n_frames)
+
+    def _forward_threaded(self, xyz: torch.Tensor, weight: torch.Tensor, frame_ix: torch.Tensor, n_frames: int):
+        """
+        Splits the frames in contiguous blocks with about equal number of emitters which are rendered on the thread
+        pool. The blocks are disjoint, i.e. each thread writes into its own frames of the preallocated output.
+        """
+        xyz, weight, frame_ix, offsets = self._sort_frames(xyz, weight, frame_ix, 0, n_frames - 1)
+
+        block = torch.searchsorted(offsets, torch.linspace(0, len(xyz), self.n_threads + 1).long()).tolist()
+        block[0], block[-1] = 0, n_frames
+        offsets = offsets.tolist()
+
+        frames = torch.zeros((n_frames, *self.img_shape))
+
+        def run(k: int):
+            f_start, f_end = block[k], block[k + 1]
+            ix = slice(offsets[f_start], offsets[f_end])
+            if f_end > f_start and ix.stop > ix.start:
+                frames[f_start:f_end] = self._forward_impl(xyz[ix], weight[ix], frame_ix[ix] - f_start,
+                                                           f_end - f_start)
+
+        list(self._pool.map(run, range(self.n_threads)))
+
+        return frames
+
+    def _forward_impl(self, xyz: torch.Tensor, weight: torch.Tensor, frame_ix: torch.Tensor, n_frames: int):
+
         """Convert Coordinates into ROI based coordinates and transform into implementation coordinates"""
         xyz_r, ix = self.frame2roi_coord(xyz)
         xyz_r = self.coord2impl(xyz_r)
 
-        n_frames = ix_high - ix_low + 1
-
         frames = self._spline_impl.forward_frames(*self.img_shape,
                                                   frame_ix,
                                                   n_frames,
@@ -780,3 +1160,355 @@ class CubicSplinePSF(PSF):
 
         frames = torch.from_numpy(frames).reshape(n_frames, *self.img_shape)
         return frames
+
+
+class LookupTablePSF(PSF):
+    """
+    PSF that samples another PSF (e.g. CubicSplinePSF) once onto an oversampled sub-pixel and z grid and renders
+    emitters by trilinear interpolation of the sampled ROIs plus scatter-add into the frames. This trades some accuracy
+    (interpolation and ROI truncation) for throughput, in particular for simulation on the CPU.
+
+    The table is of size n_z x (oversampling + 1)^2 x roi_size and may be cached on disk.
+
+    Example:
+        >>> psf = LookupTablePSF(spline_psf, z_range=(-750., 750.), n_z=151, roi_size=(25, 25), cache_dir='~/.cache',
+        >>>                      cache_key=decode.utils.cache.hash_file(calib_file))
+
+    """
+
+    def __init__(self, psf: PSF, z_range: Tuple[float, float], n_z: int, roi_size: Tuple[int, int],
+                 oversampling: int = 4, max_table_bytes: int = 2 ** 30, cache_dir=None, cache_key: str = None):
+        """
+
+        Args:
+            psf: PSF to sample. Extent and image shape are taken from it, the ROI must fit into its frames
+            z_range: z range of the table (z unit of psf). Emitters outside are rendered at the closest z plane
+            n_z: number of z planes
+            roi_size: size of the ROI around the pixel the emitter is located in
+            oversampling: sub-pixel samples per pixel and dimension
+            max_table_bytes: upper bound of the memory of the table
+            cache_dir: (optional) directory in which the table is cached
+            cache_key: key of the sampled PSF, e.g. decode.utils.cache.hash_file of the calibration file. Required if
+                cache_dir is specified
+
+        """
+        super().__init__(xextent=psf.xextent, yextent=psf.yextent, zextent=z_range, img_shape=psf.img_shape)
+
+        self.z_range = tuple(z_range)
+        self.n_z = n_z
+        self.roi_size = tuple(roi_size)
+        self.oversampling = oversampling
+
+        if n_z < 2 or oversampling < 1:
+            raise ValueError("Number of z planes must be at least 2 and oversampling at least 1.")
+        if self.roi_size[0] > self.img_shape[0] or self.roi_size[1] > self.img_shape[1]:
+            raise ValueError("ROI size must not exceed the image shape of the sampled PSF.")
+
+        n_bytes = 4 * n_z * (oversampling + 1) ** 2 * self.roi_size[0] * self.roi_size[1]
+        if n_bytes > max_table_bytes:
+            raise ValueError(f"Lookup table would take {n_bytes / 2 ** 20:.1f} MB and exceed the limit of "
+                             f"{max_table_bytes / 2 ** 20:.1f} MB. Reduce n_z, oversampling or roi_size.")
+
+        if cache_dir is not None:
+            if cache_key is None:
+                raise ValueError("Caching the lookup table requires a cache key that identifies the sampled PSF.")
+
+            key = decode.utils.cache.hash_key(type(psf).__name__, cache_key, self.xextent, self.yextent,
+                                              self.img_shape, self.z_range, n_z, self.roi_size, oversampling)
+            self._table = decode.utils.cache.DiskCache(cache_dir).get_or_compute(key, lambda: self._sample(psf))
+        else:
+            self._table = self._sample(psf)
+
+    @property
+    def _px_size(self) -> Tuple[float, float]:
+        return (self.xextent[1] - self.xextent[0]) / self.img_shape[0], \
+               (self.yextent[1] - self.yextent[0]) / self.img_shape[1]
+
+    def _sample(self, psf: PSF) -> torch.Tensor:
+        """Samples the PSF with one emitter per frame, placed in the centre pixel, and crops the ROIs."""
+        h, w = self.img_shape
+        roi_h, roi_w = self.roi_size
+        px_x, px_y = self._px_size
+        ctr_x, ctr_y = h // 2, w // 2
+
+        sub = torch.arange(self.oversampling + 1).float() / self.oversampling
+        z, sub_x, sub_y = torch.meshgrid(torch.linspace(*self.z_range, self.n_z), sub, sub)
+        xyz = torch.stack((self.xextent[0] + (ctr_x + sub_x.flatten()) * px_x,
+                           self.yextent[0] + (ctr_y + sub_y.flatten()) * px_y,
+                           z.flatten()), 1)
+
+        table = torch.zeros(len(xyz), roi_h, roi_w)
+        chunk = max(1, 2 ** 24 // (h * w))
+        for i in range(0, len(xyz), chunk):
+            xyz_chunk = xyz[i:i + chunk]
+            frames = psf.forward(xyz_chunk, torch.ones(len(xyz_chunk)), torch.arange(len(xyz_chunk)),
+                                 0, len(xyz_chunk) - 1)
+            table[i:i + chunk] = frames[:, ctr_x - roi_h // 2:ctr_x - roi_h // 2 + roi_h,
+                                        ctr_y - roi_w // 2:ctr_y - roi_w // 2 + roi_w].cpu()
+
+        return table.view(self.n_z, self.oversampling + 1, self.oversampling + 1, roi_h, roi_w)
+
+    def forward(self, xyz: torch.Tensor, weight: torch.Tensor, frame_ix: torch.Tensor = None, ix_low: int = None,
+                ix_high: int = None):
+        """
+        Forward coordinates frame index aware through the psf model.
+
+        Args:
+            xyz: coordinates of size N x 3
+            weight: photon value
+            frame_ix: (optional) frame index
+            ix_low: (optional) lower frame_index, if None will be determined automatically
+            ix_high: (optional) upper frame_index, if None will be determined automatically
+
+        Returns:
+            frames (torch.Tensor): frames of size N x H x W where N is the batch dimension.
+        """
+        xyz, weight, frame_ix, ix_low, ix_high = super().forward(xyz, weight, frame_ix, ix_low, ix_high)
+        return self._forward_batched(xyz, weight, frame_ix, ix_low, ix_high)
+
+    def _write_frames(self, frames: torch.Tensor, xyz: torch.Tensor, weight: Optional[torch.Tensor],
+                      frame_ix: torch.Tensor, offsets: torch.Tensor):
+        """Batched implementation, trilinear interpolation of the table ROIs in sub-pixel position and z."""
+        if len(xyz) == 0:
+            return
+
+        table = self._table.to(xyz.device)
+        roi_h, roi_w = self.roi_size
+        px_x, px_y = self._px_size
+        weight = weight.float() if weight is not None else torch.ones(len(xyz), device=xyz.device)
+
+        """Pixel of the emitter and table indices (lower neighbour) and interpolation weights"""
+        u = (xyz[:, 0].float() - self.xextent[0]) / px_x
+        v = (xyz[:, 1].float() - self.yextent[0]) / px_y
+        f_x = (u - u.floor()) * self.oversampling
+        f_y = (v - v.floor()) * self.oversampling
+        f_z = ((xyz[:, 2].float() - self.z_range[0]) / (self.z_range[1] - self.z_range[0]) * (self.n_z - 1)) \
+            .clamp(0, self.n_z - 1)
+
+        k_x = f_x.floor().long().clamp(0, self.oversampling - 1)
+        k_y = f_y.floor().long().clamp(0, self.oversampling - 1)
+        k_z = f_z.floor().long().clamp(0, self.n_z - 2)
+        t_x, t_y, t_z = f_x - k_x, f_y - k_y, f_z - k_z
+
+        ix_x = u.floor().long().unsqueeze(1) + torch.arange(roi_h, device=xyz.device) - roi_h // 2
+        ix_y = v.floor().long().unsqueeze(1) + torch.arange(roi_w, device=xyz.device) - roi_w // 2
+
+        """Interpolate and scatter in chunks of emitters to bound the memory"""
+        chunk = max(1, 2 ** 24 // (roi_h * roi_w))
+        for i in range(0, len(xyz), chunk):
+            sl = slice(i, i + chunk)
+            rois = torch.zeros(len(weight[sl]), roi_h, roi_w, device=xyz.device)
+            for d_z in (0, 1):
+                for d_x in (0, 1):
+                    for d_y in (0, 1):
+                        c = weight[sl] * (t_z[sl] if d_z else 1 - t_z[sl]) * (t_x[sl] if d_x else 1 - t_x[sl]) \
+                            * (t_y[sl] if d_y else 1 - t_y[sl])
+                        rois += c.view(-1, 1, 1) * table[k_z[sl] + d_z, k_x[sl] + d_x, k_y[sl] + d_y]
+
+            self._add_rois(frames, frame_ix[sl], ix_x[sl], ix_y[sl], rois)
+
+
+class FFTConvolutionPSF(PSF):
+    """
+    Rendering mode for dense emitter fields. The emitters are binned (with linear weights in x, y and z) onto an
+    oversampled delta grid per z plane, which is convolved by FFT with the sampled PSF of the respective z plane.
+    The spectra are summed over the z planes before the inverse transform. Hence the cost per frame depends on the
+    frame size, the oversampling and the number of z planes but not on the number of emitters, whereas ROI rendering
+    (e.g. GaussianPSF, CubicSplinePSF) scales linearly in the number of emitters.
+
+    In mode 'auto', forward renders by the wrapped PSF below density_crossover emitters per frame and by FFT
+    convolution above. The crossover depends on the wrapped PSF, frame size and hardware. The default is not
+    calibrated; measure it for your setup with the benchmark in the tests (test_crossover_benchmark).
+
+    Example:
+        >>> psf = FFTConvolutionPSF(spline_psf, z_range=(-750., 750.), n_z=31, kernel_size=25)
+
+    """
+    _modes = ('auto', 'roi', 'fft')
+    _max_fft_bytes = 2 ** 28  # memory of the spectra computed at once
+
+    def __init__(self, psf: PSF, z_range: Tuple[float, float], n_z: int, kernel_size: int, oversampling: int = 2,
+                 mode: str = 'auto', density_crossover: float = 1000.):
+        """
+
+        Args:
+            psf: PSF to sample and to fall back to in ROI mode. Extent and image shape are taken from it
+            z_range: z range of the kernels (z unit of psf). Emitters outside are rendered at the closest z plane
+            n_z: number of z planes
+            kernel_size: (odd) size of the PSF kernel in px, the PSF is truncated outside
+            oversampling: sub-pixel bins of the delta grid per pixel and dimension
+            mode: 'auto', 'roi' (always wrapped psf) or 'fft' (always FFT convolution)
+            density_crossover: emitters per frame above which mode 'auto' renders by FFT convolution (uncalibrated
+                default)
+
+        """
+        super().__init__(xextent=psf.xextent, yextent=psf.yextent, zextent=z_range, img_shape=psf.img_shape)
+
+        if mode not in self._modes:
+            raise ValueError(f"Mode must be in {self._modes}.")
+        if n_z < 2 or oversampling < 1:
+            raise ValueError("Number of z planes must be at least 2 and oversampling at least 1.")
+        if kernel_size % 2 != 1 or kernel_size > min(self.img_shape):
+            raise ValueError("Kernel size must be odd and must not exceed the image shape of the sampled PSF.")
+
+        self.psf = psf
+        self.z_range = tuple(z_range)
+        self.n_z = n_z
+        self.kernel_size = kernel_size
+        self.oversampling = oversampling
+        self.mode = mode
+        self.density_crossover = density_crossover
+
+        self._kernel = self._sample_kernel(psf)
+        self._kernel_spectra = {}  # (device, fft size) -> spectra
+
+    @property
+    def _px_size(self) -> Tuple[float, float]:
+        return (self.xextent[1] - self.xextent[0]) / self.img_shape[0], \
+               (self.yextent[1] - self.yextent[0]) / self.img_shape[1]
+
+    @property
+    def _grid_shape(self) -> Tuple[int, int]:
+        """Delta grid size, frame plus a margin of the kernel radius such that emitters outside contribute as well"""
+        r = self.kernel_size // 2
+        return (self.img_shape[0] + 2 * r) * self.oversampling, (self.img_shape[1] + 2 * r) * self.oversampling
+
+    @property
+    def _fft_shape(self) -> Tuple[int, int]:
+        """Size of the linear (not circular) convolution of delta grid and kernel, rounded up to fast FFT sizes"""
+        return tuple(self._fast_fft_size(g + self._kernel.size(-1) - 1) for g in self._grid_shape)
+
+    @staticmethod
+    def _fast_fft_size(n: int) -> int:
+        """Smallest integer >= n that factorises into 2, 3 and 5"""
+        while True:
+            m = n
+            for p in (2, 3, 5):
+                while m % p == 0:
+                    m //= p
+            if m == 1:
+                return n
+            n += 1
+
+    def _sample_kernel(self, psf: PSF) -> torch.Tensor:
+        """
+        Samples the PSF at the sub-pixel offsets of the delta grid around the centre pixel and interleaves the ROIs
+        into one kernel per z plane on the oversampled grid, i.e. kernel[z, i * s + (s - 1 - a), ...] is the value of
+        pixel i (relative to the ROI) for an emitter at sub-pixel offset a / s.
+
+        Returns:
+            kernel of size n_z x K x K with K = kernel_size * oversampling
+        """
+        h, w = self.img_shape
+        s, r = self.oversampling, self.kernel_size // 2
+        px_x, px_y = self._px_size
+        ctr_x, ctr_y = h // 2, w // 2
+
+        sub = torch.arange(s).float() / s
+        z, sub_x, sub_y = torch.meshgrid(torch.linspace(*self.z_range, self.n_z), sub, sub)
+        xyz = torch.stack((self.xextent[0] + (ctr_x + 0.5 + sub_x.flatten()) * px_x,
+                           self.yextent[0] + (ctr_y + 0.5 + sub_y.flatten()) * px_y,
+                           z.flatten()), 1)
+
+        rois = torch.zeros(len(xyz), self.kernel_size, self.kernel_size)
+        chunk = max(1, 2 ** 24 // (h * w))
+        for i in range(0, len(xyz), chunk):
+            xyz_chunk = xyz[i:i + chunk]
+            frames = psf.forward(xyz_chunk, torch.ones(len(xyz_chunk)), torch.arange(len(xyz_chunk)),
+                                 0, len(xyz_chunk) - 1)
+            rois[i:i + chunk] = frames[:, ctr_x - r:ctr_x + r + 1, ctr_y - r:ctr_y + r + 1].cpu()
+
+        rois = rois.view(self.n_z, s, s, self.kernel_size, self.kernel_size).flip(1, 2)
+        return rois.permute(0, 3, 1, 4, 2).reshape(self.n_z, self.kernel_size * s, self.kernel_size * s)
+
+    def _spectra(self, device: torch.device) -> torch.Tensor:
+        key = (device, self._fft_shape)
+        if key not in self._kernel_spectra:
+            self._kernel_spectra[key] = torch.fft.rfftn(self._kernel.to(device), s=self._fft_shape, dim=(-2, -1))
+
+        return self._kernel_spectra[key]
+
+    def _use_fft(self, n_emitters: int, n_frames: int) -> bool:
+        if self.mode == 'auto':
+            return n_emitters >= self.density_crossover * n_frames
+
+        return self.mode == 'fft'
+
+    def forward(self, xyz: torch.Tensor, weight: torch.Tensor, frame_ix: torch.Tensor = None, ix_low: int = None,
+                ix_high: int = None):
+        """
+        Forward coordinates frame index aware through the psf model.
+
+        Args:
+            xyz: coordinates of size N x 3
+            weight: photon value
+            frame_ix: (optional) frame index
+            ix_low: (optional) lower frame_index, if None will be determined automatically
+            ix_high: (optional) upper frame_index, if None will be determined automatically
+
+        Returns:
+            frames (torch.Tensor): frames of size N x H x W where N is the batch dimension.
+        """
+        xyz, weight, frame_ix, ix_low, ix_high = super().forward(xyz, weight, frame_ix, ix_low, ix_high)
+
+        if not self._use_fft(len(xyz), ix_high - ix_low + 1):
+            return self.psf.forward(xyz, weight, frame_ix, ix_low, ix_high)
+
+        return self._forward_batched(xyz, weight, frame_ix, ix_low, ix_high)
+
+    def _write_frames(self, frames: torch.Tensor, xyz: torch.Tensor, weight: Optional[torch.Tensor],
+                      frame_ix: torch.Tensor, offsets: torch.Tensor):
+        """Batched implementation, deposit onto the delta grid and FFT convolution in chunks of frames."""
+        if len(xyz) == 0:
+            return
+
+        s, r = self.oversampling, self.kernel_size // 2
+        spectra = self._spectra(xyz.device)
+        n_spec = spectra.numel() * 8  # complex64 bytes per frame and z plane set
+        chunk = max(1, self._max_fft_bytes // n_spec)
+
+        start = 2 * r * s + s - 1  # index of pixel 0 in the full convolution (grid margin plus kernel centre)
+        for f_start in range(0, len(frames), chunk):
+            f_end = min(f_start + chunk, len(frames))
+            ix = slice(offsets[f_start].item(), offsets[f_end].item())
+            if ix.stop == ix.start:
+                continue
+
+            grid = self._deposit(xyz[ix], weight[ix] if weight is not None else None, frame_ix[ix] - f_start,
+                                 f_end - f_start)
+            conv = torch.fft.irfftn((torch.fft.rfftn(grid, s=self._fft_shape, dim=(-2, -1)) * spectra).sum(1),
+                                    s=self._fft_shape, dim=(-2, -1))
+
+            frames[f_start:f_end] = conv[:, start:start + self.img_shape[0] * s:s,
+                                         start:start + self.img_shape[1] * s:s]
+
+    def _deposit(self, xyz: torch.Tensor, weight: Optional[torch.Tensor], frame_ix: torch.Tensor, n_frames: int) \
+            -> torch.Tensor:
+        """Bins the emitters with linear weights onto the delta grid of size n_frames x n_z x G_x x G_y"""
+        s, r = self.oversampling, self.kernel_size // 2
+        g_x, g_y = self._grid_shape
+        px_x, px_y = self._px_size
+        weight = weight.float() if weight is not None else torch.ones(len(xyz), device=xyz.device)
+
+        """Continuous grid position (pixel centres at multiples of s, shifted by the margin) and z plane"""
+        pos_x = ((xyz[:, 0].float() - self.xextent[0]) / px_x - 0.5 + r) * s
+        pos_y = ((xyz[:, 1].float() - self.yextent[0]) / px_y - 0.5 + r) * s
+        pos_z = ((xyz[:, 2].float() - self.z_range[0]) / (self.z_range[1] - self.z_range[0]) * (self.n_z - 1)) \
+            .clamp(0, self.n_z - 1)
+
+        k_x, k_y = pos_x.floor().long(), pos_y.floor().long()
+        k_z = pos_z.floor().long().clamp(0, self.n_z - 2)
+        t_x, t_y, t_z = pos_x - k_x, pos_y - k_y, pos_z - k_z
+
+        grid = torch.zeros(n_frames * self.n_z * g_x * g_y, device=xyz.device)
+        frame_ix = frame_ix.long()
+        for d_z in (0, 1):
+            for d_x in (0, 1):
+                for d_y in (0, 1):
+                    c = weight * (t_z if d_z else 1 - t_z) * (t_x if d_x else 1 - t_x) * (t_y if d_y else 1 - t_y)
+                    i_x, i_y = k_x + d_x, k_y + d_y
+                    inside = (i_x >= 0) * (i_x < g_x) * (i_y >= 0) * (i_y < g_y)
+                    ix_flat = ((frame_ix * self.n_z + k_z + d_z) * g_x + i_x) * g_y + i_y
+                    grid.index_put_((ix_flat[inside],), c[inside], accumulate=True)
+
+        return grid.view(n_frames, self.n_z, g_x, g_y)
@@ -0,0 +1,60 @@
+import hashlib
+from typing import Union
+
+import torch
+
+
+class RNGContext:
+    """
+    Seeded, counter based source of random number generators. Generators are derived deterministically from the seed
+    and a key (e.g. stream name and frame index) instead of being advanced sequentially, so that the random numbers of
+    a frame do not depend on which other frames are simulated before or in the same call. This makes simulation
+    reproducible regardless of how it is chunked or sharded across processes.
+
+    Example:
+        >>> rng = RNGContext(42)
+        >>> g = rng.generator('camera', 17)  # generator of the camera noise of frame 17
+        >>> rng_sample = rng.spawn(3)  # independent context, e.g. of the 3rd sampled acquisition
+
+    """
+
+    def __init__(self, seed: int):
+        """
+
+        Args:
+            seed: root seed
+
+        """
+        self.seed = seed
+
+    def __repr__(self):
+        return f"RNGContext(seed={self.seed})"
+
+    def seed_of(self, *key) -> int:
+        """
+        Seed derived from the root seed and the key (hash, i.e. independent streams for different keys).
+
+        Args:
+            key: ints or strings
+
+        """
+        h = hashlib.blake2b(repr((self.seed,) + key).encode(), digest_size=8)
+        return int.from_bytes(h.digest(), 'little') >> 1  # non-negative int64
+
+    def generator(self, *key, device: Union[str, torch.device] = 'cpu') -> torch.Generator:
+        """
+        Freshly seeded generator of a key.
+
+        Args:
+            key: ints or strings
+            device: device of the generator
+
+        """
+        g = torch.Generator(device=device)
+        g.manual_seed(self.seed_of(*key))
+
+        return g
+
+    def spawn(self, *key) -> 'RNGContext':
+        """Child context of a key"""
+        return RNGContext(self.seed_of(*key))
@@ -1,8 +1,17 @@
+import collections
+import concurrent.futures
+import pathlib
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
 import torch
-from typing import Tuple, Union
+import torch.multiprocessing
 
 from ..generic import EmitterSet
+from ..generic.utils import CacheStats
+from ..utils import frames_io
 from . import psf_kernel
+from .rng import RNGContext
 
 
 class Simulation:
@@ -20,10 +29,13 @@ class Simulation:
         psf: psf model with forward method
         background (Background): background implementation
         noise (Noise): noise implementation
+        psf_cache_stats (CacheStats): frame wise hits and misses of the PSF frame cache
+        rng (RNGContext): source of the RNG streams, global RNG if None
     """
 
     def __init__(self, psf: psf_kernel.PSF, em_sampler=None, background=None, noise=None,
-                 frame_range: Tuple[int, int] = None):
+                 frame_range: Tuple[int, int] = None, psf_cache_size: Optional[int] = None,
+                 rng: Optional[RNGContext] = None):
         """
         Init Simulation.
 
@@ -33,6 +45,12 @@ class Simulation:
             background: background instance
             noise: noise instance
             frame_range: limit frames to static range
+            psf_cache_size: number of PSF rendered (emitter only) frames of the current EmitterSet to keep (least
+                recently used are evicted). Forwarding the same EmitterSet again (e.g. overlapping frame windows)
+                then only re-samples background and noise. None disables the cache
+            rng: if specified, every sample draws from its own child context (by sample count) and background and
+                noise of each frame from their own generators (by frame index), i.e. the output is bit-identical
+                regardless of chunking or sharding. Requires an em_sampler with sample(generator) method
         """
 
         self.em_sampler = em_sampler
@@ -42,6 +60,113 @@ class Simulation:
         self.background = background
         self.noise = noise
 
+        if psf_cache_size is not None and psf_cache_size < 1:
+            raise ValueError("PSF cache size must be positive or None.")
+        self.psf_cache_size = psf_cache_size
+        self.psf_cache_stats = CacheStats()
+        self._psf_cache = collections.OrderedDict()  # frame index -> rendered frame, in order of use
+        self._psf_cache_state = None
+
+        if rng is not None and background is not None and not getattr(background, 'supports_rng', True):
+            raise ValueError("The background does not support sampling with an RNG context.")
+
+        self.rng = rng
+        self._n_samples = 0
+
+    def clear_psf_cache(self):
+        self._psf_cache.clear()
+        self._psf_cache_state = None
+
+    @staticmethod
+    def _render_state(em: EmitterSet) -> tuple:
+        """
+        Everything the rendered frames depend on. Data tensors by identity and version counter, the (small) px_size
+        by value, such that it is not affected by in-place modifications after the frames were cached.
+        """
+        px_size = em.px_size.clone() if em.px_size is not None else None
+        return tuple((t, t._version) for t in (em.xyz, em.phot, em.frame_ix)) + (em.xy_unit, px_size)
+
+    def _psf_cache_valid(self, state: tuple) -> bool:
+        if self._psf_cache_state is None:
+            return False
+
+        tensors_same = all(t is t_cached and v == v_cached
+                           for (t, v), (t_cached, v_cached) in zip(state[:3], self._psf_cache_state[:3]))
+        px_size, px_size_cached = state[4], self._psf_cache_state[4]
+        px_size_same = (px_size is None and px_size_cached is None) or \
+                       (px_size is not None and px_size_cached is not None and torch.equal(px_size, px_size_cached))
+
+        return tensors_same and state[3] == self._psf_cache_state[3] and px_size_same
+
+    def _forward_psf(self, em: EmitterSet, ix_low: Union[None, int], ix_high: Union[None, int]) -> torch.Tensor:
+        """
+        Renders the emitters by the PSF. With the frame cache enabled, only the frames that are not cached for this
+        EmitterSet are rendered (in contiguous runs of frames).
+        """
+        if self.psf_cache_size is None or (len(em) == 0 and (ix_low is None or ix_high is None)):
+            return self.psf.forward(em.xyz_px, em.phot, em.frame_ix, ix_low=ix_low, ix_high=ix_high)
+
+        """Same frame range as auto-determined by the psf"""
+        ix_low = ix_low if ix_low is not None else em.frame_ix.min().item()
+        ix_high = ix_high if ix_high is not None else em.frame_ix.max().item()
+
+        state = self._render_state(em)
+        if not self._psf_cache_valid(state):
+            self.clear_psf_cache()
+            self._psf_cache_state = state
+
+        missing = [ix for ix in range(ix_low, ix_high + 1) if ix not in self._psf_cache]
+        self.psf_cache_stats.hit(ix_high - ix_low + 1 - len(missing))
+        self.psf_cache_stats.miss(len(missing))
+
+        """Render contiguous runs of missing frames"""
+        runs = []
+        for ix in missing:
+            if runs and runs[-1][1] == ix - 1:
+                runs[-1][1] = ix
+            else:
+                runs.append([ix, ix])
+
+        for run_low, run_high in runs:
+            em_run = em.get_subset_frame(run_low, run_high)
+            frames_run = self.psf.forward(em_run.xyz_px, em_run.phot, em_run.frame_ix,
+                                          ix_low=run_low, ix_high=run_high)
+            for ix, frame in zip(range(run_low, run_high + 1), frames_run):
+                self._psf_cache[ix] = frame.clone()  # not a view, which would keep the whole run in memory
+
+        frames = torch.stack([self._psf_cache[ix] for ix in range(ix_low, ix_high + 1)], 0)
+
+        """Mark as recently used and evict the least recently used frames (not before, all are needed above)"""
+        for ix in range(ix_low, ix_high + 1):
+            self._psf_cache.move_to_end(ix)
+        while len(self._psf_cache) > self.psf_cache_size:
+            self._psf_cache.popitem(last=False)
+
+        return frames
+
+    def next_rng(self) -> Optional[RNGContext]:
+        """RNG context of the next sample, None if the simulation uses the global RNG."""
+        if self.rng is None:
+            return None
+
+        rng = self.rng.spawn(self._n_samples)
+        self._n_samples += 1
+
+        return rng
+
+    def sample_emitters(self, rng: Optional[RNGContext] = None) -> EmitterSet:
+        """
+        Samples emitters from the em_sampler.
+
+        Args:
+            rng: RNG context of the sample (see next_rng), global RNG if None
+
+        """
+        if rng is None:
+            return self.em_sampler()
+
+        return self.em_sampler.sample(generator=rng.generator('emitter'))
+
     def sample(self):
         """
         Sample a new set of emitters and forward them through the simulation pipeline.
@@ -52,12 +177,126 @@ class Simulation:
             torch.Tensor: background frames
         """
 
-        emitter = self.em_sampler()
-        frames, bg = self.forward(emitter)
+        rng = self.next_rng()
+        emitter = self.sample_emitters(rng)
+        frames, bg = self.forward(emitter, rng=rng)
         return emitter, frames, bg
 
-    def forward(self, em: EmitterSet, ix_low: Union[None, int] = None, ix_high: Union[None, int] = None) -> Tuple[
-        torch.Tensor, torch.Tensor]:
+    def frame_bounds(self, em: EmitterSet, ix_low: Union[None, int] = None, ix_high: Union[None, int] = None) \
+            -> Tuple[int, int]:
+        """
+        Frame range of forward, i.e. the arguments, else the frame range of the init, else the frames of the emitters.
+        """
+        ix_low = ix_low if ix_low is not None else self.frame_range[0]
+        ix_high = ix_high if ix_high is not None else self.frame_range[1]
+
+        if (ix_low is None or ix_high is None) and len(em) == 0:
+            raise ValueError("Frame range can not be determined from an empty EmitterSet, specify it.")
+
+        ix_low = ix_low if ix_low is not None else em.frame_ix.min().item()
+        ix_high = ix_high if ix_high is not None else em.frame_ix.max().item()
+
+        return ix_low, ix_high
+
+    def sample_chunks(self, chunk_size: int) -> Iterator[Tuple[EmitterSet, torch.Tensor, torch.Tensor]]:
+        """
+        Sample a new set of emitters and forward them chunk wise (see forward_chunks).
+
+        Args:
+            chunk_size: number of frames per chunk
+
+        """
+        rng = self.next_rng()
+        yield from self.forward_chunks(self.sample_emitters(rng), chunk_size, rng=rng)
+
+    def forward_chunks(self, em: EmitterSet, chunk_size: int, ix_low: Union[None, int] = None,
+                       ix_high: Union[None, int] = None, rng: Optional[RNGContext] = None) \
+            -> Iterator[Tuple[EmitterSet, torch.Tensor, torch.Tensor]]:
+        """
+        Streaming variant of forward. Yields emitters, frames and background frames of consecutive chunks of frames,
+        such that the peak memory is bound by the chunk size instead of the frame range (e.g. for long test
+        acquisitions). The emitters of an EmitterSet are frame wise, i.e. an emitter that blinks across a chunk
+        boundary is part of each chunk with its respective frames. Frame indices are not shifted.
+
+        Args:
+            em: emitters
+            chunk_size: number of frames per chunk
+            ix_low: lower frame index
+            ix_high: upper frame index (inclusive)
+            rng: RNG context (see forward)
+
+        Returns:
+            iterator of emitters, frames and background frames of each chunk
+
+        """
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive.")
+
+        ix_low, ix_high = self.frame_bounds(em, ix_low, ix_high)
+        em = em if em.frame_sorted else em.sort_by_frame()  # chunks by binary search instead of masking
+
+        for chunk_low in range(ix_low, ix_high + 1, chunk_size):
+            chunk_high = min(chunk_low + chunk_size - 1, ix_high)
+            em_chunk = em.get_subset_frame(chunk_low, chunk_high)
+            frames, bg_frames = self.forward(em_chunk, chunk_low, chunk_high, rng=rng)
+
+            yield em_chunk, frames, bg_frames
+
+    def write(self, path: Union[str, pathlib.Path], chunk_size: int, em: Optional[EmitterSet] = None,
+              ix_low: Union[None, int] = None, ix_high: Union[None, int] = None, xy_unit: Optional[str] = None,
+              px_size: Optional[tuple] = None) -> EmitterSet:
+        """
+        Simulates an acquisition chunk wise and writes it to disk (e.g. synthetic benchmark datasets), i.e.
+        frames.tif, bg.tif (if there is a background) and emitters.h5 in the specified directory.
+
+        Args:
+            path: destination directory
+            chunk_size: number of frames simulated at once
+            em: emitters, sampled if None
+            ix_low: lower frame index
+            ix_high: upper frame index (inclusive)
+            xy_unit: xy unit of the written emitters if the emitters do not specify one
+            px_size: pixel size of the written emitters if the emitters do not specify one
+
+        Returns:
+            EmitterSet: the emitters of the acquisition
+
+        """
+        path = pathlib.Path(path)
+
+        rng = self.next_rng()
+        em = em if em is not None else self.sample_emitters(rng)
+        ix_low, ix_high = self.frame_bounds(em, ix_low, ix_high)
+
+        """The hdf5 emitter file requires complete meta data, check before simulating"""
+        xy_unit = em.xy_unit if em.xy_unit is not None else xy_unit
+        px_size = em.px_size if em.px_size is not None else px_size
+        if xy_unit is None or px_size is None:
+            raise ValueError("Writing a simulation requires xy_unit and px_size, either specified by the emitters or "
+                             "as argument.")
+
+        path.mkdir(parents=True, exist_ok=True)
+
+        with frames_io.TiffStackWriter(path / 'frames.tif') as frame_writer, \
+                frames_io.TiffStackWriter(path / 'bg.tif') as bg_writer:
+
+            for _, frames, bg_frames in self.forward_chunks(em, chunk_size, ix_low, ix_high, rng=rng):
+                frame_writer.write(frames)
+                if bg_frames is not None:
+                    bg_writer.write(bg_frames)
+
+        if self.background is None:
+            (path / 'bg.tif').unlink()
+
+        em = em.get_subset_frame(ix_low, ix_high)
+        em.xy_unit = xy_unit
+        em.px_size = px_size if isinstance(px_size, torch.Tensor) else torch.Tensor(px_size)
+        em.save(path / 'emitters.h5')
+
+        return em
+
+    def forward(self, em: EmitterSet, ix_low: Union[None, int] = None, ix_high: Union[None, int] = None,
+                rng: Optional[RNGContext] = None) -> Tuple[torch.Tensor, torch.Tensor]:
         """
         Forward an EmitterSet through the simulation pipeline. 
         Setting ix_low or ix_high overwrites the frame range specified in the init.
@@ -66,11 +305,17 @@ class Simulation:
             em (EmitterSet): Emitter Set
             ix_low: lower frame index
             ix_high: upper frame index (inclusive)
+            rng: RNG context of background and noise (the one of the init if None). Each frame is drawn from the
+                generators of its frame index, i.e. forwarding the same emitters again gives the same frames
 
         Returns:
             torch.Tensor: simulated frames
             torch.Tensor: background frames (e.g. to predict the bg seperately)
         """
+        rng = rng if rng is not None else self.rng
+
+        if rng is not None:  # frame indices are needed for the frame wise generators
+            ix_low, ix_high = self.frame_bounds(em, ix_low, ix_high)
 
         if ix_low is None:
             ix_low = self.frame_range[0]
@@ -78,8 +323,8 @@ class Simulation:
         if ix_high is None:
             ix_high = self.frame_range[1]
 
-        frames = self.psf.forward(em.xyz_px, em.phot, em.frame_ix,
-                                  ix_low=ix_low, ix_high=ix_high)
+        frames = self._forward_psf(em, ix_low, ix_high)
+        rng_kwargs = {'rng': rng, 'frame_ix': range(ix_low, ix_high + 1)} if rng is not None else {}
 
         """
         Add background. This needs to happen here and not on a single frame, since background may be correlated.
@@ -87,11 +332,204 @@ class Simulation:
         emitter position / signal.
         """
         if self.background is not None:
-            frames, bg_frames = self.background.forward(frames)
+            frames, bg_frames = self.background.forward(frames, **rng_kwargs)
         else:
             bg_frames = None
 
         if self.noise is not None:
-            frames = self.noise.forward(frames)
+            frames = self.noise.forward(frames, **rng_kwargs)
+
+        return frames, bg_frames
+
+
+_worker_simulation = None  # simulation of a ParallelSimulation worker process, set by its initializer
+
+
+def _init_worker(simulation: Simulation):
+    global _worker_simulation
+    _worker_simulation = simulation
+    torch.set_num_threads(1)  # one shard per core, no oversubscription
+
+
+def _forward_shard(em: EmitterSet, ix_low: int, ix_high: int, seed: Optional[int], rng: Optional[RNGContext],
+                   frames: torch.Tensor, bg_frames: Optional[torch.Tensor]):
+    """Simulates a shard of frames in a worker process and writes it to the (shared memory) output tensors"""
+    if rng is None:
+        torch.manual_seed(seed)
+    frames_shard, bg_shard = _worker_simulation.forward(em, ix_low, ix_high, rng=rng)
+
+    frames.copy_(frames_shard)
+    if bg_frames is not None:
+        bg_frames.copy_(bg_shard)
+
+
+class ParallelSimulation:
+    """
+    Simulates the frames of a Simulation in worker processes. Emitters are sampled in the main process, the frame
+    range is split into shards of consecutive frames which are rendered (psf, background and noise) by the workers and
+    written into shared memory, i.e. the output is one frame tensor without gathering copies.
+    Every shard gets its own RNG stream, derived from the seed, the call and the shard index, so the output is
+    reproducible and does not depend on the number of workers or on the scheduling (given a fixed shard size).
+    If the simulation has an RNG context, its frame wise streams are used instead, i.e. the output is bit-identical to
+    the one of the (serial) simulation.
+
+    Drop-in replacement for Simulation.sample / forward, e.g. as simulator of SMLMLiveDataset.
+
+    Attributes:
+        simulation (Simulation): simulation that is run by the workers
+        n_workers (int): number of worker processes
+        shard_size (int): frames per shard
+
+    Example:
+        >>> with ParallelSimulation(simulation, n_workers=8, shard_size=64, seed=42) as sim:
+        >>>     em, frames, bg = sim.sample()
+
+    """
+
+    def __init__(self, simulation: Simulation, n_workers: int, shard_size: Optional[int] = None,
+                 seed: Optional[int] = None, start_method: Optional[str] = None):
+        """
+
+        Args:
+            simulation: simulation
+            n_workers: number of worker processes
+            shard_size: frames per shard. If None, the frame range is split in one shard per worker, in which case the
+                output depends on the number of workers
+            seed: seed of the shard RNG streams. If None, they are derived from the global torch RNG of the main
+                process (i.e. torch.manual_seed makes the output reproducible as well)
+            start_method: multiprocessing start method of the workers (default of torch.multiprocessing if None).
+                Use 'spawn' if the simulation renders on CUDA
+
+        """
+        if n_workers < 1:
+            raise ValueError("Number of workers must be positive.")
+        if shard_size is not None and shard_size < 1:
+            raise ValueError("Shard size must be positive or None.")
+
+        self.simulation = simulation
+        self.n_workers = n_workers
+        self.shard_size = shard_size
+        self.start_method = start_method
+
+        self._generator = None
+        if seed is not None:
+            self._generator = torch.Generator()
+            self._generator.manual_seed(seed)
+
+        self._executor = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_executor'] = None  # processes can not be pickled, restarted lazily
+
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def em_sampler(self):
+        return self.simulation.em_sampler
+
+    def next_rng(self) -> Optional[RNGContext]:
+        return self.simulation.next_rng()
+
+    def sample_emitters(self, rng: Optional[RNGContext] = None) -> EmitterSet:
+        return self.simulation.sample_emitters(rng)
+
+    @property
+    def _pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.n_workers, mp_context=torch.multiprocessing.get_context(self.start_method),
+                initializer=_init_worker, initargs=(self.simulation,))
+
+        return self._executor
+
+    def close(self):
+        """Shuts down the worker processes (restarted upon the next call)."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def frame_bounds(self, em: EmitterSet, ix_low: Union[None, int] = None, ix_high: Union[None, int] = None) \
+            -> Tuple[int, int]:
+        return self.simulation.frame_bounds(em, ix_low, ix_high)
+
+    def forward_chunks(self, em: EmitterSet, chunk_size: int, ix_low: Union[None, int] = None,
+                       ix_high: Union[None, int] = None, rng: Optional[RNGContext] = None) \
+            -> Iterator[Tuple[EmitterSet, torch.Tensor, torch.Tensor]]:
+        """Streaming variant of forward, see Simulation.forward_chunks. Each chunk is sharded across the workers."""
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive.")
+
+        ix_low, ix_high = self.frame_bounds(em, ix_low, ix_high)
+        em = em if em.frame_sorted else em.sort_by_frame()
+
+        for chunk_low in range(ix_low, ix_high + 1, chunk_size):
+            chunk_high = min(chunk_low + chunk_size - 1, ix_high)
+            em_chunk = em.get_subset_frame(chunk_low, chunk_high)
+            frames, bg_frames = self.forward(em_chunk, chunk_low, chunk_high, rng=rng)
+
+            yield em_chunk, frames, bg_frames
+
+    def _shard_seeds(self, n: int) -> list:
+        """Independent seeds of n shards, derived from one draw of the (seeded or global) torch RNG per call"""
+        entropy = torch.randint(2 ** 62, size=(1,), generator=self._generator).item()
+
+        return [int(s.generate_state(1, dtype=np.uint64)[0]) for s in np.random.SeedSequence(entropy).spawn(n)]
+
+    def sample(self):
+        """
+        Sample a new set of emitters and forward them through the simulation pipeline.
+
+        Returns:
+            EmitterSet: sampled emitters
+            torch.Tensor: simulated frames
+            torch.Tensor: background frames
+        """
+        rng = self.next_rng()
+        emitter = self.sample_emitters(rng)
+        frames, bg = self.forward(emitter, rng=rng)
+        return emitter, frames, bg
+
+    def forward(self, em: EmitterSet, ix_low: Union[None, int] = None, ix_high: Union[None, int] = None,
+                rng: Optional[RNGContext] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Forward an EmitterSet through the simulation pipeline, sharded across the worker processes.
+
+        Args:
+            em (EmitterSet): Emitter Set
+            ix_low: lower frame index
+            ix_high: upper frame index (inclusive)
+            rng: RNG context (see Simulation.forward)
+
+        Returns:
+            torch.Tensor: simulated frames (in shared memory)
+            torch.Tensor: background frames (in shared memory)
+        """
+        ix_low, ix_high = self.frame_bounds(em, ix_low, ix_high)
+        n_frames = ix_high - ix_low + 1
+
+        shard_size = self.shard_size if self.shard_size is not None else -(-n_frames // self.n_workers)
+        shards = [(low, min(low + shard_size - 1, ix_high)) for low in range(ix_low, ix_high + 1, shard_size)]
+        rng = rng if rng is not None else self.simulation.rng
+        seeds = self._shard_seeds(len(shards)) if rng is None else [None] * len(shards)
+
+        frames = torch.empty(n_frames, *self.simulation.psf.img_shape).share_memory_()
+        bg_frames = torch.empty_like(frames).share_memory_() if self.simulation.background is not None else None
+
+        em = em if em.frame_sorted else em.sort_by_frame()  # shards by binary search instead of masking
+
+        futures = [self._pool.submit(_forward_shard, em.get_subset_frame(low, high), low, high, seed, rng,
+                                     frames[low - ix_low:high - ix_low + 1],
+                                     bg_frames[low - ix_low:high - ix_low + 1] if bg_frames is not None else None)
+                   for (low, high), seed in zip(shards, seeds)]
+
+        for f in futures:
+            f.result()  # re-raises exceptions of the workers
 
         return frames, bg_frames
@@ -1,7 +1,7 @@
 import torch
 
 from abc import ABC, abstractmethod
-from typing import Tuple
+from typing import Optional, Tuple
 
 
 class StructurePrior(ABC):
@@ -22,12 +22,13 @@ class StructurePrior(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def sample(self, n: int) -> torch.Tensor:
+    def sample(self, n: int, generator: Optional[torch.Generator] = None) -> torch.Tensor:
         """
         Sample n samples from structure.
 
         Args:
             n: number of samples
+            generator: random number generator (global if None)
 
         """
         raise NotImplementedError
@@ -70,8 +71,8 @@ class RandomStructure(StructurePrior):
     def area(self) -> float:
         return (self.xextent[1] - self.xextent[0]) * (self.yextent[1] - self.yextent[0])
 
-    def sample(self, n: int) -> torch.Tensor:
-        xyz = torch.rand((n, 3)) * self.scale + self.shift
+    def sample(self, n: int, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        xyz = torch.rand((n, 3), generator=generator) * self.scale + self.shift
         return xyz
 
     @classmethod
@@ -220,6 +220,63 @@ class TestSMLMAPrioriDataset:
         ds.sample()
         assert len(ds) == 5000 - (ds.frame_window - 1)
 
+    def test_sample_chunked(self):
+        psf = decode.simulation.psf_kernel.GaussianPSF((-0.5, 31.5), (-0.5, 31.5), (-750., 750.), (32, 32),
+                                                       sigma_0=1.0)
+
+        em = decode.RandomEmitterSet(200, extent=32)
+        em.frame_ix = torch.randint_like(em.frame_ix, 0, 50)
+
+        sim = Simulation(psf=psf, em_sampler=lambda: em,
+                         background=decode.simulation.background.UniformBackground(10.), frame_range=(0, 49))
+
+        class DummyTargen:
+            def forward(self, *args):
+                return torch.rand((50, 32, 32)),
+
+        ds = can.SMLMAPrioriDataset(simulator=sim, em_proc=None, frame_proc=None, bg_frame_proc=None,
+                                    tar_gen=DummyTargen(), weight_gen=None, frame_window=3, pad='same',
+                                    sim_chunk_size=8)
+        ds.sample()
+
+        frames_ref, _ = sim.forward(em)
+        assert torch.allclose(ds._frames, frames_ref)
+        assert len(ds) == 50
+
+
+class TestAsyncResampler:
+
+    @pytest.mark.parametrize("sim_chunk_size", [None, 16])
+    def test_swap(self, sim_chunk_size):
+        psf = decode.simulation.psf_kernel.GaussianPSF((-0.5, 31.5), (-0.5, 31.5), (-750., 750.), (32, 32),
+                                                       sigma_0=1.0)
+
+        em = decode.RandomEmitterSet(200, extent=32)
+        em.frame_ix = torch.randint_like(em.frame_ix, 0, 50)
+
+        sim = Simulation(psf=psf, em_sampler=lambda: em,
+                         background=decode.simulation.background.UniformBackground(10.), frame_range=(0, 49))
+
+        ds = can.SMLMLiveDataset(simulator=sim, em_proc=None, frame_proc=None, bg_frame_proc=None, tar_gen=None,
+                                 weight_gen=None, frame_window=3, pad='same', sim_chunk_size=sim_chunk_size)
+
+        with can.AsyncResampler(ds, start_method='fork') as resampler:  # fork, the sampler is a closure
+            resampler.start()
+            assert ds._frames is None, "Dataset must not change before the swap."
+
+            resampler.swap()
+            frames_first = ds._frames
+
+            resampler.swap()
+            assert ds._frames is not frames_first
+
+        frames_ref, bg_ref = sim.forward(em)
+        assert torch.allclose(ds._frames, frames_ref)
+        assert torch.allclose(ds._bg_frames, bg_ref)
+        assert len(ds) == 50
+        assert resampler.sim_time > 0.
+        assert resampler.wait_time >= 0.
+
 
 class TestLiveSampleDataset:
     @pytest.fixture()
@@ -273,3 +330,73 @@ class TestLiveSampleDataset:
         assert x.dim() == 3
         assert y_tar.dim() == 3
         assert weight.dim() == 3
+
+
+class TestSharedBinIndex:
+    """Binning of the target emitters is shared within the target generation pipeline as set up in train.py"""
+
+    @pytest.fixture()
+    def count_binning(self, monkeypatch):
+        calls = []
+        search_bin_index = decode.simulation.psf_kernel.DeltaPSF.search_bin_index
+
+        def search_bin_index_counted(self, *args, **kwargs):
+            calls.append(None)
+            return search_bin_index(self, *args, **kwargs)
+
+        monkeypatch.setattr(decode.simulation.psf_kernel.DeltaPSF, 'search_bin_index', search_bin_index_counted)
+        return calls
+
+    @staticmethod
+    def _dataset(tar_gen, weight_gen):
+        em = decode.generic.emitter.RandomEmitterSet(20, extent=31)
+        em.xyz[:5, :2] += 40.  # some outside of the frame
+
+        return can.SMLMStaticDataset(frames=torch.rand((1, 32, 32)), emitter=[em], bg_frames=torch.rand((1, 32, 32)),
+                                     tar_gen=tar_gen, weight_gen=weight_gen, frame_window=1, pad='same',
+                                     return_em=False)
+
+    def test_train_setup(self, count_binning):
+        """Target sequence as in train.py, nothing is binned"""
+        tar_gen = decode.neuralfitter.utils.processing.TransformSequence([
+            decode.neuralfitter.target_generator.ParameterListTarget(n_max=50, xextent=(-0.5, 31.5),
+                                                                     yextent=(-0.5, 31.5), ix_low=0, ix_high=0,
+                                                                     squeeze_batch_dim=True),
+            decode.neuralfitter.target_generator.DisableAttributes(attr_ix=None),
+            decode.neuralfitter.scale_transform.ParameterListRescale(phot_max=10., z_max=800., bg_max=100.)
+        ])
+        ds = self._dataset(tar_gen, None)
+
+        _, (param_tar, mask_tar, bg), weight = ds[0]
+
+        assert len(count_binning) == 0
+        assert mask_tar.sum() == 15
+        assert weight is None
+
+    def test_sequence_shared(self, count_binning):
+        """UnifiedEmbeddingTarget in a TransformSequence and SimpleWeight bin the emitters once per sample"""
+        kwargs = dict(xextent=(-0.5, 31.5), yextent=(-0.5, 31.5), img_shape=(32, 32), roi_size=3, ix_low=0, ix_high=0,
+                      squeeze_batch_dim=True)
+        tar_gen = decode.neuralfitter.utils.processing.TransformSequence([
+            decode.neuralfitter.target_generator.UnifiedEmbeddingTarget(**kwargs)])
+        weight_gen = decode.neuralfitter.weight_generator.SimpleWeight(**kwargs)
+        ds = self._dataset(tar_gen, weight_gen)
+
+        _, target, weight = ds[0]
+        assert len(count_binning) == 1
+
+        """Same as binning independently"""
+        em, bg = ds._emitter[0], ds._bg_frames[0]
+        target_ref = tar_gen.com[0].forward(em, bg)
+        assert (target == target_ref).all()
+        assert (weight == weight_gen.forward(em, target_ref)).all()
+
+    def test_different_grid(self):
+        """No shared binning if the components bin on different grids"""
+        tar_gen = decode.neuralfitter.target_generator.UnifiedEmbeddingTarget(
+            xextent=(-0.5, 31.5), yextent=(-0.5, 31.5), img_shape=(32, 32), roi_size=3, ix_low=0, ix_high=0)
+        weight_gen = decode.neuralfitter.weight_generator.SimpleWeight(
+            xextent=(-0.5, 63.5), yextent=(-0.5, 63.5), img_shape=(32, 32), roi_size=3, ix_low=0, ix_high=0)
+
+        ds = self._dataset(tar_gen, weight_gen)
+        assert ds._shared_bin_index(ds._emitter[0]) is None
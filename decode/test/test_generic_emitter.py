@@ -1,3 +1,4 @@
+import time
 from pathlib import Path
 from unittest import mock
 
@@ -285,6 +286,296 @@ class TestEmitterSet:
 
         assert em[ix] == em_re_merged[ix_re]
 
+    @staticmethod
+    def _cat_reference(sets, shift):
+        """Concatenation by key wise torch.cat of shifted copies, i.e. the former implementation"""
+        data = [em.data for em in sets]
+        for d, s in zip(data, shift):
+            d['frame_ix'] = d['frame_ix'] + s
+
+        return {k: torch.cat([d[k] for d in data], 0) for k in data[0]}
+
+    @pytest.mark.parametrize("step_frame_ix", [None, 0, 3])
+    def test_cat_preallocated(self, step_frame_ix):
+        sets = [RandomEmitterSet(n) for n in (5, 0, 20, 1, 0, 7)]
+        for em in sets:
+            em.frame_ix = torch.randint_like(em.frame_ix, 5)
+
+        em = EmitterSet.cat(sets, step_frame_ix=step_frame_ix)
+        shift = torch.arange(len(sets)) * (step_frame_ix if step_frame_ix is not None else 0)
+
+        assert em == EmitterSet(**self._cat_reference(sets, shift), xy_unit='px')
+
+    def test_cat_dtype_promotion(self):
+        sets = [RandomEmitterSet(5), RandomEmitterSet(5)]
+        sets[1].xyz = sets[1].xyz.double()
+
+        assert EmitterSet.cat(sets).xyz.dtype == torch.double
+
+    def test_cat_empty_list(self):
+        with pytest.raises(ValueError):
+            EmitterSet.cat([])
+
+    @pytest.mark.parametrize("capacity", [0, 10, 1000])
+    def test_builder(self, capacity):
+        sets = [RandomEmitterSet(n, xy_unit='nm', px_size=(100., 100.)) for n in (5, 0, 20, 1, 0, 7)]
+        for em in sets:
+            em.sort_by_frame_()
+
+        builder = emitter.EmitterSetBuilder(capacity=capacity)
+        for i, em in enumerate(sets):
+            builder.append(em, frame_ix_shift=2 * i)
+
+        assert len(builder) == 33
+        assert builder.build() == EmitterSet.cat(sets, step_frame_ix=2)
+        assert builder.build().frame_sorted  # all frames are 0 before shifting
+
+    def test_builder_empty(self):
+        em = emitter.EmitterSetBuilder().build()
+
+        assert isinstance(em, EmitterSet)
+        assert len(em) == 0
+
+        with pytest.raises(ValueError):
+            emitter.EmitterSetBuilder(growth=1.)
+
+    @pytest.mark.benchmark
+    def test_cat_benchmark(self):
+        sets = [RandomEmitterSet(20) for _ in range(10000)]
+        shift = torch.arange(len(sets))
+
+        t0 = time.perf_counter()
+        data_ref = self._cat_reference(sets, shift)
+        t_ref = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        em = EmitterSet.cat(sets, step_frame_ix=1)
+        t_cat = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        builder = emitter.EmitterSetBuilder()
+        for i, e in enumerate(sets):
+            builder.append(e, i)
+        em_builder = builder.build()
+        t_builder = time.perf_counter() - t0
+
+        print(f"Concatenation of 10k EmitterSets: reference {t_ref:.3f}s, cat {t_cat:.3f}s, "
+              f"builder {t_builder:.3f}s.")
+
+        assert em == EmitterSet(**data_ref, xy_unit='px')
+        assert em == em_builder
+
+    def test_frame_sorted(self):
+        em = RandomEmitterSet(100)
+        em.frame_ix = torch.randint_like(em.frame_ix, 10)
+        assert not em.frame_sorted
+
+        em_sorted = em.sort_by_frame()
+        assert em_sorted.frame_sorted
+        assert (em_sorted.frame_ix[1:] >= em_sorted.frame_ix[:-1]).all()
+
+        # contiguous slices stay sorted, advanced indexing does not
+        assert em_sorted[10:50].frame_sorted
+        assert not em_sorted[torch.randperm(100)].frame_sorted
+
+        # in-place modification or re-assignment of the frame index invalidates the flag
+        em_sorted.frame_ix[0] = 100
+        assert not em_sorted.frame_sorted
+
+        em_sorted = em.sort_by_frame()
+        em_sorted.frame_ix = em_sorted.frame_ix.flip(0)
+        assert not em_sorted.frame_sorted
+
+        em.sort_by_frame_()
+        assert em.frame_sorted
+
+    @pytest.mark.parametrize("shift", [None, 0, 5, -2])
+    def test_get_subset_frame_sorted(self, shift):
+        em = RandomEmitterSet(1000)
+        em.id = torch.arange(len(em))
+        em.frame_ix = torch.randint_like(em.frame_ix, -5, 20)
+
+        em_sorted = em.sort_by_frame()
+        frame_ix_sorted = em_sorted.frame_ix.clone()
+
+        out = em.get_subset_frame(0, 10, shift)
+        out_sorted = em_sorted.get_subset_frame(0, 10, shift)
+
+        assert out[out.id.argsort()] == out_sorted[out_sorted.id.argsort()]
+        assert (em_sorted.frame_ix == frame_ix_sorted).all(), "Parent frame index must not be modified."
+
+    def test_single_frame_sorted(self):
+        em = RandomEmitterSet(10).sort_by_frame()
+        assert em.single_frame
+
+        em = EmitterSet.cat([RandomEmitterSet(10).sort_by_frame(), RandomEmitterSet(10).sort_by_frame()],
+                            step_frame_ix=1)
+        assert em.frame_sorted
+        assert not em.single_frame
+
+    def test_cat_frame_sorted(self):
+        em_a = RandomEmitterSet(10).sort_by_frame()
+        em_b = RandomEmitterSet(10).sort_by_frame()
+
+        assert EmitterSet.cat([em_a, em_b], step_frame_ix=5).frame_sorted
+        assert EmitterSet.cat([em_a, em_b], remap_frame_ix=torch.tensor([0, 0])).frame_sorted
+        assert not EmitterSet.cat([em_a, em_b], remap_frame_ix=torch.tensor([5, 0])).frame_sorted
+        assert not EmitterSet.cat([em_a, RandomEmitterSet(10)]).frame_sorted
+
+    @pytest.mark.benchmark
+    def test_split_in_frames_sorted_benchmark(self):
+        n, n_frames = 1000000, 10000
+
+        em = RandomEmitterSet(n)
+        em.frame_ix = torch.randint_like(em.frame_ix, n_frames)
+        em_sorted = em.sort_by_frame()
+
+        t0 = time.perf_counter()
+        for i in range(100):
+            em.get_subset_frame(i, i)
+        t_mask = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for i in range(100):
+            em_sorted.get_subset_frame(i, i)
+        t_sorted = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        em_split = em_sorted.split_in_frames(0, n_frames - 1)
+        t_split = time.perf_counter() - t0
+
+        print(f"get_subset_frame: masked {t_mask:.3f}s, sorted {t_sorted:.3f}s (100 calls). "
+              f"split_in_frames (sorted): {t_split:.3f}s.")
+
+        assert sum(len(e) for e in em_split) == n
+        assert t_sorted < t_mask
+
+    def test_conversion_cache(self):
+        em = RandomEmitterSet(100, xy_unit='px', px_size=(100., 200.))
+
+        with emitter.conversion_cache_stats() as stats:
+            xyz_nm = em.xyz_nm
+            xyz_nm_hit = em.xyz_nm
+            assert (stats.hits, stats.misses) == (1, 1)
+
+            # views inherit the conversion
+            assert (em.view(slice(10, 20)).xyz_nm == xyz_nm[10:20]).all()
+            assert (stats.hits, stats.misses) == (2, 1)
+
+        assert test_utils.tens_almeq(xyz_nm, em.xyz * torch.tensor([[100., 200., 1.]]), 1e-4)
+
+        # hits return the cached tensor, in-place modification of it invalidates the cache entry
+        assert xyz_nm_hit is xyz_nm
+        xyz_nm[:, 1] = -1.
+        assert (em.xyz_nm[:, :2] >= 0.).all()
+        assert em.xyz_nm is not xyz_nm
+
+        # invalidation
+        em.xyz[0, 0] = 5.
+        assert em.xyz_nm[0, 0] == pytest.approx(500.)
+
+        em.xyz = torch.zeros_like(em.xyz)
+        assert (em.xyz_nm == 0).all()
+
+        em.xyz = torch.ones_like(em.xyz)
+        em.px_size[1] = 50.
+        assert (em.xyz_nm[:, 1] == 50.).all()
+
+        em.px_size = torch.tensor([10., 10.])
+        assert (em.xyz_nm[:, 1] == 10.).all()
+
+        em.xyz_nm[:, 1] *= 2  # in-place modification of the cached tensor
+        assert (em.xyz_nm[:, 1] == 10.).all()
+
+        em.xy_unit = 'nm'
+        assert (em.xyz_nm == em.xyz).all()
+        assert (em.xyz_px[:, 0] == 0.1).all()
+
+        # clones do not share the cache
+        assert em.clone().xyz_px is not em.xyz_px
+
+    @pytest.mark.parametrize("ix", [slice(2, 7), slice(None, None, 2), slice(-1, None)])
+    def test_view(self, ix):
+        em = RandomEmitterSet(10)
+        em_view = em.view(ix)
+
+        assert em_view.is_view
+        assert not em.is_view
+        assert em_view.xyz.storage().data_ptr() == em.xyz.storage().data_ptr()
+        assert em_view.frame_ix.storage().data_ptr() == em.frame_ix.storage().data_ptr()
+
+        # same result as by advanced indexing
+        ix_arange = torch.arange(10)[ix].view(-1)
+        assert em_view == em[ix_arange]
+        assert not em[ix_arange].is_view
+
+        with pytest.raises(TypeError):
+            em.view(3)
+
+    @pytest.mark.parametrize("ix", [slice(2, 7), 3, -1])
+    def test_getitem_copy(self, ix):
+        """Indexing copies, i.e. in-place modifications of the subset do not alter the parent"""
+        em = RandomEmitterSet(10)
+        em_ref = em.clone()
+
+        em_sub = em[ix]
+        assert not em_sub.is_view
+
+        em_sub.xyz[:, 0] += 1.
+        em_sub.phot *= 2
+        em_sub.frame_ix += 5
+        assert em == em_ref
+
+        em_sorted = em.sort_by_frame()
+        em_sorted.get_subset_frame(0, 0).xyz[:] = 0.
+        assert (em_sorted.xyz != 0.).any()
+
+    def test_split_in_frames_view(self):
+        em = RandomEmitterSet(100)
+        em.frame_ix = torch.randint(0, 10, size=(100,))
+
+        split = em.split_in_frames(0, 9)
+        split_view = em.split_in_frames(0, 9, view=True)
+
+        assert all(a == b for a, b in zip(split, split_view))
+        assert not any(e.is_view for e in split)
+        assert all(e.is_view for e in split_view if len(e) >= 1)
+
+    def test_view_index_error(self):
+        em = RandomEmitterSet(10)
+
+        with pytest.raises(IndexError):
+            _ = em[10]
+
+        with pytest.raises(IndexError):
+            _ = em[-11]
+
+    def test_view_out_of_place(self):
+        em = RandomEmitterSet(10)
+        em.frame_ix = torch.arange(10)
+        em_ref = em.clone()
+
+        em_view = em.get_subset_frame(2, 5, -2)
+        assert (em_view.frame_ix == torch.arange(4)).all()
+        assert em == em_ref
+
+        em_clone = em.view(slice(2, 6)).clone()
+        em_clone.frame_ix += 5
+        em_clone.xyz[:] = 0.
+        assert em == em_ref
+
+    def test_clone_view(self):
+        em = RandomEmitterSet(1000)
+        em_clone = em.view(slice(10, 20)).clone()
+
+        assert not em_clone.is_view
+        assert em_clone.xyz.storage().size() == 10 * 3
+        assert em_clone == em[10:20]
+
+        # subclass and frame sorting are preserved
+        assert isinstance(RandomEmitterSet(10).clone(), RandomEmitterSet)
+        assert em.sort_by_frame().clone().frame_sorted
+
     @pytest.mark.parametrize("frac", [0., 0.1, 0.5, 0.9, 1.])
     def test_sigma_filter(self, frac):
 
@@ -344,6 +635,103 @@ class TestEmitterSet:
         em_load = EmitterSet.load(p)
         assert em == em_load, "Reloaded emitterset is not equivalent to inital one."
 
+    @pytest.mark.parametrize("format", ['.pt', '.h5', '.csv'])
+    @pytest.mark.filterwarnings("ignore:.*For .csv files, implicit usage of .load()")
+    def test_absent_optionals_save(self, format, tmpdir):
+        """Neither construction nor saving allocates the absent optional attributes"""
+        em = RandomEmitterSet(1000, xy_unit='nm', px_size=(100., 100.))
+        em.save(Path(tmpdir / f'em{format}'))
+
+        assert all(getattr(em, '_' + attr) is None for attr in EmitterSet._optional_attrs)
+        assert em == EmitterSet.load(Path(tmpdir / f'em{format}'))
+
+    def test_populate_crlb_buffer(self):
+        """The CRLB buffer is allocated on the device and in the dtype of the coordinates"""
+
+        class ConstCRLB:
+            def crlb_chunked(self, xyz, phot, bg, out=None):
+                out[:] = torch.arange(5, dtype=out.dtype)
+                return out
+
+        em = RandomEmitterSet(20)
+        em.xyz = em.xyz.double()
+        em.populate_crlb(ConstCRLB())
+
+        assert em.xyz_cr.dtype == torch.double
+        assert (em.xyz_cr == torch.tensor([0., 1., 2.], dtype=torch.double)).all()
+        assert (em.phot_cr == 3.).all() and (em.bg_cr == 4.).all()
+
+    def test_absent_optionals(self):
+        em = RandomEmitterSet(1000)
+
+        for attr in EmitterSet._optional_attrs:
+            assert em._data_stored()[attr] is None  # not allocated
+            v = getattr(em, attr)
+            assert v.size(0) == 1000
+            assert torch.isnan(v).all()
+            assert getattr(em, attr) is v  # allocated on first access
+            assert em._data_stored()[attr] is None  # but still absent as long as it is not written to
+
+        # columns allocated on access can be written to
+        em.bg_sig[:10] = 1.
+        assert (em.bg_sig[:10] == 1.).all() and torch.isnan(em.bg_sig[10:]).all()
+        assert em._data_stored()['bg_sig'] is em.bg_sig
+        assert (em.clone().bg_sig[:10] == 1.).all()
+        assert em.clone()._data_stored()['xyz_sig'] is None
+
+        # absent attributes stay absent through slicing and concatenation, present ones are kept
+        em.phot_cr = torch.rand(1000)
+        em_cat = EmitterSet.cat([em[:10], em[[5, 6]], em[20:30]])
+        assert em_cat._data_stored()['xyz_cr'] is None
+        assert (em_cat.phot_cr == torch.cat([em.phot_cr[:10], em.phot_cr[[5, 6]], em.phot_cr[20:30]])).all()
+
+        # mixed presence
+        em_cat = EmitterSet.cat([RandomEmitterSet(5), em[:10]])
+        assert torch.isnan(em_cat.phot_cr[:5]).all()
+        assert (em_cat.phot_cr[5:] == em.phot_cr[:10]).all()
+
+    def test_dtype_profile(self):
+        em = RandomEmitterSet(1000)
+        em.xyz_sig = torch.rand(1000, 3)
+        em.prob = torch.rand(1000)
+
+        em_compact = em.to_dtype_profile('compact')
+        assert em_compact.frame_ix.dtype == torch.int32
+        assert em_compact.id.dtype == torch.int32
+        assert em_compact.prob.dtype == torch.float16
+        assert em_compact.xyz_sig.dtype == torch.float16
+        assert em_compact.xyz_cr.dtype == torch.float32  # absent
+        assert em_compact.xyz.dtype == torch.float32
+        assert em_compact.meta['dtype_profile'] == 'compact'
+
+        # profile is kept through subsets and concatenation
+        assert em_compact[:10].frame_ix.dtype == torch.int32
+        assert em_compact[[1, 2]].prob.dtype == torch.float16
+        assert EmitterSet.cat([em_compact, em_compact]).id.dtype == torch.int32
+
+        em_back = em_compact.to_dtype_profile('default')
+        assert em_back.frame_ix.dtype == torch.int64
+        assert (em_back.frame_ix == em.frame_ix).all()
+        assert test_utils.tens_almeq(em_back.xyz_sig, em.xyz_sig, 1e-3)
+        assert test_utils.tens_almeq(em_back.prob, em.prob, 1e-3)
+
+        with pytest.raises(ValueError):
+            em.to_dtype_profile('abc')
+
+    @pytest.mark.parametrize("format", ['.pt', '.h5'])
+    def test_save_load_compact(self, format, tmpdir):
+        em = RandomEmitterSet(1000, xy_unit='nm', px_size=(100., 100.))
+        em.xyz_sig = torch.rand(1000, 3)
+        em = em.to_dtype_profile('compact')
+
+        p = Path(tmpdir / f'em{format}')
+        em.save(p)
+        em_load = EmitterSet.load(p)
+
+        assert em_load.dtype_profile == 'compact'
+        assert em_load.xyz_sig.dtype == torch.float16
+        assert em_load.to_dtype_profile('default') == em.to_dtype_profile('default')
+
     @pytest.mark.parametrize("em_a,em_b,expct", [(CoordinateOnlyEmitter(torch.tensor([[0., 1., 2.]])),
                                                   CoordinateOnlyEmitter(torch.tensor([[0., 1., 2.]])),
                                                   True),
@@ -379,6 +767,81 @@ class TestEmitterSet:
         em_dict = EmitterSet(**em.to_dict())
         assert em_clone == em_dict
 
+    @staticmethod
+    def _random_tracks(n, n_id, n_frames):
+        em = RandomEmitterSet(n)
+        em.frame_ix = torch.randint(n_frames, size=(n,))
+        em.id = torch.randint(n_id, size=(n,))
+        em.phot = torch.rand(n) * 1000
+        em.bg = torch.rand(n) * 100
+        return em
+
+    def test_reduce_by_id(self):
+        em = self._random_tracks(1000, 50, 100)
+        red = em.reduce_by_id()
+
+        """Reference by loop over unique ids"""
+        assert (red['id'] == em.id.unique()).all()
+        for i, id in enumerate(red['id']):
+            em_id = em[em.id == id]
+            assert red['on_time'][i] == len(em_id)
+            assert red['frame_min'][i] == em_id.frame_ix.min()
+            assert red['frame_max'][i] == em_id.frame_ix.max()
+            assert red['phot'][i] == pytest.approx(em_id.phot.sum().item(), rel=1e-5)
+            assert test_utils.tens_almeq(red['xyz'][i], em_id.xyz.mean(0), 1e-4)
+            assert test_utils.tens_almeq(red['xyz_weighted'][i],
+                                         (em_id.xyz * em_id.phot.unsqueeze(1)).sum(0) / em_id.phot.sum(), 1e-4)
+            assert red['bg'][i] == pytest.approx(em_id.bg.mean().item(), rel=1e-5)
+
+    def test_reduce_by_id_empty(self):
+        red = EmptyEmitterSet().reduce_by_id()
+        assert all(len(v) == 0 for v in red.values())
+
+    def test_merge_consecutive(self):
+        em = EmitterSet(xyz=torch.tensor([[0., 0., 0.], [2., 0., 0.], [5., 5., 5.], [1., 1., 1.], [3., 3., 3.]]),
+                        phot=torch.tensor([1., 3., 1., 2., 2.]),
+                        frame_ix=torch.tensor([0, 1, 3, 0, 2]),
+                        id=torch.tensor([0, 0, 0, 1, 1]), xy_unit='px')
+
+        em_merged = em.merge_consecutive()
+        assert em_merged.frame_sorted
+        assert (em_merged.frame_ix == torch.tensor([0, 0, 2, 3])).all()
+        assert (em_merged.id == torch.tensor([0, 1, 1, 0])).all()
+        assert (em_merged.phot == torch.tensor([4., 2., 2., 1.])).all()
+        assert test_utils.tens_almeq(em_merged.xyz[0], torch.tensor([1.5, 0., 0.]))
+        assert em_merged.xy_unit == 'px'
+
+        em_merged = em.merge_consecutive(frame_gap=2)
+        assert (em_merged.phot == torch.tensor([5., 4.])).all()
+        assert (em_merged.frame_ix == torch.tensor([0, 0])).all()
+
+        assert len(EmptyEmitterSet().merge_consecutive()) == 0
+
+        with pytest.raises(ValueError):
+            em.merge_consecutive(frame_gap=-1)
+
+    @pytest.mark.benchmark
+    @pytest.mark.parametrize("n", [100000,
+                                   pytest.param(1000000, marks=pytest.mark.slow),
+                                   pytest.param(10000000, marks=pytest.mark.slow)])
+    def test_reduce_by_id_scaling(self, n):
+        em = self._random_tracks(n, n // 10, n // 100)
+
+        t0 = time.perf_counter()
+        red = em.reduce_by_id()
+        t_reduce = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        em_merged = em.merge_consecutive()
+        t_merge = time.perf_counter() - t0
+
+        print(f"{n} emitters: reduce_by_id {t_reduce:.3f}s, merge_consecutive {t_merge:.3f}s.")
+
+        assert red['on_time'].sum() == n
+        assert red['phot'].sum().item() == pytest.approx(em.phot.sum().item(), rel=1e-3)
+        assert em_merged.phot.sum().item() == pytest.approx(em.phot.sum().item(), rel=1e-3)
+        assert len(red['id']) <= len(em_merged) <= n
+
 
 def test_empty_emitterset():
     em = EmptyEmitterSet()
@@ -440,7 +903,7 @@ class TestLooseEmitterSet:
         num_emitters = 10000
         t0_max = 5000
         em = emitter.LooseEmitterSet(torch.rand((num_emitters, 3)), torch.ones(num_emitters) * 10000,
-                                     torch.rand(num_emitters) * 3, torch.rand(num_emitters) * t0_max, None,
+                                     torch.rand(num_emitters) * 3, torch.rand(num_emitters) * t0_max,
                                      xy_unit='px', px_size=None)
 
         return em
@@ -450,3 +913,40 @@ class TestLooseEmitterSet:
                                            torch.tensor([-0.2, 0.9]), xy_unit='px', px_size=None)
 
         em = loose_em.return_emitterset()
+
+    @staticmethod
+    def _sort_id_frame(em):
+        return em[torch.from_numpy(np.lexsort((em.frame_ix.numpy(), em.id.numpy())))]
+
+    @pytest.mark.parametrize("frame_range", [(0, 0), (-5, 100), (10, 20), (6000, 7000)])
+    def test_distribution_frame_range(self, dummy_set, frame_range):
+        em = dummy_set.return_emitterset(frame_range=frame_range)
+        em_ref = dummy_set.return_emitterset().get_subset_frame(*frame_range)
+
+        assert self._sort_id_frame(em) == self._sort_id_frame(em_ref)
+
+    def test_distribution_photons(self, dummy_set):
+        """The photons of an emitter sum up to intensity times ontime"""
+        em = dummy_set.return_emitterset()
+
+        phot_total = torch.zeros_like(dummy_set.intensity).index_add_(0, em.id, em.phot)
+        assert test_utils.tens_almeq(phot_total / dummy_set.intensity, dummy_set.ontime, 1e-3)
+
+    @pytest.mark.benchmark
+    def test_distribution_benchmark(self):
+        n = 1000000
+        loose_em = emitter.LooseEmitterSet(torch.rand((n, 3)), torch.ones(n) * 1000, torch.rand(n) * 3,
+                                           torch.rand(n) * 1000 - 100, xy_unit='px', px_size=None)
+
+        t0 = time.perf_counter()
+        em_ref = loose_em.return_emitterset().get_subset_frame(0, 799)
+        t_crop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        em = loose_em.return_emitterset(frame_range=(0, 799))
+        t_range = time.perf_counter() - t0
+
+        print(f"Distribution of 1e6 loose emitters: all frames and crop {t_crop:.3f}s, frame range {t_range:.3f}s.")
+
+        assert len(em) == len(em_ref)
+        assert t_range < t_crop
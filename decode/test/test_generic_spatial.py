@@ -0,0 +1,169 @@
+import time
+
+import pytest
+import torch
+
+from decode.generic import spatial
+from decode.generic.emitter import RandomEmitterSet
+
+
+class TestSpatialIndex:
+
+    @pytest.fixture()
+    def em(self):
+        em = RandomEmitterSet(1000, extent=32)
+        em.frame_ix = torch.randint_like(em.frame_ix, 20)
+        return em
+
+    @staticmethod
+    def _pairs_reference(xyz_q, xyz_r, frame_q, frame_r, r, dims):
+        """Brute force pairs within radius r (on same frame if frame indices are specified)"""
+        within = torch.cdist(xyz_q[:, :dims].double(), xyz_r[:, :dims].double()) <= r
+        if frame_q is not None:
+            within &= frame_q.unsqueeze(1) == frame_r.unsqueeze(0)
+
+        return within.nonzero(as_tuple=True)
+
+    @pytest.mark.parametrize("per_frame", [True, False])
+    @pytest.mark.parametrize("dims", [2, 3])
+    def test_query_radius(self, em, per_frame, dims):
+        frame_ix = em.frame_ix if per_frame else None
+        index = spatial.SpatialIndex(em.xyz, frame_ix, dims=dims)
+
+        xyz_q = em.xyz[:100] + torch.rand(100, 3)
+        frame_q = em.frame_ix[:100] if per_frame else None
+
+        ix_q, ix_r, dist = index.query_radius(xyz_q, r=1.5, frame_ix=frame_q)
+        ix_q_ref, ix_r_ref = self._pairs_reference(xyz_q, em.xyz, frame_q, frame_ix, 1.5, dims)
+
+        assert (ix_q == ix_q_ref).all()
+        assert (ix_r == ix_r_ref).all()
+        assert torch.allclose(dist, (xyz_q[ix_q, :dims] - em.xyz[ix_r, :dims]).norm(dim=1), atol=1e-5)
+
+    @pytest.mark.parametrize("per_frame", [True, False])
+    def test_query_box(self, em, per_frame):
+        frame_ix = em.frame_ix if per_frame else None
+        index = spatial.SpatialIndex(em.xyz, frame_ix, dims=2)
+
+        lower = torch.rand(50, 2) * 28
+        upper = lower + torch.rand(50, 2) * 4
+        frame_q = torch.randint(20, size=(50,)) if per_frame else None
+
+        ix_q, ix_r = index.query_box(lower, upper, frame_ix=frame_q)
+
+        inside = ((em.xyz[None, :, :2] >= lower[:, None]) & (em.xyz[None, :, :2] <= upper[:, None])).all(-1)
+        if per_frame:
+            inside &= frame_q.unsqueeze(1) == em.frame_ix.unsqueeze(0)
+        ix_q_ref, ix_r_ref = inside.nonzero(as_tuple=True)
+
+        assert (ix_q == ix_q_ref).all()
+        assert (ix_r == ix_r_ref).all()
+
+    def test_query_box_single(self, em):
+        index = spatial.SpatialIndex(em.xyz, None, dims=2)
+        ix_q, ix_r = index.query_box(torch.tensor([5., 5.]), torch.tensor([10., 10.]))
+
+        inside = ((em.xyz[:, :2] >= 5) & (em.xyz[:, :2] <= 10)).all(1)
+
+        assert (ix_q == 0).all()
+        assert (ix_r == inside.nonzero()[:, 0]).all()
+
+    @pytest.mark.parametrize("per_frame", [True, False])
+    def test_knn(self, em, per_frame):
+        frame_ix = em.frame_ix if per_frame else None
+        index = spatial.SpatialIndex(em.xyz, frame_ix)
+
+        frame_q = em.frame_ix[:100] if per_frame else None
+        dist, ix = index.knn(em.xyz[:100], k=3, frame_ix=frame_q)
+
+        # float64 reference, float32 cdist computes distances via matrix products and is off by up to 1e-2
+        dist_ref = torch.cdist(em.xyz[:100].double(), em.xyz.double())
+        if per_frame:
+            dist_ref[frame_q.unsqueeze(1) != em.frame_ix.unsqueeze(0)] = float('inf')
+        dist_ref, _ = dist_ref.topk(3, dim=1, largest=False)
+
+        assert dist.size() == ix.size() == torch.Size([100, 3])
+        assert (dist[:, 0] == 0.).all(), "Query points are themselves emitters"
+        assert torch.allclose(dist.double(), dist_ref, atol=1e-5)
+        if per_frame:
+            assert (em.frame_ix[ix] == frame_q.unsqueeze(1)).all()
+
+    def test_knn_missing(self):
+        xyz = torch.tensor([[0., 0., 0.], [1., 0., 0.], [0., 0., 0.]])
+        index = spatial.SpatialIndex(xyz, torch.tensor([0, 0, 1]))
+
+        dist, ix = index.knn(torch.zeros(2, 3), k=2, frame_ix=torch.tensor([0, 1]))
+
+        assert (ix == torch.tensor([[0, 1], [2, -1]])).all()
+        assert dist[1, 1] == float('inf')
+
+        _, ix = index.knn(torch.zeros(1, 3), k=2, frame_ix=torch.tensor([0]), max_dist=0.5)
+        assert (ix == torch.tensor([[0, -1]])).all()
+
+    def test_empty(self):
+        index = spatial.SpatialIndex(torch.zeros(0, 3), torch.zeros(0).long())
+
+        ix_q, ix_r, dist = index.query_radius(torch.zeros(2, 3), r=1., frame_ix=torch.zeros(2).long())
+        assert len(ix_q) == len(ix_r) == len(dist) == 0
+
+        dist, ix = index.knn(torch.zeros(2, 3), k=1, frame_ix=torch.zeros(2).long())
+        assert (ix == -1).all()
+
+    def test_frame_ix_mismatch(self, em):
+        with pytest.raises(ValueError):
+            spatial.SpatialIndex(em.xyz, em.frame_ix).query_radius(em.xyz, 1.)
+
+        with pytest.raises(ValueError):
+            spatial.SpatialIndex(em.xyz).query_radius(em.xyz, 1., frame_ix=em.frame_ix)
+
+    def test_emitterset_cache(self, em):
+        em.px_size = torch.tensor([100., 100.])
+
+        index = em.spatial_index()
+        assert em.spatial_index() is index
+        assert em.spatial_index(per_frame=False) is not index
+        assert em[:10].spatial_index() is not index
+
+        index_nm = em.spatial_index(unit='nm')
+        assert em.spatial_index(unit='nm') is index_nm
+
+        em.xyz += 1.
+        assert em.spatial_index() is not index
+
+        index = em.spatial_index(unit='nm')
+        em.px_size = torch.tensor([50., 50.])
+        assert em.spatial_index(unit='nm') is not index
+
+        index = em.spatial_index()
+        em.frame_ix[0] = 100
+        assert em.spatial_index() is not index
+
+        assert em.clone().spatial_index() is not em.spatial_index()
+
+    @pytest.mark.benchmark
+    def test_query_radius_benchmark(self):
+        em = RandomEmitterSet(100000, extent=256)
+        em.frame_ix = torch.randint_like(em.frame_ix, 1000)
+        em = em.sort_by_frame()
+
+        t0 = time.perf_counter()
+        ix_q_ref, ix_r_ref = [], []
+        for em_frame, start in zip(em.split_in_frames(0, 999), em._frame_offsets(range(1000))):
+            ix_q, ix_r = (torch.cdist(em_frame.xyz.double(), em_frame.xyz.double()) <= 2.).nonzero(as_tuple=True)
+            ix_q_ref.append(ix_q + start)
+            ix_r_ref.append(ix_r + start)
+        t_ref = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        ix_q, ix_r, _ = em.spatial_index().query_radius(em.xyz, r=2., frame_ix=em.frame_ix)
+        t_index = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        em.spatial_index().query_radius(em.xyz, r=2., frame_ix=em.frame_ix)
+        t_cached = time.perf_counter() - t0
+
+        print(f"Radius query of 100k emitters on 1000 frames: cdist per frame {t_ref:.3f}s, "
+              f"spatial index {t_index:.3f}s (cached index {t_cached:.3f}s).")
+
+        assert (ix_q == torch.cat(ix_q_ref)).all()
+        assert (ix_r == torch.cat(ix_r_ref)).all()
@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 import torch
 
@@ -39,3 +40,24 @@ def test_frame_grid_argument_equivalence(origin, px_size, xextent, yextent, img_
     assert (bin_y == bin_y_expct).all()
     assert (ctr_x == ctr_x_expct).all()
     assert (ctr_y == ctr_y_expct).all()
+
+
+@pytest.mark.parametrize("q", [0., 0.1, 0.25, 0.5, 0.9, 1.])
+def test_quantile(q):
+    x = torch.randn(1001)
+
+    assert utils.quantile(x, q).item() == pytest.approx(np.percentile(x.numpy(), q * 100), abs=1e-6)
+
+
+def test_quantile_sketch():
+    x = torch.rand(100000) * 10
+    sketch = utils.HistogramQuantileSketch(0., 10., n_bins=1000)
+    for x_chunk in x.split(30000):
+        sketch.update(x_chunk)
+
+    assert len(sketch) == len(x)
+    for q in (0., 0.1, 0.5, 0.99, 1.):
+        assert sketch.quantile(q) == pytest.approx(np.percentile(x.numpy(), q * 100), abs=0.02)
+
+    with pytest.raises(ValueError):
+        utils.HistogramQuantileSketch(1., 1.)
@@ -33,6 +33,21 @@ class TestTransformSequence:
 
         trafo.forward(torch.rand((32, 32)), torch.rand((32, 32)))
 
+    def test_forward_kwargs(self):
+        """Keyword arguments only go to the components that accept them"""
+
+        class MockComKwarg:
+            def forward(self, a, offset=0.):
+                return a + offset
+
+        class MockCom:
+            def forward(self, a):
+                return a * 2
+
+        trafo = processing.TransformSequence([MockComKwarg(), MockCom(), MockComKwarg()])
+
+        assert trafo.forward(torch.ones(3), offset=1.).tolist() == [5., 5., 5.]
+
 
 class TestParallelTransformSequence(TestTransformSequence):
 
@@ -207,6 +207,43 @@ class TestGreedyMatching(TestMatcherABC):
         assert ((tp.xyz - tp_match.xyz) <= 1.).all()
         assert (tp.id == tp_match.id).all()
 
+    def test_forward_conversion_cache(self, matcher):
+        """Coordinates are converted once per set, the per frame views are cache hits."""
+        matcher.dist_lat = 1.
+        em_tar = decode.generic.emitter.EmitterSet(xyz=torch.rand(100, 3) * 10, phot=torch.ones(100),
+                                                   frame_ix=torch.arange(100) % 10, xy_unit='px', px_size=(100., 100.))
+        em_out = decode.generic.emitter.EmitterSet(xyz=em_tar.xyz + 0.01, phot=torch.ones(100),
+                                                   frame_ix=em_tar.frame_ix, xy_unit='px', px_size=(100., 100.))
+
+        with decode.generic.emitter.conversion_cache_stats() as stats:
+            matcher.forward(em_out, em_tar)
+
+        assert stats.misses == 2
+        assert stats.hits >= 4 * 10  # two accesses per frame and set
+
+    def test_forward_lazy(self, matcher, tmpdir):
+        """Matching out-of-core sets in chunks of frames is the same as matching them at once."""
+        from decode.utils import emitter_io
+
+        matcher.dist_lat = 1.
+        matcher.frames_per_chunk = 3
+
+        em_tar = decode.generic.emitter.EmitterSet(xyz=torch.rand(100, 3) * 10, phot=torch.ones(100),
+                                                   frame_ix=torch.arange(100) % 10, id=torch.arange(100),
+                                                   xy_unit='nm', px_size=(100., 100.))
+        em_out = decode.generic.emitter.EmitterSet(xyz=em_tar.xyz + torch.randn_like(em_tar.xyz), phot=torch.ones(100),
+                                                   frame_ix=em_tar.frame_ix, xy_unit='nm', px_size=(100., 100.))
+        em_tar.sort_by_frame().save(tmpdir / 'tar.h5')
+        em_out.sort_by_frame().save(tmpdir / 'out.h5')
+
+        match = matcher.forward(em_out, em_tar)
+        match_lazy = matcher.forward(emitter_io.LazyH5EmitterSet(tmpdir / 'out.h5'),
+                                     emitter_io.LazyH5EmitterSet(tmpdir / 'tar.h5'))
+
+        for em, em_lazy in zip(match, match_lazy):
+            assert len(em) == len(em_lazy)
+            assert set(em.id.tolist()) == set(em_lazy.id.tolist())
+
     def test_forward_statistical(self, matcher):
 
         matcher.dist_lat = 1.
@@ -1,7 +1,10 @@
+import time
+
 import pytest
 import torch
 
 import decode.simulation.camera as camera
+import decode.simulation.noise_distributions as noise_distributions
 from decode.generic import test_utils
 
 
@@ -29,6 +32,88 @@ class TestPhoton2Camera:
         tol = 0.01
         assert abs((x.mean() - out.mean()) / x.mean()) <= tol
 
+    @staticmethod
+    def _forward_reference(cam, x: torch.Tensor) -> torch.Tensor:
+        """Camera model as separate passes through the noise distributions"""
+        x = torch.clamp(x, 0.)
+        out = cam.poisson.forward(x * cam.qe + cam.spur)
+        if cam._em_gain is not None:
+            out = cam.gain.forward(out)
+        out = cam.read.forward(out)
+
+        out /= cam.e_per_adu
+        out = out.floor()
+        out += cam.baseline
+        out = torch.max(out, torch.tensor([0.]))
+
+        if cam.photon_units:
+            out = (out - cam.baseline) * cam.e_per_adu
+            if cam._em_gain is not None:
+                out /= cam._em_gain
+            out -= cam.spur
+            out /= cam.qe
+
+        return out
+
+    @pytest.mark.parametrize("photon_units", [False, True])
+    def test_forward_reference(self, cam_fix, photon_units):
+        """Fused forward draws the same random numbers as the reference, i.e. same output up to rounding"""
+        cam_fix.photon_units = photon_units
+        x = torch.rand((8, 64, 64)) * 1000.
+        x[0] = 0.
+
+        torch.manual_seed(0)
+        out = cam_fix.forward(x)
+
+        torch.manual_seed(0)
+        out_ref = self._forward_reference(cam_fix, x)
+
+        tol = 1. if not photon_units else cam_fix.e_per_adu / (cam_fix._em_gain or 1.) / cam_fix.qe
+        assert torch.allclose(out, out_ref, atol=tol * 1.01)
+        assert (x >= 0).all(), "Input must not be modified."
+
+    def test_forward_custom_noise(self):
+        """Noise distributions other than the built-in ones are not bypassed by the fused camera model"""
+
+        class ConstReadout(noise_distributions.Gaussian):
+            def forward(self, x, generator=None):
+                return x + 1000.
+
+        cam = camera.Photon2Camera(qe=1.0, spur_noise=0., em_gain=None, e_per_adu=1., baseline=0., read_sigma=0.,
+                                   photon_units=False)
+        cam.read = ConstReadout(sigma=0.)
+
+        assert not cam._fusable
+        assert (cam.forward(torch.rand((2, 32, 32)) * 100.) >= 1000.).all()
+
+        class ConstReadoutNoGenerator(noise_distributions.Gaussian):
+            def forward(self, x):
+                return x + 1000.
+
+        """Without an RNG context no generator is passed"""
+        cam.read = ConstReadoutNoGenerator(sigma=0.)
+        assert (cam.forward(torch.rand((2, 32, 32)) * 100.) >= 1000.).all()
+
+    @pytest.mark.benchmark
+    def test_forward_benchmark(self, cam_fix):
+        cam_fix.photon_units = False
+        x = torch.rand((1024, 64, 64)) * 1000.
+
+        for fn in (cam_fix.forward, lambda x: self._forward_reference(cam_fix, x)):  # warm up
+            fn(x)
+
+        t0 = time.perf_counter()
+        out = self._forward_reference(cam_fix, x)
+        t_ref = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        out_fused = cam_fix.forward(x)
+        t_fused = time.perf_counter() - t0
+
+        print(f"Camera forward of 1024 x 64 x 64 frames: separate passes {t_ref:.3f}s, fused {t_fused:.3f}s.")
+
+        assert abs(out.mean() - out_fused.mean()) / out.mean() <= 0.01
+
     @pytest.mark.skipif(not torch.cuda.is_available(), reason="Shipping to CUDA makes only sense if CUDA is available.")
     @pytest.mark.parametrize("input_device", ["cpu", "cuda"])
     @pytest.mark.parametrize("forward_device", ["cpu", "cuda"])
@@ -66,3 +151,22 @@ class TestSCMOS(TestPhoton2Camera):
 
         return camera.SCMOS(sample_mode='batch', qe=1.0, spur_noise=0.002, em_gain=300., e_per_adu=45.,
                             baseline=100, read_sigma=read_sigma, photon_units=False)
+
+
+class TestStandardGamma:
+
+    def test_generator(self):
+        x = torch.rand((32, 32)) * 100.
+
+        out = noise_distributions.standard_gamma(x, torch.Generator().manual_seed(0))
+        assert (out == noise_distributions.standard_gamma(x, torch.Generator().manual_seed(0))).all()
+        assert (out > 0).all()
+
+        assert noise_distributions.standard_gamma(x).size() == x.size()
+
+    def test_private_sampler_missing(self, monkeypatch):
+        """Sampling from a generator fails clearly if torch does not provide the private sampler"""
+        monkeypatch.delattr(torch, '_standard_gamma')
+
+        with pytest.raises(RuntimeError):
+            noise_distributions.standard_gamma(torch.ones(10), torch.Generator())
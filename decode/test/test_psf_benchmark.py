@@ -0,0 +1,60 @@
+import pytest
+
+import decode.simulation.psf_benchmark as psf_benchmark
+
+
+class TestPSFBenchmark:
+
+    @pytest.fixture()
+    def results(self):
+        return psf_benchmark.run_suite(psfs=['DeltaPSF', 'GaussianPSF'], img_sizes=(16,), densities=(1, 10),
+                                       z_extents=((-500., 500.),), n_frames=2, repeats=1)
+
+    def test_run_suite(self, results):
+        assert set(results['cases'].keys()) == {
+            'DeltaPSF/img16/dens1/z-500_500', 'DeltaPSF/img16/dens10/z-500_500',
+            'GaussianPSF/img16/dens1/z-500_500', 'GaussianPSF/img16/dens10/z-500_500'}
+
+        for metrics in results['cases'].values():
+            assert metrics['frames_per_s'] > 0
+            assert metrics['emitters_per_s'] > metrics['frames_per_s'] * 0.99
+
+        assert 'torch' in results['meta']
+
+    def test_unavailable_psf(self):
+        with pytest.raises(ValueError):
+            psf_benchmark.run_suite(psfs=['CubicSplinePSF'])
+
+    def test_save_load(self, results, tmpdir):
+        psf_benchmark.save_results(results, tmpdir / 'bench.json')
+        assert psf_benchmark.load_results(tmpdir / 'bench.json') == results
+
+    def test_compare(self):
+        baseline = {'cases': {'a': {'frames_per_s': 100., 'emitters_per_s': 1000.},
+                              'b': {'emitters_per_s': 10.}}}
+        results = {'cases': {'a': {'frames_per_s': 85., 'emitters_per_s': 700.},
+                             'b': {'emitters_per_s': 20.},
+                             'c': {'emitters_per_s': 1.}}}
+
+        regressions = psf_benchmark.compare(results, baseline, tolerance=0.2)
+
+        assert len(regressions) == 1
+        assert regressions[0]['case'] == 'a' and regressions[0]['metric'] == 'emitters_per_s'
+        assert regressions[0]['ratio'] == pytest.approx(0.7)
+
+        assert len(psf_benchmark.compare(results, baseline, tolerance=0.5)) == 0
+
+    def test_main(self, results, tmpdir, monkeypatch):
+        monkeypatch.setattr(psf_benchmark, 'run_suite', lambda **kwargs: results)
+
+        assert psf_benchmark.main(['-o', str(tmpdir / 'bench.json')]) == 0
+        assert psf_benchmark.main(['-b', str(tmpdir / 'bench.json')]) == 0
+
+        """Baseline that is twice as fast"""
+        baseline = psf_benchmark.load_results(tmpdir / 'bench.json')
+        for metrics in baseline['cases'].values():
+            for k in metrics:
+                metrics[k] *= 2
+        psf_benchmark.save_results(baseline, tmpdir / 'baseline.json')
+
+        assert psf_benchmark.main(['-b', str(tmpdir / 'baseline.json')]) == 1
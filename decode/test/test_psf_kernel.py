@@ -1,14 +1,19 @@
 import pathlib
 import pickle
 import random
+import time
+from unittest import mock
 from abc import ABC, abstractmethod
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pytest
 import torch
 
+import decode.utils.cache
 import decode.utils.calibration_io as load_cal
 import decode.plot.frame_coord as plf
+import decode.generic.emitter as emitter
 import decode.generic.test_utils as tutil
 import decode.simulation.psf_kernel as psf_kernel
 from . import asset_handler
@@ -204,6 +209,40 @@ class TestDeltaPSF:
         """Assert"""
         assert frames[0, 0, 0] in (1., 2.)
 
+    @pytest.mark.benchmark
+    @pytest.mark.parametrize("batch_size", [32, 64, 128])
+    def test_forward_benchmark(self, batch_size):
+        """Batches of training size (frames of 64 x 64 with a couple of emitters each) vs. searchsorted + indexing"""
+        delta = psf_kernel.DeltaPSF(xextent=(-0.5, 63.5), yextent=(-0.5, 63.5), img_shape=(64, 64))
+
+        n = batch_size * 20
+        xyz = torch.rand(n, 3) * 70 - 3
+        weight = torch.rand(n)
+        frame_ix = torch.randint(batch_size, size=(n,))
+
+        def forward_ref():
+            frames = torch.zeros(batch_size, 64, 64)
+            mask = (xyz[:, :2] >= -0.5).all(1) * (xyz[:, :2] < 63.5).all(1)
+            x_ix = np.searchsorted(delta._bin_x, xyz[mask, 0], side='right') - 1
+            y_ix = np.searchsorted(delta._bin_y, xyz[mask, 1], side='right') - 1
+            frames[frame_ix[mask], x_ix, y_ix] = weight[mask]
+            return frames
+
+        t0 = time.perf_counter()
+        for _ in range(100):
+            frames_ref = forward_ref()
+        t_ref = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _ in range(100):
+            frames = delta.forward(xyz, weight, frame_ix, 0, batch_size - 1)
+        t_fused = time.perf_counter() - t0
+
+        print(f"DeltaPSF forward of {n} emitters on {batch_size} frames (x100): reference {t_ref:.3f}s, "
+              f"fused {t_fused:.3f}s.")
+
+        assert ((frames == frames_ref) | (frames_ref != 0) & (frames != 0)).all()
+
 
 class TestGaussianExpect(TestSingleFrameImplementedPSF):
 
@@ -244,6 +283,93 @@ class TestGaussianExpect(TestSingleFrameImplementedPSF):
         assert (frames[1:3] == 0).all()
         assert (frames[-1] != 0).any()
 
+    def test_batched_equivalence(self, psf):
+        """Batched forward vs. single frame wrapper with unsorted frame indices"""
+        psf.peak_weight = False
+
+        xyz = torch.rand(50, 3) * torch.tensor([64., 64., 0.]) - torch.tensor([.5, .5, 0.])
+        phot = torch.rand(50) * 1000
+        frame_ix = torch.randint(-2, 8, size=(50,))
+
+        frames = psf.forward(xyz, phot, frame_ix, 0, 5)
+        frames_wrapper = psf._forward_single_frame_wrapper(xyz, phot, frame_ix, 0, 5)
+
+        assert frames.size() == frames_wrapper.size() == torch.Size([6, 64, 64])
+        assert tutil.tens_almeq(frames, frames_wrapper, 1e-2 * phot.max().item())
+
+    @pytest.mark.benchmark
+    def test_batched_benchmark(self, psf):
+        n_frames = 10000
+        xyz = torch.rand(n_frames * 5, 3) * torch.tensor([64., 64., 0.]) - torch.tensor([.5, .5, 0.])
+        phot = torch.ones(n_frames * 5)
+        frame_ix = torch.randint(n_frames, size=(n_frames * 5,))
+
+        t0 = time.perf_counter()
+        psf._forward_single_frame_wrapper(xyz, phot, frame_ix, 0, n_frames - 1)
+        t_wrapper = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        psf.forward(xyz, phot, frame_ix, 0, n_frames - 1)
+        t_batched = time.perf_counter() - t0
+
+        print(f"GaussianPSF, {n_frames} frames: single frame wrapper {t_wrapper:.3f}s, batched {t_batched:.3f}s.")
+
+
+class TestGaussianPSFROI(TestGaussianExpect):
+
+    @pytest.fixture(scope='class', params=[None, (-5000., 5000.)])
+    def psf(self, request):
+        return psf_kernel.GaussianPSF((-0.5, 63.5), (-0.5, 63.5), request.param, img_shape=(64, 64), sigma_0=1.5,
+                                      roi_radius=10)
+
+    @pytest.fixture(scope='class')
+    def psf_full(self, psf):
+        return psf_kernel.GaussianPSF(psf.xextent, psf.yextent, psf.zextent, img_shape=psf.img_shape,
+                                      sigma_0=psf.sigma_0)
+
+    @pytest.mark.parametrize("peak_weight", [False, True])
+    def test_equivalence_full_frame(self, psf, psf_full, peak_weight):
+        psf.peak_weight = peak_weight
+        psf_full.peak_weight = peak_weight
+
+        xyz = torch.rand(100, 3) * torch.tensor([70., 70., 600.]) - torch.tensor([3., 3., 300.])
+        phot = torch.rand(100) * 1000
+        frame_ix = torch.randint(5, size=(100,))
+
+        frames = psf.forward(xyz, phot, frame_ix, 0, 4)
+        frames_full = psf_full.forward(xyz, phot, frame_ix, 0, 4)
+
+        assert frames.size() == frames_full.size()
+        assert tutil.tens_almeq(frames, frames_full, 1e-2 * phot.max().item())
+
+    def test_truncation(self):
+        psf = psf_kernel.GaussianPSF((-0.5, 63.5), (-0.5, 63.5), None, img_shape=(64, 64), sigma_0=1.5, roi_radius=0)
+        frames = psf.forward(torch.tensor([[10., 20., 0.]]), torch.tensor([1.]))
+
+        assert (frames.nonzero() == torch.tensor([[0, 10, 20]])).all()
+
+        with pytest.raises(ValueError):
+            psf_kernel.GaussianPSF((-0.5, 63.5), (-0.5, 63.5), None, img_shape=(64, 64), sigma_0=1.5, roi_radius=-1)
+
+    @pytest.mark.benchmark
+    @pytest.mark.parametrize("n_per_frame", [1, 10, 100])
+    def test_density_benchmark(self, psf, psf_full, n_per_frame):
+        n_frames = 100
+        xyz = torch.rand(n_frames * n_per_frame, 3) * torch.tensor([64., 64., 1000.]) - torch.tensor([.5, .5, 500.])
+        phot = torch.ones(n_frames * n_per_frame)
+        frame_ix = torch.arange(n_frames).repeat_interleave(n_per_frame)
+
+        t0 = time.perf_counter()
+        psf_full.forward(xyz, phot, frame_ix, 0, n_frames - 1)
+        t_full = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        psf.forward(xyz, phot, frame_ix, 0, n_frames - 1)
+        t_roi = time.perf_counter() - t0
+
+        print(f"GaussianPSF, {n_frames} frames of 64x64 with {n_per_frame} emitters each: "
+              f"full frame {t_full:.3f}s, ROI {t_roi:.3f}s.")
+
 
 class TestCubicSplinePSF(AbstractPSFTest):
     cdir = pathlib.Path(__file__).resolve().parent
@@ -360,6 +486,94 @@ class TestCubicSplinePSF(AbstractPSFTest):
     def test_pickleability_cuda(self, psf_cuda):
         self.test_pickleability_cpu(psf_cuda)
 
+    def test_coeff_cache(self, psf, tmpdir):
+        smap_psf = load_cal.SMAPSplineCoefficient(calib_file=str(self.bead_cal_file), cache_dir=tmpdir)
+        smap_psf_cached = load_cal.SMAPSplineCoefficient(calib_file=str(self.bead_cal_file), cache_dir=tmpdir)
+
+        assert (smap_psf_cached.coeff == psf._coeff).all()
+        assert smap_psf_cached.ref0 == smap_psf.ref0
+        assert smap_psf_cached.dz == smap_psf.dz
+
+        psf_cached = psf_kernel.CubicSplinePSF(xextent=psf.xextent, yextent=psf.yextent, img_shape=psf.img_shape,
+                                               ref0=psf.ref0, coeff=psf._coeff, vx_size=psf.vx_size,
+                                               roi_size=psf.roi_size_px, device='cpu', cache_dir=tmpdir)
+        assert psf_cached._coeff_file.is_file()
+
+        """Pickled instances attach to the cache file instead of carrying the coefficients"""
+        psf_str = pickle.dumps(psf_cached)
+        assert len(psf_str) < len(pickle.dumps(psf)) // 10
+
+        psf_unpickled = pickle.loads(psf_str)
+        xyz = torch.rand(10, 3) * torch.tensor([64., 64., 1000.]) - torch.tensor([0., 0., 500.])
+        phot = torch.ones(10) * 1000
+
+        assert (psf_unpickled.forward(xyz, phot) == psf.forward(xyz, phot)).all()
+
+        """Coefficients are not hashed again if their key is known (copies by cpu / cuda, calibration file)"""
+        with mock.patch.object(decode.utils.cache, 'hash_key', wraps=decode.utils.cache.hash_key) as hash_key:
+            psf_kernel.CubicSplinePSF(xextent=psf.xextent, yextent=psf.yextent, img_shape=psf.img_shape,
+                                      ref0=psf.ref0, coeff=psf._coeff, vx_size=psf.vx_size, roi_size=psf.roi_size_px,
+                                      device='cpu', cache_dir=tmpdir, coeff_key=psf_cached._coeff_key)
+            smap_psf.init_spline(xextent=psf.xextent, yextent=psf.yextent, img_shape=psf.img_shape, device='cpu')
+
+        assert not any(isinstance(a, torch.Tensor) and a.numel() > 3 for c in hash_key.call_args_list for a in c[0])
+        assert psf_unpickled._coeff_key == psf_cached._coeff_key
+
+    def test_threaded(self, psf):
+        psf_threaded = psf_kernel.CubicSplinePSF(xextent=psf.xextent, yextent=psf.yextent, img_shape=psf.img_shape,
+                                                 ref0=psf.ref0, coeff=psf._coeff, vx_size=psf.vx_size,
+                                                 roi_size=psf.roi_size_px, device='cpu', n_threads=4)
+
+        n = 1000
+        xyz = torch.rand(n, 3) * torch.tensor([64., 64., 1000.]) - torch.tensor([0., 0., 500.])
+        phot = torch.rand(n) * 1000
+        bg = torch.rand(n) * 10
+        frame_ix = torch.randint(-5, 50, size=(n,))
+        frame_ix[frame_ix >= 40] = 3  # uneven load
+
+        assert (psf_threaded.forward(xyz, phot, frame_ix, 0, 49) == psf.forward(xyz, phot, frame_ix, 0, 49)).all()
+
+        drv, rois = psf.derivative(xyz[:100], phot[:100], bg[:100])
+        drv_threaded, rois_threaded = psf_threaded.derivative(xyz[:100], phot[:100], bg[:100])
+        assert (drv_threaded == drv).all()
+        assert (rois_threaded == rois).all()
+
+        """Thread pool is not pickled but recreated on demand"""
+        psf_threaded.forward(xyz, phot, frame_ix, 0, 49)
+        psf_unpickled = pickle.loads(pickle.dumps(psf_threaded))
+        assert psf_unpickled._thread_pool is None
+        assert (psf_unpickled.forward(xyz, phot, frame_ix, 0, 49) == psf.forward(xyz, phot, frame_ix, 0, 49)).all()
+
+    def test_threaded_invalid(self, psf):
+        with pytest.raises(ValueError):
+            psf_kernel.CubicSplinePSF(xextent=psf.xextent, yextent=psf.yextent, img_shape=psf.img_shape,
+                                      ref0=psf.ref0, coeff=psf._coeff, vx_size=psf.vx_size,
+                                      roi_size=psf.roi_size_px, device='cpu', n_threads=0)
+
+    @pytest.mark.benchmark
+    @pytest.mark.parametrize("n_threads", [1, 4, 16])
+    def test_threaded_benchmark(self, psf, n_threads):
+        psf = psf_kernel.CubicSplinePSF(xextent=psf.xextent, yextent=psf.yextent, img_shape=psf.img_shape,
+                                        ref0=psf.ref0, coeff=psf._coeff, vx_size=psf.vx_size,
+                                        roi_size=psf.roi_size_px, device='cpu', n_threads=n_threads)
+
+        n = 100000
+        xyz = torch.rand(n, 3) * torch.tensor([64., 64., 1000.]) - torch.tensor([0., 0., 500.])
+        phot = torch.ones(n) * 1000
+        bg = torch.ones(n) * 10
+        frame_ix = torch.randint(1000, size=(n,))
+
+        t0 = time.perf_counter()
+        psf.forward(xyz, phot, frame_ix, 0, 999)
+        t_forward = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        psf.derivative(xyz[:10000], phot[:10000], bg[:10000])
+        t_drv = time.perf_counter() - t0
+
+        print(f"CubicSplinePSF with {n_threads} threads: forward of 100k emitters on 1000 frames {t_forward:.3f}s, "
+              f"derivative of 10k emitters {t_drv:.3f}s.")
+
     @psf_cuda_available
     def test_roi_cuda_cpu(self, psf, psf_cuda, onek_rois):
         """
@@ -703,3 +917,197 @@ class TestCubicSplinePSF(AbstractPSFTest):
         assert tutil.tens_almeq(diff_inv[:, 4], torch.zeros_like(diff_inv[:, 4]), 1e-3)
 
         assert rois.size() == torch.Size([n, *psf.roi_size_px]), "Wrong dimension of ROIs."
+
+    def test_inv_cholesky_diag(self):
+        a = torch.rand(100, 5, 5)
+        fisher = a @ a.transpose(-1, -2) + torch.eye(5)
+
+        diag = psf_kernel.CubicSplinePSF.inv_cholesky_diag(fisher)
+        assert tutil.tens_almeq(diag, torch.diagonal(torch.inverse(fisher), dim1=1, dim2=2), 1e-4)
+
+        """Not positive definite falls back to the general inverse"""
+        fisher[0] = -torch.eye(5)
+        assert (psf_kernel.CubicSplinePSF.inv_cholesky_diag(fisher)[0] == -1.).all()
+
+    @pytest.mark.parametrize("n_threads", [1, 4])
+    def test_crlb_chunked(self, psf, onek_rois, n_threads):
+        xyz, phot, bg, n = onek_rois
+        psf.n_threads = n_threads
+
+        crlb, _ = psf.crlb(xyz, phot, bg)
+
+        """Memory ceiling of a couple of emitters enforces many chunks"""
+        out = torch.zeros(n, psf.n_par)
+        crlb_chunked = psf.crlb_chunked(xyz, phot, bg, out=out, max_bytes=2 ** 20)
+
+        assert crlb_chunked is out
+        assert tutil.tens_almeq(crlb_chunked[:, :2], crlb[:, :2], 1e-4)
+        assert tutil.tens_almeq(crlb_chunked[:, 2], crlb[:, 2], 1e-1)
+        assert tutil.tens_almeq(crlb_chunked[:, 3], crlb[:, 3], 1e2)
+        assert tutil.tens_almeq(crlb_chunked[:, 4], crlb[:, 4], 1e-3)
+
+        crlb_inv = psf.crlb_chunked(xyz, phot, bg, inversion=torch.inverse, max_bytes=2 ** 20)
+        assert torch.allclose(crlb_inv, crlb, rtol=1e-4)
+
+        with pytest.raises(ValueError):
+            psf.crlb_chunked(xyz, phot, bg, out=torch.zeros(n, 3))
+
+    def test_populate_crlb(self, psf, onek_rois):
+        xyz, phot, bg, n = onek_rois
+        em = emitter.EmitterSet(xyz, phot, torch.zeros(n).long(), bg=bg, xy_unit='px')
+
+        em.populate_crlb(psf, max_bytes=2 ** 20)
+        crlb, _ = psf.crlb(xyz, phot, bg)
+
+        assert tutil.tens_almeq(em.xyz_cr[:, :2], crlb[:, :2], 1e-4)
+        assert em.phot_cr.size() == em.bg_cr.size() == torch.Size([n])
+
+
+class TestLookupTablePSF(AbstractPSFTest):
+
+    @pytest.fixture(scope='class')
+    def psf_gauss(self):
+        return psf_kernel.GaussianPSF((-0.5, 63.5), (-0.5, 63.5), (-500., 500.), img_shape=(64, 64), sigma_0=1.5)
+
+    @pytest.fixture(scope='class')
+    def psf(self, psf_gauss):
+        return psf_kernel.LookupTablePSF(psf_gauss, z_range=(-500., 500.), n_z=41, roi_size=(31, 31), oversampling=8)
+
+    def test_accuracy(self, psf, psf_gauss):
+        xyz = torch.rand(100, 3) * torch.tensor([64., 64., 1000.]) - torch.tensor([.5, .5, 500.])
+        phot = torch.ones(100) * 1000
+        frame_ix = torch.randint(10, size=(100,))
+
+        frames = psf.forward(xyz, phot, frame_ix, 0, 9)
+        frames_ref = psf_gauss.forward(xyz, phot, frame_ix, 0, 9)
+
+        assert frames.size() == frames_ref.size()
+        assert (frames - frames_ref).abs().max() <= 0.02 * frames_ref.max()
+        assert frames.sum().item() == pytest.approx(frames_ref.sum().item(), rel=0.02)
+
+    def test_disk_cache(self, psf_gauss, tmpdir):
+        psf = psf_kernel.LookupTablePSF(psf_gauss, z_range=(-500., 500.), n_z=5, roi_size=(9, 9),
+                                        cache_dir=tmpdir, cache_key='gauss')
+
+        with mock.patch.object(psf_kernel.LookupTablePSF, '_sample') as sample:
+            psf_cached = psf_kernel.LookupTablePSF(psf_gauss, z_range=(-500., 500.), n_z=5, roi_size=(9, 9),
+                                                   cache_dir=tmpdir, cache_key='gauss')
+            sample.assert_not_called()
+
+        assert (psf_cached._table == psf._table).all()
+
+        # different extent or calibration is a different entry
+        with mock.patch.object(psf_kernel.LookupTablePSF, '_sample', return_value=torch.zeros(5, 5, 5, 9, 9)) \
+                as sample:
+            psf_kernel.LookupTablePSF(psf_gauss, z_range=(-400., 400.), n_z=5, roi_size=(9, 9),
+                                      cache_dir=tmpdir, cache_key='gauss')
+            psf_kernel.LookupTablePSF(psf_gauss, z_range=(-500., 500.), n_z=5, roi_size=(9, 9),
+                                      cache_dir=tmpdir, cache_key='other')
+            assert sample.call_count == 2
+
+        with pytest.raises(ValueError):
+            psf_kernel.LookupTablePSF(psf_gauss, z_range=(-500., 500.), n_z=5, roi_size=(9, 9), cache_dir=tmpdir)
+
+    def test_table_memory_bound(self, psf_gauss):
+        with pytest.raises(ValueError):
+            psf_kernel.LookupTablePSF(psf_gauss, z_range=(-500., 500.), n_z=1000, roi_size=(64, 64),
+                                      oversampling=16, max_table_bytes=2 ** 20)
+
+    @pytest.mark.benchmark
+    def test_spline_benchmark(self):
+        asset_handler.AssetHandler().auto_load(TestCubicSplinePSF.bead_cal_file)
+        smap_psf = load_cal.SMAPSplineCoefficient(calib_file=str(TestCubicSplinePSF.bead_cal_file))
+        psf_spline = psf_kernel.CubicSplinePSF(xextent=(-0.5, 63.5), yextent=(-0.5, 63.5), img_shape=(64, 64),
+                                               ref0=smap_psf.ref0, coeff=smap_psf.coeff, vx_size=(1., 1., 10),
+                                               roi_size=(32, 32), device='cpu')
+
+        t0 = time.perf_counter()
+        psf = psf_kernel.LookupTablePSF(psf_spline, z_range=(-750., 750.), n_z=151, roi_size=(25, 25))
+        t_table = time.perf_counter() - t0
+
+        n = 100000
+        xyz = torch.rand(n, 3) * torch.tensor([64., 64., 1000.]) - torch.tensor([.5, .5, 500.])
+        phot = torch.ones(n) * 1000
+        frame_ix = torch.randint(1000, size=(n,))
+
+        t0 = time.perf_counter()
+        frames_ref = psf_spline.forward(xyz, phot, frame_ix, 0, 999)
+        t_spline = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        frames = psf.forward(xyz, phot, frame_ix, 0, 999)
+        t_lut = time.perf_counter() - t0
+
+        err = ((frames - frames_ref).abs().max() / frames_ref.max()).item()
+        print(f"{n} emitters on 1000 frames: CubicSplinePSF {t_spline:.3f}s, LookupTablePSF {t_lut:.3f}s "
+              f"(table {t_table:.3f}s), max. error relative to peak {err:.4f}.")
+
+
+class TestFFTConvolutionPSF(AbstractPSFTest):
+
+    @pytest.fixture(scope='class')
+    def psf_gauss(self):
+        return psf_kernel.GaussianPSF((-0.5, 63.5), (-0.5, 63.5), (-500., 500.), img_shape=(64, 64), sigma_0=1.5)
+
+    @pytest.fixture(scope='class')
+    def psf(self, psf_gauss):
+        return psf_kernel.FFTConvolutionPSF(psf_gauss, z_range=(-500., 500.), n_z=41, kernel_size=31,
+                                            oversampling=4, mode='fft')
+
+    def test_accuracy(self, psf, psf_gauss):
+        n = 2000
+        xyz = torch.rand(n, 3) * torch.tensor([70., 70., 1000.]) - torch.tensor([3.5, 3.5, 500.])
+        phot = torch.ones(n) * 1000
+        frame_ix = torch.randint(5, size=(n,))
+
+        frames = psf.forward(xyz, phot, frame_ix, 0, 4)
+        frames_ref = psf_gauss.forward(xyz, phot, frame_ix, 0, 4)
+
+        assert frames.size() == frames_ref.size()
+        assert (frames - frames_ref).abs().max() <= 0.02 * frames_ref.max()
+        assert frames.sum().item() == pytest.approx(frames_ref.sum().item(), rel=0.02)
+
+    def test_auto_mode(self, psf_gauss):
+        psf = psf_kernel.FFTConvolutionPSF(psf_gauss, z_range=(-500., 500.), n_z=5, kernel_size=15,
+                                           density_crossover=100.)
+
+        xyz = torch.rand(1000, 3) * 64
+        frame_ix = torch.randint(5, size=(1000,))
+
+        with mock.patch.object(psf, '_forward_batched', wraps=psf._forward_batched) as fft:
+            psf.forward(xyz, torch.ones(1000), frame_ix, 0, 4)  # 200 per frame
+            assert fft.call_count == 1
+
+            psf.forward(xyz, torch.ones(1000), frame_ix, 0, 99)  # 10 per frame
+            assert fft.call_count == 1
+
+        with pytest.raises(ValueError):
+            psf_kernel.FFTConvolutionPSF(psf_gauss, z_range=(-500., 500.), n_z=5, kernel_size=14)
+
+        with pytest.raises(ValueError):
+            psf_kernel.FFTConvolutionPSF(psf_gauss, z_range=(-500., 500.), n_z=5, kernel_size=15, mode='dense')
+
+    @pytest.mark.benchmark
+    @pytest.mark.parametrize("density", [10, 100, 1000, 5000])
+    def test_crossover_benchmark(self, psf_gauss, density):
+        """Time per frame of ROI vs. FFT rendering by emitter density, the crossover sets density_crossover"""
+        psf_roi = psf_kernel.GaussianPSF((-0.5, 63.5), (-0.5, 63.5), (-500., 500.), img_shape=(64, 64),
+                                         sigma_0=1.5, roi_radius=12)
+        psf = psf_kernel.FFTConvolutionPSF(psf_roi, z_range=(-500., 500.), n_z=31, kernel_size=25, mode='fft')
+
+        n_frames = 20
+        n = density * n_frames
+        xyz = torch.rand(n, 3) * torch.tensor([64., 64., 1000.]) - torch.tensor([.5, .5, 500.])
+        phot = torch.ones(n) * 1000
+        frame_ix = torch.randint(n_frames, size=(n,))
+
+        t0 = time.perf_counter()
+        psf_roi.forward(xyz, phot, frame_ix, 0, n_frames - 1)
+        t_roi = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        psf.forward(xyz, phot, frame_ix, 0, n_frames - 1)
+        t_fft = time.perf_counter() - t0
+
+        print(f"{density} emitters per frame (64 x 64): ROI {t_roi / n_frames * 1e3:.2f}ms, "
+              f"FFT {t_fft / n_frames * 1e3:.2f}ms per frame.")
@@ -34,6 +34,54 @@ class TestRenderer2D:
         assert histogram[1, 5] != 0
         assert histogram.sum() == histogram[1, 5]
 
+    @pytest.mark.parametrize("extent", [(0., 100.), None])
+    def test_forward_lazy(self, rend, extent, tmpdir):
+        """Chunk wise rendering of an out-of-core set is the same as rendering it at once."""
+        from decode.utils import emitter_io
+
+        rend.xextent = extent
+        em = emitter.RandomEmitterSet(1000, extent=1., xy_unit='px', px_size=(100., 100.))
+        em.save(tmpdir / 'em.h5')
+        em_lazy = emitter_io.LazyH5EmitterSet(tmpdir / 'em.h5', chunk_size=300)
+
+        assert (rend.forward(em_lazy) == rend.forward(em)).all()
+
+        with pytest.raises(NotImplementedError):
+            rend.forward(em_lazy, col_vec=torch.rand(1000))
+
+    def test_forward_empty(self, rend, tmpdir):
+        from decode.utils import emitter_io
+
+        em = emitter.EmptyEmitterSet(xy_unit='nm', px_size=(100., 100.))
+        em.save(tmpdir / 'em.h5')
+        em_lazy = emitter_io.LazyH5EmitterSet(tmpdir / 'em.h5', chunk_size=300)
+
+        assert (rend.forward(em) == 0.).all()
+        assert (rend.forward(em_lazy) == rend.forward(em)).all()
+
+        rend.xextent = None
+        assert rend.forward(em).size(0) == 1
+        assert (rend.forward(em) == 0.).all()
+        with pytest.raises(ValueError):
+            rend.get_extent(em)
+        with pytest.raises(ValueError):
+            rend.get_extent(em_lazy)
+
+    def test_forward_empty_extent(self, rend, em):
+        """Extent of a single emitter"""
+        rend.xextent, rend.yextent, rend.zextent = None, None, None
+
+        assert rend.forward(em).size() == torch.Size([1, 1])
+
+    def test_forward_conversion_cache(self, rend):
+        em = emitter.RandomEmitterSet(100, extent=1., xy_unit='px', px_size=(100., 100.))
+
+        with emitter.conversion_cache_stats() as stats:
+            rend.forward(em)
+
+        assert stats.misses == 2  # the input set and the subset within the extent
+        assert stats.hits >= 2
+
     @pytest.mark.plot
     def test_plot_frame_render_visual(self, rend, em):
         PlotFrameCoord(torch.zeros((101, 101)), em.xyz_nm).plot()
@@ -0,0 +1,122 @@
+import time
+
+import pytest
+import torch
+
+import decode.simulation.background as background
+import decode.simulation.camera as camera
+import decode.simulation.emitter_generator as emitter_generator
+import decode.simulation.psf_kernel as psf_kernel
+import decode.simulation.simulator as simulator
+import decode.simulation.structure_prior as structure_prior
+from decode.simulation.rng import RNGContext
+
+
+class TestRNGContext:
+
+    def test_derivation(self):
+        rng = RNGContext(42)
+
+        assert rng.seed_of('camera', 3) == RNGContext(42).seed_of('camera', 3)
+        assert rng.seed_of('camera', 3) != rng.seed_of('camera', 4)
+        assert rng.seed_of('camera', 3) != rng.seed_of('background', 3)
+        assert rng.seed_of('camera', 3) != RNGContext(43).seed_of('camera', 3)
+        assert rng.seed_of(-1) >= 0
+
+        assert rng.spawn(0).seed != rng.spawn(1).seed
+        assert rng.spawn(0).seed == RNGContext(42).spawn(0).seed
+
+    def test_generator(self):
+        rng = RNGContext(42)
+
+        x = torch.rand(100, generator=rng.generator('a', 0))
+        assert (x == torch.rand(100, generator=rng.generator('a', 0))).all()
+        assert not (x == torch.rand(100, generator=rng.generator('a', 1))).all()
+
+
+class TestComponents:
+
+    @pytest.fixture()
+    def frames(self):
+        return torch.rand(10, 32, 32) * 100.
+
+    def test_camera(self, frames):
+        """Noise of a frame depends on its frame index only, not on the other frames of the call"""
+        cam = camera.Photon2Camera(qe=0.9, spur_noise=0.002, em_gain=100., e_per_adu=45., baseline=100.,
+                                   read_sigma=74.4, photon_units=False)
+        rng = RNGContext(42)
+
+        out = cam.forward(frames, rng=rng, frame_ix=range(10))
+        out_part = cam.forward(frames[3:7], rng=rng, frame_ix=range(3, 7))
+
+        assert (out[3:7] == out_part).all()
+        assert not (out[3] == cam.forward(frames[3:4], rng=rng, frame_ix=[4])[0]).all()
+
+        with pytest.raises(ValueError):
+            cam.forward(frames, rng=rng)
+
+    def test_background(self, frames):
+        bg = background.UniformBackground((1., 100.))
+        rng = RNGContext(42)
+
+        _, bg_frames = bg.forward(frames, rng=rng, frame_ix=range(10))
+        _, bg_part = bg.forward(frames[5:], rng=rng, frame_ix=range(5, 10))
+
+        assert (bg_frames[5:] == bg_part).all()
+        assert (bg_frames >= 1.).all() and (bg_frames <= 100.).all()
+        assert bg_frames[:, 0, 0].unique().numel() == 10
+
+        _, bg_const = background.UniformBackground(10.).forward(frames, rng=rng, frame_ix=range(10))
+        assert (bg_const == 10.).all()
+
+    def test_background_custom_sampler(self, frames):
+        def sampler(sample_shape, generator=None):
+            return torch.rand(sample_shape, generator=generator) * 10.
+
+        rng = RNGContext(42)
+        bg = background.UniformBackground(bg_sampler=sampler, bg_sampler_generator=True)
+
+        _, bg_frames = bg.forward(frames, rng=rng, frame_ix=range(10))
+        _, bg_part = bg.forward(frames[5:], rng=rng, frame_ix=range(5, 10))
+        assert (bg_frames[5:] == bg_part).all()
+
+        """Samplers that do not take a generator are rejected"""
+        bg_no_gen = background.UniformBackground(bg_sampler=torch.distributions.Uniform(0., 10.).sample)
+        assert not bg_no_gen.supports_rng
+        with pytest.raises(ValueError):
+            bg_no_gen.forward(frames, rng=rng, frame_ix=range(10))
+
+        psf = psf_kernel.DeltaPSF((-0.5, 31.5), (-0.5, 31.5), (32, 32))
+        with pytest.raises(ValueError):
+            simulator.Simulation(psf=psf, background=bg_no_gen, rng=rng)
+
+    @pytest.mark.benchmark
+    def test_camera_benchmark(self):
+        """Cost of the frame wise camera noise with an RNG context vs. the whole batch from the global RNG"""
+        cam = camera.Photon2Camera(qe=0.9, spur_noise=0.002, em_gain=100., e_per_adu=45., baseline=100.,
+                                   read_sigma=74.4, photon_units=False)
+        rng = RNGContext(42)
+        x = torch.rand((1024, 64, 64)) * 100.
+
+        t0 = time.perf_counter()
+        cam.forward(x)
+        t_batch = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        cam.forward(x, rng=rng, frame_ix=range(1024))
+        t_rng = time.perf_counter() - t0
+
+        print(f"Camera forward of 1024 x 64 x 64 frames: global RNG {t_batch:.3f}s, frame wise RNG {t_rng:.3f}s.")
+
+    def test_emitter_sampler(self):
+        prior = structure_prior.RandomStructure((-0.5, 31.5), (-0.5, 31.5), (-750., 750.))
+        sampler = emitter_generator.EmitterSamplerBlinking(structure=prior, intensity_mu_sig=(1000., 100.),
+                                                            lifetime=2., frame_range=(0, 99), xy_unit='px',
+                                                            px_size=(100., 100.), em_avg=10.)
+
+        em = sampler.sample(generator=RNGContext(42).generator('emitter'))
+        em_again = sampler.sample(generator=RNGContext(42).generator('emitter'))
+
+        assert em == em_again
+        assert len(em) >= 1
+        assert (em.frame_ix >= 0).all() and (em.frame_ix <= 99).all()
@@ -1,10 +1,17 @@
+import time
+
 import pytest
+import tifffile
 import torch
 
 import decode.generic.emitter as emitter
 import decode.simulation.background as background
+import decode.simulation.camera as camera
+import decode.simulation.emitter_generator as emitter_generator
 import decode.simulation.psf_kernel as psf_kernel
 import decode.simulation.simulator as can  # test candidate
+import decode.simulation.structure_prior as structure_prior
+from decode.simulation.rng import RNGContext
 
 
 class TestSimulator:
@@ -67,6 +74,227 @@ class TestSimulator:
 
         """Assert"""
         assert len(frames) == n, "Wrong number of frames."
+
+    @pytest.mark.parametrize("chunk_size", [1, 4, 7, 100])
+    def test_forward_chunks(self, chunk_size):
+        psf = psf_kernel.GaussianPSF((-0.5, 31.5), (-0.5, 31.5), (-750., 750.), (32, 32), sigma_0=1.0)
+        sim = can.Simulation(psf=psf, background=background.UniformBackground(10.))
+
+        em = emitter.RandomEmitterSet(100, extent=32)
+        em.frame_ix = torch.randint(-3, 20, size=(100,))
+
+        """Emitter that blinks across the chunk boundaries"""
+        em.frame_ix[:8] = torch.arange(8)
+        em.frame_ix[8:10] = torch.tensor([-3, 19])
+        em.id[:8] = 1000
+
+        frames_ref, bg_ref = sim.forward(em)
+        chunks = list(sim.forward_chunks(em, chunk_size))
+
+        assert len(chunks) == -(-23 // chunk_size)
+        assert torch.allclose(torch.cat([c[1] for c in chunks]), frames_ref)
+        assert torch.allclose(torch.cat([c[2] for c in chunks]), bg_ref)
+
+        em_chunks = emitter.EmitterSet.cat([c[0] for c in chunks])
+        assert len(em_chunks) == len(em)
+        assert (em_chunks.id == 1000).sum() == 8
+        for i, (em_chunk, frames, _) in enumerate(chunks):
+            assert (em_chunk.frame_ix >= -3 + i * chunk_size).all()
+            assert (em_chunk.frame_ix < -3 + i * chunk_size + len(frames)).all()
+
+        with pytest.raises(ValueError):
+            next(sim.forward_chunks(em, 0))
+
+    def test_write(self, tmpdir):
+        psf = psf_kernel.GaussianPSF((-0.5, 31.5), (-0.5, 31.5), (-750., 750.), (32, 32), sigma_0=1.0)
+        em = emitter.RandomEmitterSet(100, extent=32)
+        em.frame_ix = torch.randint(0, 20, size=(100,))
+
+        sim = can.Simulation(psf=psf, em_sampler=lambda: em, background=background.UniformBackground(10.),
+                             frame_range=(0, 19))
+        em_out = sim.write(tmpdir / 'acquisition', chunk_size=6, px_size=(100., 100.))
+        frames_ref, bg_ref = sim.forward(em)
+
+        frames = torch.from_numpy(tifffile.imread(str(tmpdir / 'acquisition' / 'frames.tif')))
+        bg = torch.from_numpy(tifffile.imread(str(tmpdir / 'acquisition' / 'bg.tif')))
+
+        assert torch.allclose(frames, frames_ref)
+        assert torch.allclose(bg, bg_ref)
+        assert len(em_out) == len(em)
+        assert (em_out.px_size == torch.tensor([100., 100.])).all()
+        assert emitter.EmitterSet.load(tmpdir / 'acquisition' / 'emitters.h5') == em_out
+
+        """Incomplete meta data is rejected before anything is simulated"""
+        with pytest.raises(ValueError):
+            sim.write(tmpdir / 'no_px_size', chunk_size=6)
+        assert not (tmpdir / 'no_px_size').exists()
+
+    def test_psf_cache(self):
+        psf = psf_kernel.GaussianPSF((-0.5, 31.5), (-0.5, 31.5), (-750., 750.), (32, 32), sigma_0=1.0)
+        sim = can.Simulation(psf=psf, background=background.UniformBackground(10.), psf_cache_size=4)
+        sim_ref = can.Simulation(psf=psf, background=background.UniformBackground(10.))
+
+        em = emitter.RandomEmitterSet(50, extent=32)
+        em.frame_ix = torch.randint(10, size=(50,))
+
+        """Overlapping frame windows render each frame once"""
+        for ix in range(1, 9):
+            frames, _ = sim.forward(em, ix - 1, ix + 1)
+            frames_ref, _ = sim_ref.forward(em, ix - 1, ix + 1)
+            assert torch.allclose(frames, frames_ref)
+
+        assert sim.psf_cache_stats.misses == 10
+        assert sim.psf_cache_stats.hits == 8 * 3 - 10
+
+        """LRU bound"""
+        assert len(sim._psf_cache) == 4
+        sim.forward(em, 0, 0)
+        assert sim.psf_cache_stats.misses == 11
+
+        """Cached frames are not altered by background and noise"""
+        frames_again, _ = sim.forward(em, 0, 0)
+        assert torch.allclose(frames_again, sim_ref.forward(em, 0, 0)[0])
+
+        """Modified or new emitters invalidate the cache"""
+        em.xyz[:, 0] += 1.
+        frames, _ = sim.forward(em, 0, 0)
+        assert torch.allclose(frames, sim_ref.forward(em, 0, 0)[0])
+
+        em_new = emitter.RandomEmitterSet(50, extent=32)
+        frames, _ = sim.forward(em_new, 0, 0)
+        assert torch.allclose(frames, sim_ref.forward(em_new, 0, 0)[0])
+        assert len(sim._psf_cache) == 1
+        assert sim._psf_cache[0]._base is None  # cached frames do not hold the storage of the rendered batch
+
+        """In-place modification of the px size invalidates the cache"""
+        em_nm = emitter.RandomEmitterSet(50, extent=3200, xy_unit='nm', px_size=(100., 100.))
+        sim.forward(em_nm, 0, 0)
+        em_nm.px_size[0] = 50.
+        frames, _ = sim.forward(em_nm, 0, 0)
+        assert torch.allclose(frames, sim_ref.forward(em_nm, 0, 0)[0])
+
+    def test_psf_cache_auto_range(self):
+        psf = psf_kernel.GaussianPSF((-0.5, 31.5), (-0.5, 31.5), (-750., 750.), (32, 32), sigma_0=1.0)
+        sim = can.Simulation(psf=psf, psf_cache_size=10)
+
+        em = emitter.RandomEmitterSet(2)
+        em.frame_ix = torch.tensor([-2, 3]).long()
+
+        assert len(sim.forward(em)[0]) == 6
+        assert len(sim.forward(em, ix_low=0)[0]) == 4
+        assert len(sim.forward(emitter.EmptyEmitterSet(xy_unit='px'), 0, 2)[0]) == 3
+
+        with pytest.raises(ValueError):
+            can.Simulation(psf=psf, psf_cache_size=0)
+
+    def test_rng(self):
+        """With an RNG context the output does not depend on chunking and subsequent samples differ"""
+        psf = psf_kernel.GaussianPSF((-0.5, 31.5), (-0.5, 31.5), (-750., 750.), (32, 32), sigma_0=1.0)
+        prior = structure_prior.RandomStructure((-0.5, 31.5), (-0.5, 31.5), (-750., 750.))
+        sampler = emitter_generator.EmitterSamplerBlinking(structure=prior, intensity_mu_sig=(1000., 100.),
+                                                            lifetime=2., frame_range=(0, 29), xy_unit='px',
+                                                            px_size=(100., 100.), em_avg=10.)
+
+        def simulation():
+            return can.Simulation(psf=psf, em_sampler=sampler, background=background.UniformBackground((5., 50.)),
+                                  noise=camera.PerfectCamera(), frame_range=(0, 29), rng=RNGContext(42))
+
+        em, frames, bg = simulation().sample()
+        chunks = list(simulation().sample_chunks(7))
+
+        assert em.sort_by_frame() == emitter.EmitterSet.cat([c[0] for c in chunks])
+        assert (frames == torch.cat([c[1] for c in chunks])).all()
+        assert (bg == torch.cat([c[2] for c in chunks])).all()
+
+        sim = simulation()
+        _, frames_first, _ = sim.sample()
+        _, frames_second, _ = sim.sample()
+        assert (frames_first == frames).all()
+        assert not (frames_second == frames).all()
+
+        """Forwarding with the same context is deterministic"""
+        assert (sim.forward(em)[0] == sim.forward(em)[0]).all()
+
+
+class TestParallelSimulation:
+
+    @pytest.fixture()
+    def sim(self):
+        psf = psf_kernel.GaussianPSF((-0.5, 31.5), (-0.5, 31.5), (-750., 750.), (32, 32), sigma_0=1.0)
+        return can.Simulation(psf=psf, background=background.UniformBackground(10.), noise=camera.PerfectCamera())
+
+    @pytest.fixture()
+    def em(self):
+        em = emitter.RandomEmitterSet(200, extent=32)
+        em.frame_ix = torch.randint(0, 40, size=(200,))
+        return em
+
+    def test_forward(self, sim, em):
+        """Without noise the output is the one of the serial simulation"""
+        sim.noise = None
+        frames_ref, bg_ref = sim.forward(em, 0, 39)
+
+        with can.ParallelSimulation(sim, n_workers=2, shard_size=7) as sim_par:
+            frames, bg = sim_par.forward(em, 0, 39)
+
+        assert frames.is_shared()
+        assert torch.allclose(frames, frames_ref)
+        assert torch.allclose(bg, bg_ref)
+
+    def test_reproducible(self, sim, em):
+        """Shards have their own RNG streams, i.e. the output does not depend on the number of workers"""
+        with can.ParallelSimulation(sim, n_workers=1, shard_size=8, seed=42) as sim_par:
+            frames_1, _ = sim_par.forward(em)
+            frames_1_next, _ = sim_par.forward(em)
+
+        with can.ParallelSimulation(sim, n_workers=3, shard_size=8, seed=42) as sim_par:
+            frames_3, _ = sim_par.forward(em)
+
+        assert (frames_1 == frames_3).all()
+        assert not (frames_1 == frames_1_next).all(), "Subsequent calls must draw new noise."
+        assert not (frames_1[:8] == frames_1[8:16]).all(), "Shards must not share the RNG stream."
+
+    def test_rng(self, sim, em):
+        """With an RNG context of the simulation the output is bit-identical to the serial one"""
+        sim.rng = RNGContext(42)
+        frames_ref, bg_ref = sim.forward(em, 0, 39)
+
+        with can.ParallelSimulation(sim, n_workers=3, shard_size=6) as sim_par:
+            frames, bg = sim_par.forward(em, 0, 39)
+
+        assert (frames == frames_ref).all()
+        assert (bg == bg_ref).all()
+
+    def test_invalid(self, sim):
+        with pytest.raises(ValueError):
+            can.ParallelSimulation(sim, n_workers=0)
+
+        with pytest.raises(ValueError):
+            can.ParallelSimulation(sim, n_workers=2, shard_size=0)
+
+    @pytest.mark.benchmark
+    @pytest.mark.parametrize("n_workers", [1, 2, 4, 8])
+    def test_speedup_benchmark(self, n_workers):
+        psf = psf_kernel.GaussianPSF((-0.5, 63.5), (-0.5, 63.5), (-750., 750.), (64, 64), sigma_0=1.5, roi_radius=8)
+        sim = can.Simulation(psf=psf, background=background.UniformBackground(10.), noise=camera.PerfectCamera())
+
+        em = emitter.RandomEmitterSet(100000, extent=64)
+        em.frame_ix = torch.randint(0, 1000, size=(100000,))
+
+        t0 = time.perf_counter()
+        sim.forward(em, 0, 999)
+        t_serial = time.perf_counter() - t0
+
+        with can.ParallelSimulation(sim, n_workers=n_workers, shard_size=50) as sim_par:
+            sim_par.forward(em, 0, 1)  # start up the workers
+
+            t0 = time.perf_counter()
+            sim_par.forward(em, 0, 999)
+            t_par = time.perf_counter() - t0
+
+        print(f"Simulation of 1000 frames (100k emitters): serial {t_serial:.2f}s, {n_workers} workers {t_par:.2f}s "
+              f"(speedup {t_serial / t_par:.1f}x).")
+
     #
     # def test_fill_bg_to_em(self, sim):
     #     """Setup"""
@@ -124,6 +124,14 @@ class TestUnifiedEmbeddingTarget(TestTargetGenerator):
         assert (off_x.unique() == expct_vals).all()
         assert (off_y.unique() == expct_vals).all()
 
+    def test_forward_bin_ix(self, targ, random_emitter):
+        """Precomputed bin index gives the same target"""
+        random_emitter.xyz[:10, :2] += 70.  # some outside of the frame
+
+        bin_ix = targ.bin_index(random_emitter)
+
+        assert (targ.forward(random_emitter, bin_ix=bin_ix) == targ.forward(random_emitter)).all()
+
     def test_forward_handcrafted(self, targ):
         """Test a couple of handcrafted cases"""
 
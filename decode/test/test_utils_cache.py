@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+import torch
+
+from decode.utils import cache
+
+
+def test_hash_key():
+    assert cache.hash_key('a', (1, 2), torch.arange(3)) == cache.hash_key('a', (1, 2), torch.arange(3))
+    assert cache.hash_key('a', (1, 2), torch.arange(3)) != cache.hash_key('a', (1, 2), torch.arange(4))
+    assert cache.hash_key('a', 'b') != cache.hash_key('ab')
+
+
+def test_hash_file(tmpdir):
+    f = tmpdir / 'a.bin'
+    f.write_binary(b'abc' * 1000)
+    h = cache.hash_file(f, chunk_size=7)
+
+    assert h == cache.hash_file(f)
+
+    f.write_binary(b'abd' * 1000)
+    assert h != cache.hash_file(f)
+
+
+class TestDiskCache:
+
+    @pytest.fixture()
+    def disk_cache(self, tmpdir):
+        return cache.DiskCache(tmpdir / 'cache')
+
+    def test_get_or_compute(self, disk_cache):
+        assert 'a' not in disk_cache
+        with pytest.raises(KeyError):
+            disk_cache.load('a')
+
+        out = disk_cache.get_or_compute('a', lambda: {'x': torch.arange(5)})
+        assert 'a' in disk_cache
+
+        out_cached = disk_cache.get_or_compute('a', lambda: pytest.fail("Should not be recomputed."))
+        assert (out['x'] == out_cached['x']).all()
+
+    def test_array(self, disk_cache):
+        arr = np.random.rand(10, 20).astype('float32')
+        disk_cache.save_array('a', arr)
+
+        arr_mmap = disk_cache.load_array('a')
+        assert isinstance(arr_mmap, np.memmap)
+        assert (arr_mmap == arr).all()
+
+        # copy-on-write, i.e. the cache entry is not modified
+        arr_mmap[0, 0] = -1.
+        assert disk_cache.load_array('a')[0, 0] == arr[0, 0]
+
+        with pytest.raises(KeyError):
+            disk_cache.load_array('b')
+
+    def test_failed_write(self, disk_cache):
+        def fail(f):
+            raise RuntimeError
+
+        with pytest.raises(RuntimeError):
+            disk_cache._write_atomic(disk_cache.array_file('a'), fail)
+
+        assert not disk_cache.has_array('a')
+        assert len(list(disk_cache.path.iterdir())) == 0
@@ -59,3 +59,88 @@ def test_streamer(last_index, tmpdir):
         stream(emitter.RandomEmitterSet(20), 0, 100)
 
     mock_save.assert_called_once()
+
+
+class TestLazyH5EmitterSet:
+
+    @pytest.fixture(params=[True, False], ids=['sorted', 'unsorted'])
+    def em_file(self, request, tmpdir):
+        em = emitter.RandomEmitterSet(1000, xy_unit='px', px_size=(100., 200.))
+        em.frame_ix = torch.randint_like(em.frame_ix, 50)
+        em.id = torch.arange(1000)
+        em.xyz_sig = torch.rand(1000, 3)
+        if request.param:
+            em = em.sort_by_frame()
+
+        path = tmpdir / 'em.h5'
+        em.save(path)
+
+        return em, path
+
+    def test_load(self, em_file):
+        em, path = em_file
+        em_lazy = emitter.EmitterSet.load(path, lazy=True)
+
+        assert isinstance(em_lazy, emitter_io.LazyH5EmitterSet)
+        assert len(em_lazy) == len(em)
+        assert em_lazy.xy_unit == 'px'
+        assert em_lazy.load() == em
+
+        with pytest.raises(ValueError):
+            emitter.EmitterSet.load(path.dirpath() / 'em.pt', lazy=True)
+
+    @pytest.mark.parametrize("ix", [5, -1, slice(10, 20), slice(None, None, 3), [7, 3, 3, 900],
+                                    torch.arange(1000) % 7 == 0])
+    def test_getitem(self, em_file, ix):
+        em, path = em_file
+        em_lazy = emitter_io.LazyH5EmitterSet(path)
+
+        ix_em = torch.tensor(ix) if isinstance(ix, list) else ix
+        assert em_lazy[ix] == em[ix_em]
+
+    def test_frame_access(self, em_file):
+        em, path = em_file
+
+        with emitter_io.LazyH5EmitterSet(path, chunk_size=300) as em_lazy:
+            assert em_lazy.get_subset_frame(5, 10) == em.get_subset_frame(5, 10)
+            assert em_lazy.get_subset_frame(5, 10, -5) == em.get_subset_frame(5, 10, -5)
+
+            for e_lazy, e in zip(em_lazy.split_in_frames(0, 49), em.split_in_frames(0, 49)):
+                assert e_lazy[e_lazy.id.argsort()] == e[e.id.argsort()]  # order within a frame is not defined
+
+            for e_lazy, e in zip(em_lazy.chunks(3), em.chunks(3)):
+                assert e_lazy == e
+
+            assert [len(e) for e in em_lazy.iter_chunks()] == [250] * 4  # ceil(1000 / 300) = 4 chunks
+
+    def test_iter_frame_chunks(self, em_file):
+        em, path = em_file
+        em_lazy = emitter_io.LazyH5EmitterSet(path)
+
+        em_chunks = list(em_lazy.iter_frame_chunks(20))
+        assert len(em_chunks) == 3
+        assert sum(len(e) for e in em_chunks) == len(em)
+        assert em_chunks[1] == em.get_subset_frame(20, 39)
+
+    @pytest.mark.parametrize("frac", [0., 0.1, 0.5, 0.9])
+    @pytest.mark.parametrize("return_low", [True, False])
+    def test_filter_by_sigma(self, em_file, frac, return_low):
+        em, path = em_file
+        em_lazy = emitter_io.LazyH5EmitterSet(path, chunk_size=300)
+
+        out = em_lazy.filter_by_sigma(frac, return_low=return_low)
+        out_ref = em.filter_by_sigma(frac, return_low=return_low)
+
+        # the lazy quantile is approximate, i.e. may differ by the emitters within one bin of the sketch
+        assert abs(len(out) - len(out_ref)) <= 2
+        assert len(set(out.id.tolist()) ^ set(out_ref.id.tolist())) <= 2
+
+    def test_pickle(self, em_file):
+        import pickle
+
+        em, path = em_file
+        em_lazy = emitter_io.LazyH5EmitterSet(path)
+        _ = em_lazy[:10]  # opens file handle
+
+        em_unpickled = pickle.loads(pickle.dumps(em_lazy))
+        assert em_unpickled[:10] == em[:10]
@@ -49,6 +49,17 @@ def test_tiff_tensor(tmpdir):
     assert (data[ix[0].item(), ...,  ix_sub] == data_tensor[ix[0].item(), ..., ix_sub]).all()
 
 
+def test_tiff_stack_writer(tmpdir):
+    fname = tmpdir / 'stack.tif'
+    data = torch.rand(25, 32, 16)
+
+    with frames_io.TiffStackWriter(fname) as writer:
+        for chunk in torch.split(data, 7):
+            writer.write(chunk)
+
+    assert (frames_io.TiffTensor(fname)[:] == data).all()
+
+
 @pytest.mark.skip(reason="Online Tiff Writer not stable.")
 @pytest.mark.skipif(int(tifffile.__version__[:4]) <= 2020, reason="Online writer does not work with this version.")
 def test_tiff_tensor_online(tmpdir):
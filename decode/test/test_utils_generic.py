@@ -77,6 +77,7 @@ class TestSplitSliceable:
         out_ref = self.split_sliceable(x, ix, ix_low, ix_high)
 
         """Asserts"""
+        assert len(out) == len(out_ref)
         for o, e in zip(out, exp[ix_low:(ix_high + 1)]):  # pick apropriate elements from the expected results
             assert (o == e).all()
 
@@ -137,6 +137,16 @@ class TestSimpleWeight(AbstractWeightGeneratorVerification):
             assert test_utils.tens_almeq(mask[:, 5], 1 / tar_frames[:, 5] ** 2.3, 1e-5), "BG CRLB estimate"
 
 
+    def test_forward_bin_ix(self, waiter):
+        """Precomputed bin index gives the same weight"""
+        em = emitter.RandomEmitterSet(20, extent=6, xy_unit='px')
+        em.frame_ix = torch.randint(-1, 3, size=(20,))
+        tar_frames = torch.rand((1, 6, 5, 5))
+
+        bin_ix = waiter.target_equivalent.bin_index(em)
+
+        assert (waiter.forward(em, tar_frames, 0, 0, bin_ix=bin_ix) == waiter.forward(em, tar_frames, 0, 0)).all()
+
 @pytest.mark.skip("Not ready implementation.")
 class TestFourFoldWeight(AbstractWeightGeneratorVerification):
 
@@ -1,4 +1,5 @@
 from . import bookkeeping
+from . import cache
 from . import calibration_io
 from . import checkpoint
 from . import emitter_io
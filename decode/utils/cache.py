@@ -0,0 +1,134 @@
+import hashlib
+import os
+import pathlib
+import tempfile
+from typing import Any, Callable, Union
+
+import numpy as np
+import torch
+
+
+def hash_file(path: Union[str, pathlib.Path], chunk_size: int = 2 ** 20) -> str:
+    """
+    SHA256 hex digest of the content of a file, e.g. of a calibration file.
+
+    Args:
+        path: path to file
+        chunk_size: bytes read at once
+
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def hash_key(*parts) -> str:
+    """
+    SHA256 hex digest of a couple of parameters. Tensors are hashed by their content, everything else by its repr.
+
+    Example:
+        >>> hash_key(hash_file('calib.mat'), (-0.5, 63.5), 4)
+
+    """
+    h = hashlib.sha256()
+    for p in parts:
+        if isinstance(p, torch.Tensor):
+            h.update(p.detach().cpu().contiguous().numpy().tobytes())
+        else:
+            h.update(repr(p).encode())
+        h.update(b'|')
+
+    return h.hexdigest()
+
+
+def load_array_mmap(path: Union[str, pathlib.Path]) -> np.ndarray:
+    """Memory maps a .npy file copy-on-write."""
+    return np.load(path, mmap_mode='c')
+
+
+class DiskCache:
+    """
+    Simple key-value cache of torch serialisable objects on disk, one file per key. Numpy arrays can alternatively be
+    stored as .npy files which are memory mapped upon loading, i.e. processes attach to the file instead of reading it.
+    Writes are atomic (write to a temporary file and rename), so concurrent processes never read partially written
+    entries.
+
+    Example:
+        >>> cache = DiskCache('~/.cache/decode')
+        >>> table = cache.get_or_compute(hash_key(...), compute_table)
+
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        """
+
+        Args:
+            path: cache directory, created if it does not exist
+
+        """
+        self.path = pathlib.Path(path).expanduser()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, key: str) -> pathlib.Path:
+        return self.path / f"{key}.pt"
+
+    def array_file(self, key: str) -> pathlib.Path:
+        """Path of the .npy file of an array entry"""
+        return self.path / f"{key}.npy"
+
+    def __contains__(self, key: str) -> bool:
+        return self._file(key).is_file()
+
+    def _write_atomic(self, file: pathlib.Path, write: Callable):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, file)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def load(self, key: str) -> Any:
+        if key not in self:
+            raise KeyError(f"Key {key} not in cache {self.path}.")
+
+        return torch.load(self._file(key))
+
+    def save(self, key: str, obj: Any):
+        self._write_atomic(self._file(key), lambda f: torch.save(obj, f))
+
+    def has_array(self, key: str) -> bool:
+        return self.array_file(key).is_file()
+
+    def save_array(self, key: str, arr: np.ndarray):
+        self._write_atomic(self.array_file(key), lambda f: np.save(f, np.ascontiguousarray(arr)))
+
+    def load_array(self, key: str) -> np.ndarray:
+        """
+        Memory maps an array entry copy-on-write, i.e. pages are shared between processes until they are modified.
+        """
+        if not self.has_array(key):
+            raise KeyError(f"Array {key} not in cache {self.path}.")
+
+        return load_array_mmap(self.array_file(key))
+
+    def get_or_compute(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Returns the cached object or computes and caches it.
+
+        Args:
+            key: key of the object
+            fn: computes the object if not cached
+
+        """
+        if key in self:
+            return self.load(key)
+
+        obj = fn()
+        self.save(key, obj)
+
+        return obj
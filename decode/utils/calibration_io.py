@@ -2,24 +2,54 @@ import scipy.io as sio
 import torch
 
 import decode.simulation.psf_kernel as psf_kernel
+import decode.utils.cache
 
 
 class SMAPSplineCoefficient:
     """Wrapper class as an interface for MATLAB Spline calibration data."""
-    def __init__(self, calib_file):
+    def __init__(self, calib_file, cache_dir=None):
         """
         Loads a calibration file from SMAP and the relevant meta information
         Args:
             file:
+            cache_dir: (optional) directory of a content addressed cache (keyed by the hash of the calibration file) of
+                the parsed coefficients. If cached, the coefficients are memory mapped instead of parsing the file again
         """
         self.calib_file = calib_file
-        self.calib_mat = sio.loadmat(self.calib_file, struct_as_record=False, squeeze_me=True)['SXY']
+        self.cache_dir = cache_dir
+        self.coeff_key = None  # hash of the calibration file, identifies the coefficients in a cache
 
-        self.coeff = torch.from_numpy(self.calib_mat.cspline.coeff)
-        self.ref0 = (self.calib_mat.cspline.x0 - 1, self.calib_mat.cspline.x0 - 1, self.calib_mat.cspline.z0)
-        self.dz = self.calib_mat.cspline.dz
+        if cache_dir is not None:
+            cache = decode.utils.cache.DiskCache(cache_dir)
+            key = decode.utils.cache.hash_key('smap_spline', decode.utils.cache.hash_file(calib_file))
+            self.coeff_key = key
+
+            if key not in cache or not cache.has_array(key):
+                coeff, meta = self._parse(calib_file)
+                cache.save_array(key, coeff)
+                cache.save(key, meta)
+
+            coeff, meta = cache.load_array(key), cache.load(key)
+        else:
+            coeff, meta = self._parse(calib_file)
+
+        self.coeff = torch.from_numpy(coeff)
+        self.ref0 = meta['ref0']
+        self.dz = meta['dz']
         self.spline_roi_shape = self.coeff.shape[:3]
 
+    @staticmethod
+    def _parse(calib_file) -> tuple:
+        """Parses coefficients and meta information from the .mat file"""
+        calib_mat = sio.loadmat(calib_file, struct_as_record=False, squeeze_me=True)['SXY']
+
+        meta = {
+            'ref0': (calib_mat.cspline.x0 - 1, calib_mat.cspline.x0 - 1, calib_mat.cspline.z0),
+            'dz': calib_mat.cspline.dz
+        }
+
+        return calib_mat.cspline.coeff, meta
+
     def init_spline(self, xextent, yextent, img_shape, device='cuda:0' if torch.cuda.is_available() else 'cpu', **kwargs):
         """
         Initializes the CubicSpline function
@@ -33,6 +63,10 @@ class SMAPSplineCoefficient:
         Returns:
 
         """
+        kwargs.setdefault('cache_dir', self.cache_dir)
+        if kwargs['cache_dir'] is not None and self.coeff_key is None:
+            self.coeff_key = decode.utils.cache.hash_key('smap_spline', decode.utils.cache.hash_file(self.calib_file))
+        kwargs.setdefault('coeff_key', self.coeff_key)
         psf = psf_kernel.CubicSplinePSF(xextent=xextent, yextent=yextent, img_shape=img_shape, ref0=self.ref0,
                                         coeff=self.coeff, vx_size=(1., 1., self.dz), device=device, **kwargs)
 
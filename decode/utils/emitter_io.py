@@ -1,4 +1,5 @@
 import json
+import math
 import pathlib
 
 import copy
@@ -9,7 +10,8 @@ import pandas as pd
 import torch
 from typing import Union, Tuple, Optional
 
-from decode.generic.emitter import EmitterSet
+import decode.generic.utils
+from decode.generic.emitter import EmitterSet, EmitterSetBuilder
 from decode.utils import bookkeeping
 
 minimal_mapping = {k: k for k in ('x', 'y', 'z', 'phot', 'frame_ix')}
@@ -38,8 +40,8 @@ def get_decode_meta() -> dict:
 def save_h5(path: Union[str, pathlib.Path], data: dict, metadata: dict) -> None:
 
     def create_volatile_dataset(group, name, tensor):
-        """Empty DS if all nan"""
-        if torch.isnan(tensor).all():
+        """Empty DS if absent (None) or all nan"""
+        if tensor is None or torch.isnan(tensor).all():
             group.create_dataset(name, data=h5py.Empty("f"))
         else:
             group.create_dataset(name, data=tensor.numpy())
@@ -97,6 +99,260 @@ def load_h5(path) -> Tuple[dict, dict, dict]:
     return data, meta_data, meta_decode
 
 
+class LazyH5EmitterSet:
+    """
+    Out-of-core set of emitters backed by a hdf5 file as written by EmitterSet.save. Only the frame indices are held in
+    memory, the remaining data is read from the file upon request (get_subset_frame, split_in_frames, chunks,
+    iter_frame_chunks, indexing). These return ordinary in-memory EmitterSets.
+
+    Reading frame ranges is fastest if the emitters in the file are sorted by frame index (e.g. save
+    em.sort_by_frame()), because then they are contiguous in the file.
+
+    Example:
+        >>> em = EmitterSet.load('emitters.h5', lazy=True)
+        >>> em_sub = em.get_subset_frame(1000, 1999)  # reads only the emitters on these frames
+
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path], chunk_size: int = 1000000):
+        """
+
+        Args:
+            path: path to hdf5 file
+            chunk_size: number of emitters that are read at once when iterating over the whole set (e.g. rendering)
+
+        """
+        self.path = pathlib.Path(path)
+        self.chunk_size = chunk_size
+
+        with h5py.File(self.path, 'r') as h5:
+            self.frame_ix = torch.from_numpy(h5['data']['frame_ix'][:])
+            self.meta = dict(h5['meta'].attrs)
+
+        self.frame_sorted = bool((self.frame_ix[1:] >= self.frame_ix[:-1]).all())
+        self._h5 = None  # opened upon first read
+
+    def __len__(self) -> int:
+        return len(self.frame_ix)
+
+    def __str__(self) -> str:
+        return f"LazyH5EmitterSet of {len(self)} emitters on file {self.path}"
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_h5'] = None  # file handles can not be pickled
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def xy_unit(self):
+        return self.meta.get('xy_unit')
+
+    @property
+    def px_size(self):
+        return self.meta.get('px_size')
+
+    def close(self):
+        """Closes the file handle (it is reopened upon the next read)."""
+        if self._h5 is not None:
+            self._h5.close()
+            self._h5 = None
+
+    def _read(self, ix: Union[slice, np.ndarray]) -> EmitterSet:
+        """Read emitters by a slice (step 1) or by strictly increasing indices."""
+        if self._h5 is None:
+            self._h5 = h5py.File(self.path, 'r')
+
+        if not isinstance(ix, slice) and len(ix) == 0:
+            ix = slice(0, 0)
+
+        data = {k: torch.from_numpy(v[ix]) if v.shape is not None else None for k, v in self._h5['data'].items()}
+        em = EmitterSet(**data, **self.meta, sanity_check=False)
+
+        if self.frame_sorted and isinstance(ix, slice):
+            em._mark_frame_sorted()
+
+        return em
+
+    def __getitem__(self, item) -> EmitterSet:
+        """
+        Reads emitters by integer, slice or index / boolean tensor.
+
+        Returns:
+            EmitterSet
+
+        """
+        if isinstance(item, int):
+            if not -len(self) <= item < len(self):
+                raise IndexError(f"Index {item} out of bounds of EmitterSet of size {len(self)}")
+
+            item = item if item >= 0 else item + len(self)
+            item = slice(item, item + 1)
+
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step == 1:
+                return self._read(slice(start, max(start, stop)))
+
+            item = torch.arange(start, stop, step)
+
+        ix = torch.as_tensor(item)
+        if ix.dtype == torch.bool:
+            ix = ix.nonzero(as_tuple=False).squeeze(1)
+        ix = torch.where(ix < 0, ix + len(self), ix)
+
+        # hdf5 requires strictly increasing indices, restore order and duplicates afterwards
+        ix_unique, ix_inverse = torch.unique(ix, sorted=True, return_inverse=True)
+
+        return self._read(ix_unique.numpy())[ix_inverse]
+
+    def load(self) -> EmitterSet:
+        """Reads all emitters into memory."""
+        return self[:]
+
+    def get_subset_frame(self, frame_start: int, frame_end: int, frame_ix_shift: int = None) -> EmitterSet:
+        """
+        Reads the emitters in the frame range (see EmitterSet.get_subset_frame).
+
+        Args:
+            frame_start: lower frame index limit
+            frame_end: upper frame index limit (including)
+            frame_ix_shift: shift of the frame index of the returned set
+
+        """
+        if self.frame_sorted:
+            ix_start, ix_end = torch.searchsorted(
+                self.frame_ix, torch.tensor([frame_start, frame_end + 1], dtype=self.frame_ix.dtype)).tolist()
+            em = self[ix_start:ix_end]
+        else:
+            em = self[(self.frame_ix >= frame_start) * (self.frame_ix <= frame_end)]
+
+        return em.get_subset_frame(frame_start, frame_end, frame_ix_shift)
+
+    def split_in_frames(self, ix_low: int = 0, ix_up: int = None, view: bool = False) -> list:
+        """
+        Reads the frame range at once and splits it into one EmitterSet per frame (see EmitterSet.split_in_frames).
+        """
+        ix_up = ix_up if ix_up is not None else int(self.frame_ix.max())
+
+        return self.get_subset_frame(ix_low, ix_up).split_in_frames(ix_low, ix_up, view=view)
+
+    def chunks(self, chunks: int):
+        """
+        Splits the set into (almost) equal chunks like EmitterSet.chunks, but reads them one after the other.
+
+        Args:
+            chunks: number of splits
+
+        Returns:
+            generator of EmitterSets
+
+        """
+        for ix in self._chunk_slices(chunks):
+            yield self[ix]
+
+    def _chunk_slices(self, chunks: Optional[int] = None) -> list:
+        """Slices of (almost) equal chunks, by default of at most chunk_size emitters"""
+        n = len(self)
+        k = chunks if chunks is not None else max(1, math.ceil(n / self.chunk_size))
+
+        return [slice(i * (n // k) + min(i, n % k), (i + 1) * (n // k) + min(i + 1, n % k)) for i in range(k)]
+
+    def _read_column(self, attr: str, ix: slice) -> torch.Tensor:
+        """Reads a single attribute by slice without constructing an EmitterSet."""
+        if self._h5 is None:
+            self._h5 = h5py.File(self.path, 'r')
+
+        return torch.from_numpy(self._h5['data'][attr][ix])
+
+    def iter_chunks(self):
+        """Iterates over the whole set in chunks of at most chunk_size emitters."""
+        return self.chunks(None)
+
+    def filter_by_sigma(self, fraction: float, dim: Optional[int] = None, return_low=True,
+                        n_bins: int = 2 ** 16) -> EmitterSet:
+        """
+        Chunk-wise equivalent of EmitterSet.filter_by_sigma. Only one chunk is in memory at a time, the quantile of
+        the total variance is approximated by a histogram sketch (decode.generic.utils.HistogramQuantileSketch). The
+        file is read in three passes: variance of the error estimates, quantile, filtering.
+
+        Args:
+            fraction: relative fraction of emitters remaining after filtering. Ranges from 0. to 1.
+            dim: 2 or 3 for taking into account z. If None, it will be autodetermined.
+            return_low:
+                if True return the fraction of emitter with the lowest sigma values.
+                if False return the (1-fraction) with the highest sigma values.
+            n_bins: number of bins of the quantile sketch
+
+        Returns:
+            EmitterSet (in memory)
+
+        """
+        if fraction == 1. or len(self) == 0:
+            return self.load()
+
+        """Pass 1: variance (sum and sum of squares) and maximum of the error estimates, dimensionality"""
+        n, sig_sum, sig_sq_sum, sig_sq_max = 0, torch.zeros(3).double(), torch.zeros(3).double(), \
+            torch.zeros(3).double()
+        is_3d = dim is not None and dim != 2
+        for ix in self._chunk_slices():
+            xyz_sig = self._read_column('xyz_sig', ix).double()
+            n += len(xyz_sig)
+            sig_sum += xyz_sig.sum(0)
+            sig_sq_sum += (xyz_sig ** 2).sum(0)
+            sig_sq_max = torch.max(sig_sq_max, (xyz_sig ** 2).max(0).values)
+
+            if dim is None and not is_3d:
+                is_3d = bool((self._read_column('xyz', ix)[:, 2] != 0).any())
+
+        sig_var = (sig_sq_sum - sig_sum ** 2 / n) / (n - 1)
+
+        """Pass 2: approximate quantile of the total variance, which is bounded by the maxima of pass 1"""
+        high = EmitterSet._sigma_tot_var(sig_sq_max.sqrt().unsqueeze(0), sig_var, is_3d).item()
+        sketch = decode.generic.utils.HistogramQuantileSketch(0., high if high > 0 else 1., n_bins=n_bins)
+        for ix in self._chunk_slices():
+            xyz_sig = self._read_column('xyz_sig', ix).double()
+            sketch.update(EmitterSet._sigma_tot_var(xyz_sig, sig_var, is_3d))
+
+        max_s = sketch.quantile(fraction)
+
+        """Pass 3: filter"""
+        builder = EmitterSetBuilder()
+        for ix in self._chunk_slices():
+            em = self._read(ix)
+            tot_var = EmitterSet._sigma_tot_var(em.xyz_sig.double(), sig_var, is_3d)
+            builder.append(em[tot_var < max_s] if return_low else em[tot_var > max_s])
+
+        return builder.build()
+
+    def iter_frame_chunks(self, frames_per_chunk: int, frame_low: int = None, frame_high: int = None):
+        """
+        Iterates over consecutive frame ranges and reads the emitters of one range at a time.
+
+        Args:
+            frames_per_chunk: number of frames per chunk
+            frame_low: first frame (defaults to the minimum frame index)
+            frame_high: last frame, including (defaults to the maximum frame index)
+
+        Returns:
+            generator of EmitterSets
+
+        """
+        if len(self) == 0:
+            return
+
+        frame_low = frame_low if frame_low is not None else int(self.frame_ix.min())
+        frame_high = frame_high if frame_high is not None else int(self.frame_ix.max())
+
+        for f in range(frame_low, frame_high + 1, frames_per_chunk):
+            yield self.get_subset_frame(f, min(f + frames_per_chunk - 1, frame_high))
+
+
 def save_torch(path: Union[str, pathlib.Path], data: dict, metadata: dict):
     torch.save(
         {
@@ -157,9 +413,17 @@ def save_csv(path: (str, pathlib.Path), data: dict, metadata: dict) -> None:
 
         return data_one_dim
 
+    def fill_absent(data: dict) -> dict:
+        """Absent (None) optional attributes are written as nan columns"""
+        n = len(data['xyz'])
+        for k, v in data.items():
+            if v is None:
+                data[k] = np.full((n, 3) if k.startswith('xyz') else (n,), np.nan, dtype=np.float32)
+        return data
+
     """Change torch to numpy and convert 2D elements to 1D"""
     data = copy.deepcopy(data)
-    data = change_to_one_dim(convert_dict_torch_numpy(data))
+    data = change_to_one_dim(fill_absent(convert_dict_torch_numpy(data)))
 
     decode_meta_json = json.dumps(get_decode_meta())
     emitter_meta_json = json.dumps(convert_dict_torch_list(metadata))
@@ -51,6 +51,42 @@ def load_tif(path: (str, pathlib.Path), multifile=True) -> torch.Tensor:
     return frames
 
 
+class TiffStackWriter:
+    def __init__(self, path: Union[str, pathlib.Path]):
+        """
+        Writes frames chunk wise into one (big) tiff stack, i.e. without holding the whole stack in memory. The pages
+        are written contiguously, such that the file reads as one stack (e.g. by load_tif or TiffTensor).
+
+        Example:
+            >>> with TiffStackWriter('frames.tif') as writer:
+            >>>     for frames in chunks:
+            >>>         writer.write(frames)
+
+        Args:
+            path: tiff file
+        """
+        self._writer = tifffile.TiffWriter(str(path), bigtiff=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, frames: torch.Tensor):
+        """
+        Appends frames to the stack.
+
+        Args:
+            frames: frames of size N x H x W
+        """
+        for frame in frames.detach().cpu().numpy():
+            self._writer.write(frame, contiguous=True)
+
+    def close(self):
+        self._writer.close()
+
+
 class TiffTensor:
     def __init__(self, file, dtype='float32'):
         """
@@ -50,6 +50,7 @@ setup(
             'decode.train = decode.neuralfitter.train.train:main',
             'decode.fit = decode.neuralfitter.inference.infer:main',
             'decode.infer = decode.neuralfitter.inference.infer:main',
+            'decode.benchmark_psf = decode.simulation.psf_benchmark:main',
         ],
     },
     zip_safe=False,